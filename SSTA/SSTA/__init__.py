@@ -4,4 +4,15 @@ __author__ = """Tom Kennes"""
 __email__ = 'tomkennes@skyworkz.nl'
 __version__ = '0.1.0'
 
-from SSTA.main import *
+# The simulation entry points live in SSTA.main, which imports NumPy. They are resolved on first use,
+# so importing the package (e.g. for the command line) stays cheap. These are the names the package
+# used to get from `from SSTA.main import *`. logger and logging stay reachable as attributes, without being exported.
+__all__ = ['iteration', 'update_workloads', 'update_nodes', 'allocation_diff', 'phase', 'profiled']
+_main_names = __all__ + ['logger', 'logging']
+
+
+def __getattr__(name):
+    if name in _main_names:
+        from SSTA import main
+        return getattr(main, name)
+    raise AttributeError("module 'SSTA' has no attribute '{}'".format(name))
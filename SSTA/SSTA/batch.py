@@ -0,0 +1,188 @@
+"""Batched Monte Carlo engine.
+
+Advances many independent simulations in lockstep. Each simulation is reduced to its aggregate
+configuration (free nodes per AZ, scheduled and pending workloads per type and AZ), which is all
+that `iteration()` depends on: a busy node always runs exactly one workload, and the random
+heuristics only ever pick uniformly among interchangeable entities. The K configurations are
+stacked into arrays and every random decision of a step is drawn for all simulations at once.
+"""
+import numpy as np
+
+
+def as_time(value):
+    """ Python number for a simulated time, an int when it is whole like the times of State with integer durations """
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class BatchState():
+    def __init__(self, AZs, workload_types, free, scheduled, pending, time, priority,
+                 add_node_time, remove_node_time, evict_workload_time):
+        self.AZs = AZs
+        self.WORKLOAD_TYPES = workload_types
+        self.free = free
+        self.scheduled = scheduled
+        self.pending = pending
+        self.time = time
+        self.priority = priority
+        # Durations may be fractional (State.set_times), times are kept as floats
+        self.ADD_NODE_TIME = float(add_node_time)
+        self.REMOVE_NODE_TIME = float(remove_node_time)
+        self.EVICT_WORKLOAD_TIME = float(evict_workload_time)
+
+    @classmethod
+    def from_state(cls, state, n_simulations, TARGET_WORKLOAD_NODE_ALLOCATION=()):
+        """ Stack n_simulations copies of the aggregate configuration of a State.
+
+        Args:
+            state (State): Initial state, every simulation starts from it
+            n_simulations (int): Number of simulations in the batch
+            TARGET_WORKLOAD_NODE_ALLOCATION (list, optional): Target allocation, so its types and AZs get a cell
+        """
+        AZs = list(state.AZs)
+        workload_types = state.get_workload_types()
+        for allocation in TARGET_WORKLOAD_NODE_ALLOCATION:
+            if allocation['AZ'] not in AZs:
+                AZs += [allocation['AZ']]
+            if allocation['type'] not in workload_types:
+                workload_types += [allocation['type']]
+        AZ_columns = {AZ: column for column, AZ in enumerate(AZs)}
+        type_rows = {workload_type: row for row, workload_type in enumerate(workload_types)}
+
+        free = np.zeros(len(AZs), dtype=np.int64)
+        scheduled = np.zeros((len(workload_types), len(AZs)), dtype=np.int64)
+        pending = np.zeros((len(workload_types), len(AZs)), dtype=np.int64)
+        first_pending_id = {}
+        for node in state.get_free_nodes():
+            free[AZ_columns[node.AZ]] += 1
+        for workload in state.workloads:
+            cell = (type_rows[workload.type], AZ_columns[workload.AZ])
+            if workload.node is not None:
+                scheduled[cell] += 1
+            else:
+                pending[cell] += 1
+            first_pending_id[cell] = min(first_pending_id.get(cell, workload.id), workload.id)
+
+        # Pending workloads are allocated in id order, ids are handed out per (type, AZ) block
+        priority = [
+            sorted(range(len(workload_types)), key=lambda row: first_pending_id.get((row, column), float('inf')))
+            for column in range(len(AZs))
+        ]
+        return cls(
+            AZs, workload_types,
+            np.tile(free, (n_simulations, 1)),
+            np.tile(scheduled, (n_simulations, 1, 1)),
+            np.tile(pending, (n_simulations, 1, 1)),
+            np.full(n_simulations, state.time, dtype=np.float64),
+            priority, state.ADD_NODE_TIME, state.REMOVE_NODE_TIME, state.EVICT_WORKLOAD_TIME
+        )
+
+    def target_matrix(self, TARGET_WORKLOAD_NODE_ALLOCATION):
+        """ Target counts per (type, AZ) and the order in which iteration() visits the differences """
+        target = np.zeros(self.scheduled.shape[1:], dtype=np.int64)
+        order = []
+        for allocation in TARGET_WORKLOAD_NODE_ALLOCATION:
+            cell = (self.WORKLOAD_TYPES.index(allocation['type']), self.AZs.index(allocation['AZ']))
+            target[cell] = allocation['count']
+            order += [cell]
+        order += [cell for cell in np.ndindex(*target.shape) if cell not in order]
+        return target, order
+
+    def count_nodes(self):
+        return self.free.sum(axis=1) + self.scheduled.sum(axis=(1, 2))
+
+    def has_free_nodes(self):
+        return self.free.sum(axis=1) > 0
+
+    def has_non_allocated_workloads(self):
+        return self.pending.sum(axis=(1, 2)) > 0
+
+    def update_workload_node_allocation(self, mask):
+        for column in range(len(self.AZs)):
+            for row in self.priority[column]:
+                allocated = np.where(mask, np.minimum(self.pending[:, row, column], self.free[:, column]), 0)
+                self.pending[:, row, column] -= allocated
+                self.scheduled[:, row, column] += allocated
+                self.free[:, column] -= allocated
+
+
+def batch_update_workloads(batch, target, order, active, rng):
+    differences = target[None, :, :] - batch.scheduled
+    workloads_done = ~(differences != 0).any(axis=(1, 2))
+
+    for row, column in order:
+        diff = differences[:, row, column]
+
+        evict = active & (diff < 0)
+        if evict.any():
+            # The eviction heuristic picks distinct workloads, which ones does not matter in aggregate
+            evicted = np.where(evict, -diff, 0)
+            batch.scheduled[:, row, column] -= evicted
+            batch.free[:, column] += evicted
+            batch.time[evict] += batch.EVICT_WORKLOAD_TIME
+
+        allocate = active & (diff > 0) & batch.has_free_nodes()
+        if allocate.any():
+            batch.update_workload_node_allocation(allocate)
+    return workloads_done
+
+
+def batch_update_nodes(batch, active, MAX_NUMBER_OF_NODES, rng):
+    n_simulations, n_AZs = batch.free.shape
+
+    add = active & batch.has_non_allocated_workloads() & (batch.count_nodes() < MAX_NUMBER_OF_NODES)
+    AZ_draws = rng.integers(0, n_AZs, size=n_simulations)
+    batch.free[add, AZ_draws[add]] += 1
+    batch.time[add] += batch.ADD_NODE_TIME
+
+    remove = active & batch.has_free_nodes()
+    # A uniformly drawn node is either free in some AZ or runs a workload of some (type, AZ)
+    weights = np.concatenate([batch.free, batch.scheduled.reshape(n_simulations, -1)], axis=1)
+    cumulative = weights.cumsum(axis=1)
+    node_draws = np.floor(rng.random(n_simulations) * cumulative[:, -1]).astype(np.int64)
+    picked = (cumulative <= node_draws[:, None]).sum(axis=1)
+
+    remove_free = remove & (picked < n_AZs)
+    batch.free[remove_free, picked[remove_free]] -= 1
+    remove_busy = remove & (picked >= n_AZs)
+    rows, columns = np.divmod(picked[remove_busy] - n_AZs, n_AZs)
+    batch.scheduled[remove_busy, rows, columns] -= 1
+    batch.pending[remove_busy, rows, columns] += 1
+    batch.time[remove] += batch.EVICT_WORKLOAD_TIME + batch.REMOVE_NODE_TIME
+
+    return ~(add | remove)
+
+
+def batch_iteration(batch, target, order, MAX_NUMBER_OF_NODES, active, rng):
+    """ Apply one iteration() step to every active simulation of the batch, returns the done mask """
+    workloads_done = batch_update_workloads(batch, target, order, active, rng)
+    nodes_done = batch_update_nodes(batch, active, MAX_NUMBER_OF_NODES, rng)
+    return workloads_done & nodes_done
+
+
+def run_batch(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_simulations, n_iterations, rng=None):
+    """ Run n_simulations independent simulations from initial_state in lockstep.
+
+    Returns:
+        list: One result dict per simulation, with the same keys as the stability.py results
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    batch = BatchState.from_state(initial_state, n_simulations, TARGET_WORKLOAD_NODE_ALLOCATION)
+    target, order = batch.target_matrix(TARGET_WORKLOAD_NODE_ALLOCATION)
+
+    steps = np.full(n_simulations, -1, dtype=np.int64)
+    active = np.ones(n_simulations, dtype=bool)
+    for i in range(n_iterations):
+        done = batch_iteration(batch, target, order, MAX_NUMBER_OF_NODES, active, rng)
+        finished = active & done
+        steps[finished] = i
+        active &= ~finished
+        if not active.any():
+            break
+
+    nodes = batch.count_nodes()
+    return [
+        {'iteration': j, 'Steps': int(steps[j]) if steps[j] >= 0 else None, 'nodes': int(nodes[j]), 'time': as_time(batch.time[j])}
+        for j in range(n_simulations)
+    ]
@@ -0,0 +1,159 @@
+"""Command line interface: the `ssta` console script.
+
+    ssta simulate scenario.json --output results.csv
+    ssta simulate scenario.json --tolerance 0.5          # run until the mean steps are known to +/- 0.5
+    ssta sweep sweep.json --output sweep.csv
+    ssta report results.csv --plot steps.png
+
+A scenario file is a JSON object with the settings of a scenario, see SSTA.sweep. A sweep file holds
+either a list of 'scenarios', or a 'base' scenario and the 'axes' to vary, as in SSTA.sweep.grid.
+
+The simulation modules are imported by the subcommands that need them, and pandas and matplotlib only
+by report, so the commands start fast and so do the worker processes.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+
+RESULT_COLUMNS = ['iteration', 'Steps', 'nodes', 'time', 'verdict']
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_csv(path, rows, columns=None):
+    # Pass the rows through while writing them, columns defaults to the keys of the first row
+    with open(path, 'w', newline='') as f:
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=columns or list(row), extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+            yield row
+
+
+def simulate(args):
+    from SSTA import tracing
+    from SSTA.simulation import iter_simulations
+    from SSTA.streaming import CampaignStatistics, run_until_precise
+    from SSTA.sweep import DEFAULTS, initial_state
+
+    tracing.configure(args.tracing, events=args.events)
+    scenario = dict(DEFAULTS, **_load(args.scenario))
+    state = initial_state(scenario, args.seed)
+    options = dict(n_iterations=scenario['n_iterations'], cycle_limit=scenario['cycle_limit'], workers=args.workers, seed=args.seed)
+
+    # Rows are written in the order of the simulations, whatever the number of workers
+    output = open(args.output, 'w', newline='') if args.output else None
+    try:
+        write = None
+        if output is not None:
+            writer = csv.DictWriter(output, fieldnames=RESULT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            write = writer.writerows
+
+        if args.tolerance is not None:
+            statistics = run_until_precise(
+                state, scenario['TARGET_WORKLOAD_NODE_ALLOCATION'], metric=args.metric, tolerance=args.tolerance,
+                batch_size=scenario['n_sims'], max_sims=args.max_sims, on_batch=write, **options
+            )
+        else:
+            statistics = CampaignStatistics()
+            results = sorted(
+                iter_simulations(state, scenario['TARGET_WORKLOAD_NODE_ALLOCATION'], scenario['n_sims'], **options),
+                key=lambda result: result['iteration']
+            )
+            if write is not None:
+                write(results)
+            for result in results:
+                statistics.add(result)
+    finally:
+        if output is not None:
+            output.close()
+    tracing.shutdown()
+    json.dump(statistics.summary(), sys.stdout, indent=2, default=str)
+    print()
+
+
+def sweep(args):
+    from SSTA.sweep import grid, iter_sweep
+
+    config = _load(args.sweep)
+    scenarios = config['scenarios'] if 'scenarios' in config else grid(config['base'], **config.get('axes', {}))
+    rows = iter_sweep(scenarios, seed=args.seed, cache=args.cache, workers=args.workers, recompute=args.recompute)
+    if args.output:
+        rows = _write_csv(args.output, rows)
+    for row in rows:
+        print(json.dumps(row, default=str))
+
+
+def report(args):
+    import pandas as pd
+
+    df = pd.read_csv(args.results)
+    converged = df['Steps'].notna()
+    print('simulations: {}, converged: {:.1%}'.format(len(df), converged.mean()))
+    print(df[['Steps', 'nodes', 'time']].describe().to_string())
+    if 'verdict' in df:
+        print(df['verdict'].value_counts().to_string())
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        steps = df.loc[converged, 'Steps']
+        bins = int(steps.max()) + 1 if len(steps) else 1
+        plt.hist(steps, bins=bins, range=(0, bins))
+        plt.xlabel('Steps to stability')
+        plt.ylabel('Simulations')
+        plt.savefig(args.plot)
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog='ssta', description='Self-stability simulations of the AWS autoscaler and the Kubernetes scheduler')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('simulate', help='Run the simulations of a scenario')
+    command.add_argument('scenario', help='Scenario JSON file')
+    command.add_argument('--output', help='CSV file receiving one row per simulation')
+    command.add_argument('--seed', type=int, default=None)
+    command.add_argument('--workers', type=int, default=os.cpu_count())
+    command.add_argument('--tolerance', type=float, default=None,
+                         help='Run batches of n_sims simulations until the 95%% confidence interval of the mean of --metric is this narrow')
+    command.add_argument('--metric', default='Steps', choices=['Steps', 'time', 'nodes', 'non_convergence'])
+    command.add_argument('--max-sims', type=int, default=100000)
+    command.add_argument('--tracing', default='off', choices=['off', 'summary', 'full'])
+    command.add_argument('--events', help='JSON Lines file receiving the trace events')
+    command.set_defaults(function=simulate)
+
+    command = commands.add_parser('sweep', help='Run the scenarios of a sweep that are not cached yet')
+    command.add_argument('sweep', help='Sweep JSON file')
+    command.add_argument('--output', help='CSV file receiving one row per scenario')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--cache', default='.ssta-cache')
+    command.add_argument('--workers', type=int, default=os.cpu_count())
+    command.add_argument('--recompute', action='store_true', help='Ignore cached results')
+    command.set_defaults(function=sweep)
+
+    command = commands.add_parser('report', help='Summarize the results of simulate')
+    command.add_argument('results', help='CSV file written by simulate --output')
+    command.add_argument('--plot', help='Image file receiving the histogram of the steps to stability')
+    command.set_defaults(function=report)
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
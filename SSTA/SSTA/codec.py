@@ -0,0 +1,168 @@
+"""Binary state codec.
+
+A state is written as a fixed header, a small JSON table of the names (AZs, workload types, node and
+workload states, policy) and one packed little-endian array per node and workload attribute, each
+aligned to 8 bytes:
+
+    header                      HEADER, see HEADER_FIELDS
+    names                       UTF-8 JSON, padded to 8 bytes
+    nodes                       id, AZ, state                   (n_nodes values each)
+    workloads                   id, type, AZ, state, node       (n_workloads values each)
+
+Names are stored once and referred to by their index, in 1 byte, or 2 when a state has more than
+256 names of a kind. Ids take 4 bytes, or 8 when a state has ids that do not fit. decode() returns
+NumPy views of the arrays without copying them, so a state written with write() can be inspected
+from a memory map (see read()) without building any Node or Workload.
+
+Example:
+    write('state.ssta', state.to_bytes())
+    with read('state.ssta') as buffer:
+        state = State.from_bytes(buffer)
+        header, names, nodes, workloads = decode(buffer)
+    # The map stays open as long as the arrays of decode() are referenced
+    print(np.bincount(nodes['AZ']))
+"""
+import json
+import mmap
+import struct
+
+import numpy as np
+
+
+MAGIC = b'SSTA'
+SCHEMA_VERSION = 2
+
+HEADER_FIELDS = [
+    'magic', 'version', 'id_bytes', 'code_bytes', 'time', 'iteration', 'MAX_NUMBER_OF_NODES', 'MAX_WORKLOAD_ID',
+    'ADD_NODE_TIME', 'REMOVE_NODE_TIME', 'EVICT_WORKLOAD_TIME', 'SCHEDULE_WORKLOAD_TIME',
+    'n_nodes', 'n_workloads', 'names_size'
+]
+HEADER = struct.Struct('<4sHBBd3q4d3Q')
+# Times are stored as doubles, the rest as integers
+TIME_FIELDS = ['time', 'ADD_NODE_TIME', 'REMOVE_NODE_TIME', 'EVICT_WORKLOAD_TIME', 'SCHEDULE_WORKLOAD_TIME']
+
+# Header values that may be None are stored as this
+MISSING = -1
+# Node of a workload that is not allocated
+NO_NODE = -1
+
+# Ids and node references are stored with the id width of the state, names as codes of its code width
+NODE_COLUMNS = [('id', 'id'), ('AZ', 'code'), ('state', 'code')]
+WORKLOAD_COLUMNS = [('id', 'id'), ('type', 'code'), ('AZ', 'code'), ('state', 'code'), ('node', 'id')]
+
+
+def _padding(size):
+    return -size % 8
+
+
+def _columns(columns, id_bytes, code_bytes):
+    dtypes = {'id': np.dtype('<i{}'.format(id_bytes)), 'code': np.dtype('<u{}'.format(code_bytes))}
+    return [(name, dtypes[kind]) for name, kind in columns]
+
+
+def id_bytes(*ids):
+    """ Narrowest id width, 4 or 8 bytes, that holds all the given ids """
+    largest = max((int(np.max(values, initial=0)) for values in ids), default=0)
+    return 4 if largest < 2**31 else 8
+
+
+def encode(header, names, nodes, workloads):
+    """ Pack a state into bytes.
+
+    Args:
+        header (dict): The fields of HEADER_FIELDS but magic, version, the widths, the counts and
+            names_size. TIME_FIELDS are numbers, the others integers or None, stored as MISSING
+        names (dict): JSON-serializable names the codes of the arrays refer to, lists of names
+            determine the code width
+        nodes (dict): Sequence of integers per column of NODE_COLUMNS
+        workloads (dict): Sequence of integers per column of WORKLOAD_COLUMNS
+
+    Returns:
+        bytes: The encoded state
+    """
+    nodes = {name: np.fromiter(values, np.int64, len(values)) for name, values in nodes.items()}
+    workloads = {name: np.fromiter(values, np.int64, len(values)) for name, values in workloads.items()}
+    width = id_bytes(nodes['id'], workloads['id'], workloads['node'])
+    code_bytes = 1 if all(len(value) <= 256 for value in names.values() if isinstance(value, list)) else 2
+    names = json.dumps(names, separators=(',', ':')).encode('utf-8')
+    values = dict(
+        header, magic=MAGIC, version=SCHEMA_VERSION, id_bytes=width, code_bytes=code_bytes,
+        n_nodes=len(nodes['id']), n_workloads=len(workloads['id']), names_size=len(names)
+    )
+    values = [MISSING if values[field] is None else values[field] for field in HEADER_FIELDS]
+
+    parts = [HEADER.pack(*values), names, b'\0' * _padding(len(names))]
+    for arrays, columns in ((nodes, NODE_COLUMNS), (workloads, WORKLOAD_COLUMNS)):
+        for name, dtype in _columns(columns, width, code_bytes):
+            data = arrays[name].astype(dtype).tobytes()
+            parts += [data, b'\0' * _padding(len(data))]
+    return b''.join(parts)
+
+
+def decode(buffer):
+    """ Unpack a state encoded by encode().
+
+    Args:
+        buffer (bytes, memoryview, mmap): The encoded state
+
+    Returns:
+        tuple: (header, names, nodes, workloads) as given to encode(), the arrays are read-only views on buffer
+
+    Raises:
+        ValueError: buffer does not hold a state of this schema version
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError("Buffer of {} bytes is too small for a state header".format(len(buffer)))
+    header = dict(zip(HEADER_FIELDS, HEADER.unpack_from(buffer)))
+    if header['magic'] != MAGIC:
+        raise ValueError("Not an encoded state: magic {!r}".format(header['magic']))
+    if header['version'] != SCHEMA_VERSION:
+        raise ValueError("Unsupported state schema version {}, expected {}".format(header['version'], SCHEMA_VERSION))
+
+    offset = HEADER.size
+    names = json.loads(bytes(buffer[offset:offset + header['names_size']]).decode('utf-8'))
+    offset += header['names_size'] + _padding(header['names_size'])
+
+    tables = []
+    for count, columns in ((header['n_nodes'], NODE_COLUMNS), (header['n_workloads'], WORKLOAD_COLUMNS)):
+        arrays = {}
+        for name, dtype in _columns(columns, header['id_bytes'], header['code_bytes']):
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+            offset += count * dtype.itemsize + _padding(count * dtype.itemsize)
+        tables += [arrays]
+    for field in ('iteration', 'MAX_NUMBER_OF_NODES', 'MAX_WORKLOAD_ID'):
+        if header[field] == MISSING:
+            header[field] = None
+    for field in TIME_FIELDS:
+        # Whole times come back as the integers they were written as
+        if header[field].is_integer():
+            header[field] = int(header[field])
+    return header, names, tables[0], tables[1]
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class StateMap(mmap.mmap):
+    """ Read-only memory map of an encoded state file that may be closed while arrays of decode() still use it.
+
+    A plain mmap refuses to close (BufferError) while views on it exist. Closing a StateMap, or leaving its
+    with block, unmaps the file right away when no view is left, otherwise when the last view is released.
+    """
+    def close(self):
+        try:
+            super().close()
+        except BufferError:
+            # The views keep a reference to the map, it is unmapped once they are garbage collected
+            pass
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read(path):
+    """ Memory-map an encoded state file read-only, the map can be passed to decode() or State.from_bytes() """
+    with open(path, 'rb') as f:
+        return StateMap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,107 @@
+"""Paired comparison of configurations with common random numbers.
+
+Every variant runs simulation j from the j-th child of the same master seed, so the heuristics of the
+variants draw the same random numbers (common random numbers) and the noise of the random decisions
+largely cancels out of the per-simulation differences. With `antithetic`, every seed additionally
+drives a simulation from its antithetic stream (see RandomStream) and a replication is the mean of
+the pair, which cancels part of the remaining noise of each variant.
+
+A variant is a dict of the settings it changes, on top of the initial state and target of the comparison:
+
+    {'times': {'add_node_time': 300}, 'target': [...], 'MAX_NUMBER_OF_NODES': 18, 'policy': 'least-utilized'}
+
+Example:
+    compare(initial_state, target, {'baseline': {}, 'fast nodes': {'times': {'add_node_time': 300}}}, n_sims=200, seed=1)
+"""
+import math
+
+import numpy as np
+
+from SSTA.simulation import iter_simulations
+from SSTA.streaming import RunningStats, Z_SCORES
+
+
+def _variant_results(initial_state, target, variant, n_sims, seed, antithetic, **simulation_options):
+    state = initial_state.copy()
+    state.set_times(**variant.get('times', {}))
+    state.set_policy(variant.get('policy', state.policy))
+    options = dict(simulation_options, MAX_NUMBER_OF_NODES=variant.get('MAX_NUMBER_OF_NODES', state.MAX_NUMBER_OF_NODES))
+    results = {result['iteration']: result for result in iter_simulations(state, variant.get('target', target), n_sims, seed=seed, **options)}
+    if antithetic:
+        mirrored = iter_simulations(state, variant.get('target', target), n_sims, seed=seed, antithetic=True, **options)
+        return [(results[result['iteration']], result) for result in mirrored]
+    return [(result,) for result in results.values()]
+
+
+def _replication(results, metric):
+    # Mean of the metric over a replication, None if it is missing for any of its simulations
+    values = [result[metric] for result in results]
+    if any(value is None for value in values):
+        return None
+    return sum(values) / len(values)
+
+
+def compare(initial_state, target, variants, n_sims, metric='time', seed=None, antithetic=False, confidence=0.95, workers=None, **simulation_options):
+    """ Run every variant on common random numbers and compare each one to the first.
+
+    Args:
+        initial_state (State): State every simulation starts from
+        target (list): Target allocation of workloads per type and AZ, unless a variant overrides it
+        variants (dict): Name to variant settings, see the module docstring, the first one is the baseline
+        n_sims (int): Number of seeds, each variant runs n_sims simulations (2 * n_sims if antithetic)
+        metric (str, optional): 'time', 'nodes' or 'Steps', replications in which a simulation did not
+            converge are left out of the 'Steps' statistics. Defaults to 'time'.
+        seed (int, optional): Master seed shared by all variants. Defaults to None, fresh entropy.
+        antithetic (bool, optional): Pair every simulation with its antithetic counterpart. Defaults to False.
+        confidence (float, optional): Confidence level, a key of streaming.Z_SCORES. Defaults to 0.95.
+        workers (int, optional): Worker processes. Defaults to None.
+        **simulation_options: n_iterations, cycle_limit, ... see run_simulations
+
+    Returns:
+        dict: 'variants', the mean and half width of the confidence interval of the metric per variant,
+            and 'differences', per variant but the baseline, the statistics of the paired differences with
+            the baseline. 'independent_half_width' is the half width independent runs would give with the
+            same number of simulations, 'variance_reduction' the factor saved by the pairing.
+    """
+    if len(variants) < 2:
+        raise ValueError("At least two variants are needed for a comparison")
+    if seed is None:
+        # The variants must share the seed, so draw it once
+        seed = np.random.SeedSequence().entropy
+    z = Z_SCORES[confidence]
+
+    replications = {}
+    for name, variant in variants.items():
+        results = _variant_results(initial_state, target, variant, n_sims, seed, antithetic, workers=workers, **simulation_options)
+        replications[name] = {pair[0]['iteration']: _replication(pair, metric) for pair in results}
+
+    summary = {'metric': metric, 'seeds': n_sims, 'antithetic': antithetic, 'variants': {}, 'differences': {}}
+    for name, values in replications.items():
+        stats = RunningStats()
+        for value in values.values():
+            if value is not None:
+                stats.add(value)
+        summary['variants'][name] = {'replications': stats.count, 'mean': stats.mean, 'half_width': stats.half_width(confidence)}
+
+    names = list(variants)
+    baseline = replications[names[0]]
+    for name in names[1:]:
+        differences, own, reference = RunningStats(), RunningStats(), RunningStats()
+        for j, value in replications[name].items():
+            if value is None or baseline[j] is None:
+                continue
+            differences.add(value - baseline[j])
+            own.add(value)
+            reference.add(baseline[j])
+        pairs = differences.count
+        independent_variance = own.variance + reference.variance
+        summary['differences'][name] = {
+            'pairs': pairs,
+            'incomplete': n_sims - pairs,
+            'mean': differences.mean,
+            'std': differences.std if pairs > 1 else None,
+            'half_width': differences.half_width(confidence),
+            'independent_half_width': z * math.sqrt(independent_variance / pairs) if pairs > 1 else float('inf'),
+            'variance_reduction': independent_variance / differences.variance if pairs > 1 and differences.variance > 0 else float('inf'),
+        }
+    return summary
@@ -1,3 +1,4 @@
 from .node import *
 from .state import *
 from .workload import *
+from .array_state import *
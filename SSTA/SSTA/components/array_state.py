@@ -0,0 +1,523 @@
+"""
+Struct-of-arrays cluster state. Nodes and workloads are stored as NumPy integer arrays, with
+categorical codes for AZs and workload types, so that the state operations used by `iteration()`
+become vectorized mask operations instead of per-object Python loops.
+
+ArrayState implements the interface of State used by iteration() and the simulation runners,
+including fingerprints and journaled deltas, so it can be passed to run_simulation(s) in place of
+a State (with the random policy only).
+"""
+import copy
+import logging
+import numpy as np
+
+from SSTA.components.node import Node
+from SSTA.components.state import State, _FINGERPRINT_MASK, _fingerprint_key
+from SSTA.components.workload import Workload
+from SSTA.helpers import as_random_stream, total_dict_of_lists
+from SSTA.scheduling import eviction_heuristic, get_policy, node_removal_heuristic, planning_AZ_heuristic
+
+logger = logging.getLogger(__name__)
+
+NODE_STATES = ['free', 'busy']
+WORKLOAD_STATES = ['pending', 'busy']
+FREE, BUSY = 0, 1
+PENDING = 0
+NO_NODE = -1
+
+
+class ArrayState():
+    ADD_NODE_TIME = State.ADD_NODE_TIME
+    REMOVE_NODE_TIME = State.REMOVE_NODE_TIME
+    EVICT_WORKLOAD_TIME = State.EVICT_WORKLOAD_TIME
+    SCHEDULE_WORKLOAD_TIME = State.SCHEDULE_WORKLOAD_TIME
+
+    def __init__(
+        self, iteration=None, start_time=None,
+        AZs=None, INITIAL_NODE_ALLCATION_PER_AZ=None, INITIAL_WORKLOAD_TYPE_PER_AZ=None, MAX_NUMBER_OF_NODES=None, rng=None
+    ):
+        self.iteration = iteration
+        self.rng = as_random_stream(rng)
+        self.policy = get_policy()
+        self.MAX_NUMBER_OF_NODES = MAX_NUMBER_OF_NODES
+        self.time = start_time if start_time else 0
+        self._journal = None
+        self.AZs = list(AZs or [])
+        self.WORKLOAD_TYPES = []
+        self._AZ_codes = {AZ: code for code, AZ in enumerate(self.AZs)}
+        self._type_codes = {}
+        self._clear()
+
+        if INITIAL_NODE_ALLCATION_PER_AZ is None and INITIAL_WORKLOAD_TYPE_PER_AZ is None:
+            return
+        if not self.AZs or not INITIAL_NODE_ALLCATION_PER_AZ or not INITIAL_WORKLOAD_TYPE_PER_AZ or not MAX_NUMBER_OF_NODES:
+            logger.error("AZs, INITIAL_NODE_ALLCATION_PER_AZ, INITIAL_WORKLOAD_TYPE_PER_AZ and MAX_NUMBER_OF_NODES are required")
+            raise Exception("Init failed")
+
+        self.INITIAL_NODE_ALLCATION_PER_AZ = INITIAL_NODE_ALLCATION_PER_AZ
+        self.INITIAL_WORKLOAD_TYPE_PER_AZ = INITIAL_WORKLOAD_TYPE_PER_AZ
+        self.set_initial_state()
+        self.update_workload_node_allocation()
+
+    # Initialization
+    def _clear(self):
+        self.node_id = np.zeros(0, dtype=np.int64)
+        self.node_AZ = np.zeros(0, dtype=np.int64)
+        self.node_state = np.zeros(0, dtype=np.int64)
+
+        self.workload_id = np.zeros(0, dtype=np.int64)
+        self.workload_type = np.zeros(0, dtype=np.int64)
+        self.workload_AZ = np.zeros(0, dtype=np.int64)
+        self.workload_state = np.zeros(0, dtype=np.int64)
+        self.workload_node = np.zeros(0, dtype=np.int64)
+        self.MAX_WORKLOAD_ID = 0
+
+    def set_initial_state(self):
+        if total_dict_of_lists(self.INITIAL_WORKLOAD_TYPE_PER_AZ) > self.MAX_NUMBER_OF_NODES:
+            logger.warning("More Workloads are to be allocated than nodes exist")
+
+        if sum(self.INITIAL_NODE_ALLCATION_PER_AZ) > self.MAX_NUMBER_OF_NODES:
+            logger.error("More nodes are to be allocated than are allowed to exist. Increase MAX_NUMBER_OF_NODES or change your allocation")
+            raise Exception("Init failed")
+
+        self._clear()
+        self.node_AZ = np.repeat(np.arange(len(self.AZs)), self.INITIAL_NODE_ALLCATION_PER_AZ)
+        self.node_id = np.arange(1, len(self.node_AZ) + 1)
+        self.node_state = np.full(len(self.node_AZ), FREE)
+
+        counts = [workload['count'] for workload in self.INITIAL_WORKLOAD_TYPE_PER_AZ]
+        self.workload_type = np.repeat([self._type_code(workload['type']) for workload in self.INITIAL_WORKLOAD_TYPE_PER_AZ], counts).astype(np.int64)
+        self.workload_AZ = np.repeat([self._AZ_code(workload['AZ']) for workload in self.INITIAL_WORKLOAD_TYPE_PER_AZ], counts).astype(np.int64)
+        self.workload_id = np.arange(1, len(self.workload_type) + 1)
+        self.workload_state = np.full(len(self.workload_type), PENDING)
+        self.workload_node = np.full(len(self.workload_type), NO_NODE)
+        self.MAX_WORKLOAD_ID = len(self.workload_id)
+
+    @classmethod
+    def from_state(cls, state):
+        """ Convert an object-based State into an ArrayState """
+        array_state = cls(iteration=state.iteration, start_time=state.time, AZs=state.AZs, MAX_NUMBER_OF_NODES=state.MAX_NUMBER_OF_NODES, rng=state.rng)
+        for workload_type in state.get_workload_types():
+            array_state._type_code(workload_type)
+        nodes, workloads = state.nodes, state.workloads
+
+        array_state.node_id = np.array([node.id for node in nodes], dtype=np.int64)
+        array_state.node_AZ = np.array([array_state._AZ_code(node.AZ) for node in nodes], dtype=np.int64)
+        array_state.node_state = np.array([NODE_STATES.index(node.state) for node in nodes], dtype=np.int64)
+
+        array_state.workload_id = np.array([workload.id for workload in workloads], dtype=np.int64)
+        array_state.workload_type = np.array([array_state._type_code(workload.type) for workload in workloads], dtype=np.int64)
+        array_state.workload_AZ = np.array([array_state._AZ_code(workload.AZ) for workload in workloads], dtype=np.int64)
+        array_state.workload_state = np.array([WORKLOAD_STATES.index(workload.state) for workload in workloads], dtype=np.int64)
+        array_state.workload_node = np.array([NO_NODE if workload.node is None else workload.node for workload in workloads], dtype=np.int64)
+        array_state.MAX_WORKLOAD_ID = getattr(state, 'MAX_WORKLOAD_ID', int(array_state.workload_id.max(initial=0)))
+        array_state.set_times(state.ADD_NODE_TIME, state.REMOVE_NODE_TIME, state.EVICT_WORKLOAD_TIME, state.SCHEDULE_WORKLOAD_TIME)
+        return array_state
+
+    def to_state(self):
+        """ Convert back into an object-based State """
+        state = State(
+            nodes=self.nodes, workloads=self.workloads, iteration=self.iteration, start_time=self.time,
+            AZs=self.AZs, MAX_NUMBER_OF_NODES=self.MAX_NUMBER_OF_NODES, rng=self.rng
+        )
+        state.MAX_WORKLOAD_ID = self.MAX_WORKLOAD_ID
+        state.set_times(self.ADD_NODE_TIME, self.REMOVE_NODE_TIME, self.EVICT_WORKLOAD_TIME, self.SCHEDULE_WORKLOAD_TIME)
+        return state
+
+    def copy(self):
+        state = copy.copy(self)
+        state._journal = None
+        state.rng = copy.deepcopy(self.rng)
+        state.AZs = list(self.AZs)
+        state.WORKLOAD_TYPES = list(self.WORKLOAD_TYPES)
+        state._AZ_codes = dict(self._AZ_codes)
+        state._type_codes = dict(self._type_codes)
+        for name in ['node_id', 'node_AZ', 'node_state', 'workload_id', 'workload_type', 'workload_AZ', 'workload_state', 'workload_node']:
+            setattr(state, name, getattr(self, name).copy())
+        return state
+
+    # Journal
+    def start_journal(self):
+        """ Record every change to the nodes and workloads as the deltas of State, see SSTA.snapshot """
+        self._journal = []
+
+    def pop_journal(self):
+        deltas, self._journal = self._journal, []
+        return deltas
+
+    def stop_journal(self):
+        self._journal = None
+
+    def apply_deltas(self, deltas):
+        """ Replay deltas recorded by the journal of a state that was identical to this one """
+        for delta in deltas:
+            kind = delta[0]
+            if kind == 'node':
+                self.node_state[self._node_index(delta[1])] = NODE_STATES.index(delta[2])
+            elif kind == 'workload':
+                index = self._workload_index(delta[1])
+                self.workload_node[index] = NO_NODE if delta[2] is None else delta[2]
+                self.workload_state[index] = WORKLOAD_STATES.index(delta[3])
+            elif kind == 'add_node':
+                self.node_id = np.append(self.node_id, delta[1])
+                self.node_AZ = np.append(self.node_AZ, self._AZ_code(delta[2]))
+                self.node_state = np.append(self.node_state, NODE_STATES.index(delta[3]))
+            elif kind == 'remove_node':
+                self._keep_nodes(self.node_id != delta[1])
+            elif kind == 'add_workload':
+                self.workload_id = np.append(self.workload_id, delta[1])
+                self.workload_type = np.append(self.workload_type, self._type_code(delta[2]))
+                self.workload_AZ = np.append(self.workload_AZ, self._AZ_code(delta[3]))
+                self.workload_state = np.append(self.workload_state, WORKLOAD_STATES.index(delta[4]))
+                self.workload_node = np.append(self.workload_node, NO_NODE if delta[5] is None else delta[5])
+                self.MAX_WORKLOAD_ID = max(self.MAX_WORKLOAD_ID, delta[1])
+            elif kind == 'remove_workload':
+                self._keep_workloads(self.workload_id != delta[1])
+            else:
+                raise Exception("Unknown delta: {}".format(delta))
+
+    def _node_index(self, node_id):
+        return int(np.flatnonzero(self.node_id == node_id)[0])
+
+    def _workload_index(self, workload_id):
+        return int(np.flatnonzero(self.workload_id == workload_id)[0])
+
+    def _journal_evictions(self, workloads):
+        for index in workloads:
+            self._journal.append(('workload', int(self.workload_id[index]), None, 'pending'))
+
+    def fingerprint(self):
+        """ Hash of the aggregate configuration, equal to State.fingerprint of the same configuration.
+        Computed from the counts per category, in O(nodes + workloads).
+        """
+        n_AZs = len(self.AZs)
+        fingerprint = 0
+        node_counts = np.bincount(self.node_state * n_AZs + self.node_AZ, minlength=len(NODE_STATES) * n_AZs)
+        for cell in np.flatnonzero(node_counts):
+            node_state, AZ = divmod(int(cell), n_AZs)
+            fingerprint += int(node_counts[cell]) * _fingerprint_key('node', NODE_STATES[node_state], self.AZs[AZ])
+        cells = (self.workload_type * n_AZs + self.workload_AZ) * len(WORKLOAD_STATES) + self.workload_state
+        workload_counts = np.bincount(cells, minlength=len(self.WORKLOAD_TYPES) * n_AZs * len(WORKLOAD_STATES))
+        for cell in np.flatnonzero(workload_counts):
+            type_AZ, workload_state = divmod(int(cell), len(WORKLOAD_STATES))
+            workload_type, AZ = divmod(type_AZ, n_AZs)
+            fingerprint += int(workload_counts[cell]) * _fingerprint_key('workload', self.WORKLOAD_TYPES[workload_type], self.AZs[AZ], WORKLOAD_STATES[workload_state])
+        return fingerprint & _FINGERPRINT_MASK
+
+    # Categorical codes
+    def _AZ_code(self, AZ):
+        if AZ not in self._AZ_codes:
+            self._AZ_codes[AZ] = len(self.AZs)
+            self.AZs.append(AZ)
+        return self._AZ_codes[AZ]
+
+    def _type_code(self, workload_type):
+        if workload_type not in self._type_codes:
+            self._type_codes[workload_type] = len(self.WORKLOAD_TYPES)
+            self.WORKLOAD_TYPES.append(workload_type)
+        return self._type_codes[workload_type]
+
+    # Counters
+    def _type_az_counts(self, mask):
+        cells = self.workload_type[mask] * len(self.AZs) + self.workload_AZ[mask]
+        return np.bincount(cells, minlength=len(self.WORKLOAD_TYPES) * len(self.AZs)).reshape(len(self.WORKLOAD_TYPES), len(self.AZs))
+
+    def get_scheduled_type_az_matrix(self):
+        return self._type_az_counts(self.workload_node != NO_NODE)
+
+    def get_workload_type_az_matrix(self):
+        return self._type_az_counts(slice(None))
+
+    def _count(self, matrix, workload_type=None, target_AZ=None):
+        if workload_type is not None and workload_type not in self._type_codes:
+            return 0
+        if target_AZ is not None and target_AZ not in self._AZ_codes:
+            return 0
+        if workload_type is not None:
+            matrix = matrix[self._type_codes[workload_type]]
+        if target_AZ is not None:
+            matrix = matrix[..., self._AZ_codes[target_AZ]]
+        return int(matrix.sum())
+
+    def count_scheduled_workloads_type_az(self, workload_type, target_AZ):
+        return self._count(self.get_scheduled_type_az_matrix(), workload_type, target_AZ)
+
+    def count_scheduled_workloads_type(self, workload_type):
+        return self._count(self.get_scheduled_type_az_matrix(), workload_type=workload_type)
+
+    def count_scheduled_workloads_az(self, target_AZ):
+        return self._count(self.get_scheduled_type_az_matrix(), target_AZ=target_AZ)
+
+    def count_workloads_type_az(self, workload_type, target_AZ):
+        return self._count(self.get_workload_type_az_matrix(), workload_type, target_AZ)
+
+    def count_workloads_type(self, workload_type):
+        return self._count(self.get_workload_type_az_matrix(), workload_type=workload_type)
+
+    def count_workloads_az(self, target_AZ):
+        return self._count(self.get_workload_type_az_matrix(), target_AZ=target_AZ)
+
+    def count_pending_workloads_az(self, target_AZ):
+        return self.count_workloads_az(target_AZ) - self.count_scheduled_workloads_az(target_AZ)
+
+    def count_free_nodes_az(self, target_AZ):
+        if target_AZ not in self._AZ_codes:
+            return 0
+        return int(((self.node_state == FREE) & (self.node_AZ == self._AZ_codes[target_AZ])).sum())
+
+    def count_nodes(self):
+        return len(self.node_id)
+
+    def count_workloads(self):
+        return len(self.workload_id)
+
+    def get_total_nodes(self):
+        return len(self.node_id)
+
+    def get_total_workloads(self):
+        return len(self.workload_id)
+
+    def get_workload_types(self):
+        return list(self.WORKLOAD_TYPES)
+
+    def get_counter_AZs(self):
+        return list(self.AZs)
+
+    def get_scheduled_type_az_allocation(self):
+        counts = self.get_scheduled_type_az_matrix().tolist()
+        return [
+            {'type': workload_type, 'AZ': AZ, 'count': counts[row][column]}
+            for row, workload_type in enumerate(self.WORKLOAD_TYPES)
+            for column, AZ in enumerate(self.AZs)
+        ]
+
+    # Creators
+    def add_time(self, time_addition):
+        self.time += time_addition
+
+    def add_node(self, AZ=None):
+        if type(AZ) != str and AZ:
+            raise TypeError("AZ should be a str")
+        if not AZ:
+            AZ = planning_AZ_heuristic(self.AZs, rng=self.rng.substream('planning'))
+
+        new_id = self.max_node_id() + 1
+        logger.debug("Adding Node with id: %s - AZ: %s - state: %s", new_id, AZ, 'free')
+        self.node_id = np.append(self.node_id, new_id)
+        self.node_AZ = np.append(self.node_AZ, self._AZ_code(AZ))
+        self.node_state = np.append(self.node_state, FREE)
+        if self._journal is not None:
+            self._journal.append(('add_node', new_id, AZ, 'free'))
+        self.add_time(self.ADD_NODE_TIME)
+
+    def add_workload(self, workload_type, AZ=None):
+        if type(AZ) != str and AZ:
+            raise TypeError("AZ should be a str")
+        if type(workload_type) != str:
+            raise TypeError("workload_type should be a str")
+        if not AZ:
+            AZ = planning_AZ_heuristic(self.AZs, rng=self.rng.substream('planning'))
+
+        self.MAX_WORKLOAD_ID += 1
+        logger.debug("Adding Workload with id: %s - type: %s - AZ: %s - state: %s", self.MAX_WORKLOAD_ID, workload_type, AZ, 'pending')
+        self.workload_id = np.append(self.workload_id, self.MAX_WORKLOAD_ID)
+        self.workload_type = np.append(self.workload_type, self._type_code(workload_type))
+        self.workload_AZ = np.append(self.workload_AZ, self._AZ_code(AZ))
+        self.workload_state = np.append(self.workload_state, PENDING)
+        self.workload_node = np.append(self.workload_node, NO_NODE)
+        if self._journal is not None:
+            self._journal.append(('add_workload', self.MAX_WORKLOAD_ID, workload_type, AZ, 'pending', None))
+        self.add_time(self.SCHEDULE_WORKLOAD_TIME)
+
+    # Evictors / Removors
+    def _keep_workloads(self, keep):
+        self.workload_id = self.workload_id[keep]
+        self.workload_type = self.workload_type[keep]
+        self.workload_AZ = self.workload_AZ[keep]
+        self.workload_state = self.workload_state[keep]
+        self.workload_node = self.workload_node[keep]
+
+    def _keep_nodes(self, keep):
+        self.node_id = self.node_id[keep]
+        self.node_AZ = self.node_AZ[keep]
+        self.node_state = self.node_state[keep]
+
+    def evict_workload_on_node(self, node_id):
+        on_node = self.workload_node == node_id
+        logger.debug("Evicted %s Workloads on node_id: %s", int(on_node.sum()), node_id)
+        if self._journal is not None:
+            self._journal_evictions(np.flatnonzero(on_node))
+        self.workload_node[on_node] = NO_NODE
+        self.workload_state[on_node] = PENDING
+        self.add_time(self.EVICT_WORKLOAD_TIME)
+
+    def evict_workload_by_type_and_az(self, workload_type, AZ, number=1):
+        candidates = np.flatnonzero(
+            (self.workload_type == self._type_codes.get(workload_type, -1)) &
+            (self.workload_AZ == self._AZ_codes.get(AZ, -1)) &
+            (self.workload_state == BUSY)
+        )
+        if len(candidates) < number:
+            raise Exception("Too many nodes are required to be evicted. I don't have that many nodes")
+        evicted = np.unique(eviction_heuristic(candidates, number, rng=self.rng.substream('eviction')))
+
+        if self._journal is not None:
+            for index in evicted:
+                self._journal += [
+                    ('node', int(self.workload_node[index]), 'free'), ('workload', int(self.workload_id[index]), None, 'pending'),
+                    ('remove_workload', int(self.workload_id[index]))
+                ]
+        self.node_state[np.isin(self.node_id, self.workload_node[evicted])] = FREE
+        keep = np.ones(len(self.workload_id), dtype=bool)
+        keep[evicted] = False
+        self._keep_workloads(keep)
+        self.add_time(self.EVICT_WORKLOAD_TIME)
+
+    def remove_node(self, number=1):
+        if type(number) != int:
+            raise Exception("number should be int")
+        if self.count_nodes() < number:
+            raise Exception("Too many nodes are required to be removed: I do not have that many")
+
+        removed = np.unique(node_removal_heuristic(np.arange(len(self.node_id)), number, rng=self.rng.substream('removal')))
+        on_removed_nodes = np.isin(self.workload_node, self.node_id[removed])
+        if self._journal is not None:
+            self._journal_evictions(np.flatnonzero(on_removed_nodes))
+            for index in removed:
+                if self.node_state[index] == BUSY:
+                    self._journal.append(('node', int(self.node_id[index]), 'free'))
+                self._journal.append(('remove_node', int(self.node_id[index])))
+        self.workload_node[on_removed_nodes] = NO_NODE
+        self.workload_state[on_removed_nodes] = PENDING
+
+        keep = np.ones(len(self.node_id), dtype=bool)
+        keep[removed] = False
+        self._keep_nodes(keep)
+        self.add_time(self.EVICT_WORKLOAD_TIME * len(removed) + self.REMOVE_NODE_TIME)
+
+    def apply(self, actions):
+        """ Apply a plan of actions in order, see State.apply """
+        changed = True
+        for action in actions:
+            kind = action[0]
+            if kind == 'evict':
+                self.evict_workload_by_type_and_az(workload_type=action[1], AZ=action[2], number=action[3])
+                changed = True
+            elif kind == 'allocate':
+                if changed and self.has_non_allocated_workloads():
+                    self.update_workload_node_allocation()
+                changed = False
+            elif kind == 'add_node':
+                self.add_node(AZ=action[1])
+                changed = True
+            elif kind == 'remove_node':
+                self.remove_node(number=action[1])
+                changed = True
+            else:
+                raise Exception("Unknown action: {}".format(action))
+
+    # Getters
+    @property
+    def nodes(self):
+        return [
+            Node.trusted(int(id), self.AZs[AZ], NODE_STATES[state])
+            for id, AZ, state in zip(self.node_id, self.node_AZ, self.node_state)
+        ]
+
+    @property
+    def workloads(self):
+        return [
+            Workload.trusted(int(id), self.WORKLOAD_TYPES[workload_type], self.AZs[AZ], WORKLOAD_STATES[state], None if node == NO_NODE else int(node))
+            for id, workload_type, AZ, state, node in zip(self.workload_id, self.workload_type, self.workload_AZ, self.workload_state, self.workload_node)
+        ]
+
+    def get_free_nodes(self):
+        return np.flatnonzero(self.node_state == FREE)
+
+    def get_non_allocated_workloads(self):
+        return np.flatnonzero((self.workload_node == NO_NODE) & (self.workload_state == PENDING))
+
+    def get_free_nodes_in_az(self, AZ):
+        if AZ not in self._AZ_codes:
+            return []
+        free = (self.node_state == FREE) & (self.node_AZ == self._AZ_codes[AZ])
+        return [Node.trusted(int(id), AZ, 'free') for id in self.node_id[free]]
+
+    # Printers
+    def __str__(self):
+        return self.print_nodes(return_=True) + '\n\n' + self.print_workloads(return_=True)
+
+    def print_nodes(self, return_=False):
+        str_ = '----- Nodes -----\n' + ''.join(str(node) + '\n' for node in self.nodes)
+        if not return_:
+            print(str_)
+        else:
+            return str_
+
+    def print_workloads(self, return_=False):
+        str_ = '----- Workloads -----\n' + ''.join(str(workload) + '\n' for workload in self.workloads)
+        if not return_:
+            print(str_)
+        else:
+            return str_
+
+    # Property Checkers
+    def has_free_nodes(self):
+        return bool((self.node_state == FREE).any())
+
+    def has_non_allocated_workloads(self):
+        return bool(((self.workload_node == NO_NODE) & (self.workload_state == PENDING)).any())
+
+    def max_node_id(self):
+        return int(self.node_id.max())
+
+    # Setters
+    def set_rng(self, rng):
+        """ Drive the heuristics of this state from rng, a Generator, RandomStream or seed """
+        if rng is self.rng or rng is self.rng.generator:
+            return
+        self.rng = as_random_stream(rng)
+
+    def set_policy(self, policy):
+        """ Only the random policy is implemented on arrays, use State for the others """
+        policy = get_policy(policy)
+        if policy.name != 'random':
+            raise Exception("ArrayState only supports the random policy, got: {}".format(policy.name))
+        self.policy = policy
+
+    def set_times(self, add_node_time=None, remove_node_time=None, evict_workload_time=None, schedule_workload_time=None):
+        if add_node_time:
+            self.ADD_NODE_TIME = add_node_time
+        if remove_node_time:
+            self.REMOVE_NODE_TIME = remove_node_time
+        if evict_workload_time:
+            self.EVICT_WORKLOAD_TIME = evict_workload_time
+        if schedule_workload_time:
+            self.SCHEDULE_WORKLOAD_TIME = schedule_workload_time
+
+    # Updaters
+    def update_workload_node_allocation(self):
+        """ Allocate pending workloads to free nodes in the same AZ. Per AZ, the pending workloads are
+        taken in storage order and matched to a random permutation of the free nodes, which has the
+        same outcome distribution as drawing a random free node for each workload in turn.
+        """
+        pending = np.flatnonzero(self.workload_node == NO_NODE)
+        if len(pending) == 0:
+            return
+        free = np.flatnonzero(self.node_state == FREE)
+
+        for AZ in np.unique(self.workload_AZ[pending]):
+            pending_in_az = pending[self.workload_AZ[pending] == AZ]
+            free_in_az = free[self.node_AZ[free] == AZ]
+            number = min(len(pending_in_az), len(free_in_az))
+            if number == 0:
+                continue
+            targets = self.rng.substream('allocation').permutation(free_in_az)[:number]
+            allocated = pending_in_az[:number]
+
+            self.node_state[targets] = BUSY
+            self.workload_node[allocated] = self.node_id[targets]
+            self.workload_state[allocated] = BUSY
+            if self._journal is not None:
+                for node_id, workload_id in zip(self.node_id[targets].tolist(), self.workload_id[allocated].tolist()):
+                    self._journal += [('node', node_id, 'busy'), ('workload', workload_id, node_id, 'busy')]
@@ -2,6 +2,8 @@
 """
 
 class Node():
+    __slots__ = ('id', 'AZ', 'state', '_owner')
+
     def __init__(self, id, AZ=None, state=None):
         if type(id) != int:
             raise TypeError("id should be int")
@@ -13,12 +15,29 @@ class Node():
         self.id = id
         self.AZ = AZ
         self.state = state
+        self._owner = None
+
+    @classmethod
+    def trusted(cls, id, AZ, state):
+        """ Build a node from values known to be valid, skipping the checks of __init__ """
+        node = object.__new__(cls)
+        node.id = id
+        node.AZ = AZ
+        node.state = state
+        node._owner = None
+        return node
+
+    def _set_state(self, state):
+        old_state = self.state
+        self.state = state
+        if self._owner is not None and old_state != state:
+            self._owner._reindex_node(self, old_state)
 
     def mark_free(self):
-        self.state = 'free'
+        self._set_state('free')
 
     def mark_busy(self):
-        self.state = 'busy'
+        self._set_state('busy')
 
     def __str__(self):
         return 'Node {} - AZ: {} - State: {}'.format(
@@ -1,17 +1,18 @@
+import copy
+import hashlib
+import heapq
 import json
 import logging
+import numpy as np
 
+from SSTA import codec
 from SSTA.components.node import Node
 from SSTA.components.workload import Workload
-from SSTA.helpers import total_dict_of_lists
-from SSTA.scheduling import eviction_heuristic, node_removal_heuristic, planning_heuristic, planning_AZ_heuristic
+from SSTA.helpers import as_random_stream, total_dict_of_lists
+from SSTA.profiling import count, profiled
+from SSTA.scheduling import get_policy, planning_AZ_heuristic
 
-
-logging.basicConfig(
-    filename='simulation.log',
-    format='[%(asctime)s] p%(process)s:%(threadName)-4s - Func: %(funcName)-24s - %(filename)s@%(lineno)-2s - %(levelname)-8s - %(message)s',
-    encoding='utf-8', level=logging.DEBUG
-)
+logger = logging.getLogger(__name__)
 
 
 class State():
@@ -22,31 +23,38 @@ class State():
 
     def __init__(
         self, workloads=None, nodes=None, iteration=None, start_time=None,
-        AZs=None, INITIAL_NODE_ALLCATION_PER_AZ=None, INITIAL_WORKLOAD_TYPE_PER_AZ=None, MAX_NUMBER_OF_NODES=None
+        AZs=None, INITIAL_NODE_ALLCATION_PER_AZ=None, INITIAL_WORKLOAD_TYPE_PER_AZ=None, MAX_NUMBER_OF_NODES=None, rng=None
     ):
         self.iteration = iteration
+        self.rng = as_random_stream(rng)
+        self.policy = get_policy()
         self.MAX_NUMBER_OF_NODES = MAX_NUMBER_OF_NODES
+        self.AZs = AZs
+        self._journal = None
+        self._reset_indexes()
         if start_time:
             self.time = start_time
         else:
             self.time = 0
 
         # Initialize Workloads and Node Allocation
-        if workloads and nodes:
+        if workloads is not None and nodes is not None:
             self.workloads = workloads
             self.nodes = nodes
+            if not AZs:
+                self.AZs = list(dict.fromkeys(node.AZ for node in self.nodes))
         else:
             if not AZs:
-                logging.error("AZs was not supplied to State, neither were workloads or nodes")
+                logger.error("AZs was not supplied to State, neither were workloads or nodes")
                 raise Exception("Init failed")
             elif not INITIAL_NODE_ALLCATION_PER_AZ:
-                logging.error("INITIAL_NODE_ALLCATION_PER_AZ was not supplied to State, neither were workloads or nodes")
+                logger.error("INITIAL_NODE_ALLCATION_PER_AZ was not supplied to State, neither were workloads or nodes")
                 raise Exception("Init failed")
             elif not INITIAL_WORKLOAD_TYPE_PER_AZ:
-                logging.error("INITIAL_WORKLOAD_TYPE_PER_AZ was not supplied to State, neither were workloads or nodes")
+                logger.error("INITIAL_WORKLOAD_TYPE_PER_AZ was not supplied to State, neither were workloads or nodes")
                 raise Exception("Init failed")
             elif not MAX_NUMBER_OF_NODES:
-                logging.error("MAX_NUMBER_OF_NODES was not supplied to State, neither were workloads or nodes")
+                logger.error("MAX_NUMBER_OF_NODES was not supplied to State, neither were workloads or nodes")
                 raise Exception("Init failed")
 
             self.AZs = AZs
@@ -61,78 +69,442 @@ class State():
     # Initialization
     def set_initial_state(self):
         if total_dict_of_lists(self.INITIAL_WORKLOAD_TYPE_PER_AZ) > self.MAX_NUMBER_OF_NODES:
-            logging.warning("More Workloads are to be allocated than nodes exist")
+            logger.warning("More Workloads are to be allocated than nodes exist")
 
         if sum(self.INITIAL_NODE_ALLCATION_PER_AZ) > self.MAX_NUMBER_OF_NODES:
-            logging.error("More nodes are to be allocated than are allowed to exist. Increase MAX_NUMBER_OF_NODES or change your allocation")
+            logger.error("More nodes are to be allocated than are allowed to exist. Increase MAX_NUMBER_OF_NODES or change your allocation")
             raise Exception("Init failed")
 
-        self.nodes = []
-        id = 1
+        self._reset_indexes()
+        for workload in self.INITIAL_WORKLOAD_TYPE_PER_AZ:
+            self._counter_cell(workload['type'], workload['AZ'])
+
+        nodes = []
         for i, AZ in enumerate(self.AZs):
-            for _ in range(self.INITIAL_NODE_ALLCATION_PER_AZ[i]):
-                self.nodes += [Node(id=id, AZ=AZ, state='free')]
-                id += 1
+            nodes += [Node.trusted(len(nodes) + 1 + j, AZ, 'free') for j in range(self.INITIAL_NODE_ALLCATION_PER_AZ[i])]
+        self._add_nodes(nodes)
 
-        self.workloads = []
-        id = 1
+        workloads = []
         for workload in self.INITIAL_WORKLOAD_TYPE_PER_AZ:
-            for _ in range(workload['count']):
-                self.workloads += [Workload(id=id, workload_type=workload['type'], AZ=workload['AZ'], state='pending', node=None)]
-                id += 1
+            workloads += [Workload.trusted(len(workloads) + 1 + j, workload['type'], workload['AZ'], 'pending') for j in range(workload['count'])]
+        self._add_workloads(workloads)
+
+    # Indexes
+    def _reset_indexes(self):
+        self._fingerprint = 0
+        self._nodes_by_id = {}
+        self._workloads_by_id = {}
+        self._workloads_by_node = {}
+        self._nodes_by_state_az = {}
+        self._scheduled_by_type_az = {}
+        self._pending_workloads = {}
+        # Heaps of (key, node id) per order of NODE_ORDERS, built on first use, see first_nodes
+        self._node_heaps = {}
+        # Largest node id, None when it has to be looked up again
+        self._max_node_id = None
+
+        # Counter matrices: one row per workload type, one column per AZ
+        self._type_rows = {}
+        self._AZ_columns = {AZ: column for column, AZ in enumerate(self.AZs or [])}
+        self._workload_counts = np.zeros((0, len(self._AZ_columns)), dtype=np.int64)
+        self._scheduled_counts = np.zeros((0, len(self._AZ_columns)), dtype=np.int64)
+
+    def _counter_cell(self, workload_type, AZ):
+        row = self._type_rows.setdefault(workload_type, len(self._type_rows))
+        column = self._AZ_columns.setdefault(AZ, len(self._AZ_columns))
+        if row >= self._workload_counts.shape[0] or column >= self._workload_counts.shape[1]:
+            padding = ((0, len(self._type_rows) - self._workload_counts.shape[0]), (0, len(self._AZ_columns) - self._workload_counts.shape[1]))
+            self._workload_counts = np.pad(self._workload_counts, padding)
+            self._scheduled_counts = np.pad(self._scheduled_counts, padding)
+        return row, column
+
+    @property
+    def nodes(self):
+        return list(self._nodes_by_id.values())
+
+    @nodes.setter
+    def nodes(self, nodes):
+        for node in list(self._nodes_by_id.values()):
+            self._remove_node(node)
+        for node in nodes:
+            self._add_node(node)
+
+    @property
+    def workloads(self):
+        return list(self._workloads_by_id.values())
+
+    @workloads.setter
+    def workloads(self, workloads):
+        for workload in list(self._workloads_by_id.values()):
+            self._remove_workload(workload)
+        for workload in workloads:
+            self._add_workload(workload)
+
+    def _add_node(self, node):
+        self._nodes_by_id[node.id] = node
+        if self._max_node_id is not None and node.id > self._max_node_id:
+            self._max_node_id = node.id
+        self._nodes_by_state_az.setdefault((node.state, node.AZ), {})[node.id] = node
+        self._fingerprint = (self._fingerprint + _fingerprint_key('node', node.state, node.AZ)) & _FINGERPRINT_MASK
+        node._owner = self
+        if self._node_heaps:
+            self._push_node(node)
+        if self._journal is not None:
+            self._journal.append(('add_node', node.id, node.AZ, node.state))
+
+    def _add_nodes(self, nodes):
+        """ Bulk _add_node, used when building or copying a state """
+        if self._journal is not None or self._node_heaps:
+            for node in nodes:
+                self._add_node(node)
+            return
+        for node in nodes:
+            node._owner = self
+            self._nodes_by_id[node.id] = node
+            self._nodes_by_state_az.setdefault((node.state, node.AZ), {})[node.id] = node
+            self._fingerprint = (self._fingerprint + _fingerprint_key('node', node.state, node.AZ)) & _FINGERPRINT_MASK
+        self._max_node_id = None
+
+    def _remove_node(self, node):
+        del self._nodes_by_id[node.id]
+        if node.id == self._max_node_id:
+            self._max_node_id = None
+        self._discard(self._nodes_by_state_az, (node.state, node.AZ), node.id)
+        self._fingerprint = (self._fingerprint - _fingerprint_key('node', node.state, node.AZ)) & _FINGERPRINT_MASK
+        node._owner = None
+        if self._journal is not None:
+            self._journal.append(('remove_node', node.id))
+
+    def _reindex_node(self, node, old_state):
+        self._discard(self._nodes_by_state_az, (old_state, node.AZ), node.id)
+        self._nodes_by_state_az.setdefault((node.state, node.AZ), {})[node.id] = node
+        self._fingerprint = (
+            self._fingerprint - _fingerprint_key('node', old_state, node.AZ) + _fingerprint_key('node', node.state, node.AZ)
+        ) & _FINGERPRINT_MASK
+        if self._node_heaps:
+            self._push_node(node)
+        if self._journal is not None:
+            self._journal.append(('node', node.id, node.state))
+
+    def _push_node(self, node):
+        # Entries of removed nodes and outdated keys stay behind, first_nodes skips them
+        for order, heap in self._node_heaps.items():
+            heapq.heappush(heap, (NODE_ORDERS[order](node), node.id))
+
+    def _node_heap(self, order):
+        heap = self._node_heaps.get(order)
+        # Rebuild when stale entries outnumber the nodes
+        if heap is None or len(heap) > 2 * len(self._nodes_by_id) + 64:
+            heap = [(NODE_ORDERS[order](node), node.id) for node in self._nodes_by_id.values()]
+            heapq.heapify(heap)
+            self._node_heaps[order] = heap
+        return heap
+
+    def first_nodes(self, order, number):
+        """ The first `number` nodes in an order of NODE_ORDERS, in O(number log n) from a heap kept by the state
+
+        Raises:
+            Exception: the state has less than number nodes
+        """
+        if self.count_nodes() < number:
+            raise Exception("Too many nodes are required: I do not have that many")
+        heap = self._node_heap(order)
+        key = NODE_ORDERS[order]
+        selected = {}
+        while len(selected) < number:
+            entry_key, node_id = heapq.heappop(heap)
+            node = self._nodes_by_id.get(node_id)
+            if node is None or node_id in selected or key(node) != entry_key:
+                continue
+            selected[node_id] = node
+        # The selection does not change the nodes, they keep their place
+        for node in selected.values():
+            heapq.heappush(heap, (key(node), node.id))
+        return list(selected.values())
+
+    def _add_workload(self, workload):
+        self._workloads_by_id[workload.id] = workload
+        cell = self._counter_cell(workload.type, workload.AZ)
+        self._workload_counts[cell] += 1
+        self._index_workload(workload, workload.node, workload.state)
+        self._fingerprint = (self._fingerprint + _fingerprint_key('workload', workload.type, workload.AZ, workload.state)) & _FINGERPRINT_MASK
+        workload._owner = self
+        if self._journal is not None:
+            self._journal.append(('add_workload', workload.id, workload.type, workload.AZ, workload.state, workload.node))
+
+    def _add_workloads(self, workloads):
+        """ Bulk _add_workload, the counters are updated once per type and AZ instead of once per workload """
+        if self._journal is not None:
+            for workload in workloads:
+                self._add_workload(workload)
+            return
+        counts = {}
+        scheduled = {}
+        for workload in workloads:
+            key = (workload.type, workload.AZ)
+            counts[key] = counts.get(key, 0) + 1
+            self._fingerprint = (self._fingerprint + _fingerprint_key('workload', workload.type, workload.AZ, workload.state)) & _FINGERPRINT_MASK
+            workload._owner = self
+            self._workloads_by_id[workload.id] = workload
+            if workload.node is not None:
+                self._workloads_by_node.setdefault(workload.node, {})[workload.id] = workload
+                self._scheduled_by_type_az.setdefault(key, {})[workload.id] = workload
+                scheduled[key] = scheduled.get(key, 0) + 1
+            elif workload.state == 'pending':
+                self._pending_workloads[workload.id] = workload
+        for key, count in counts.items():
+            cell = self._counter_cell(*key)
+            self._workload_counts[cell] += count
+            self._scheduled_counts[cell] += scheduled.get(key, 0)
+
+    def _remove_workload(self, workload):
+        del self._workloads_by_id[workload.id]
+        cell = self._counter_cell(workload.type, workload.AZ)
+        self._workload_counts[cell] -= 1
+        self._unindex_workload(workload, workload.node, workload.state)
+        self._fingerprint = (self._fingerprint - _fingerprint_key('workload', workload.type, workload.AZ, workload.state)) & _FINGERPRINT_MASK
+        workload._owner = None
+        if self._journal is not None:
+            self._journal.append(('remove_workload', workload.id))
+
+    def _reindex_workload(self, workload, old_node, old_state):
+        self._unindex_workload(workload, old_node, old_state)
+        self._index_workload(workload, workload.node, workload.state)
+        self._fingerprint = (
+            self._fingerprint - _fingerprint_key('workload', workload.type, workload.AZ, old_state)
+            + _fingerprint_key('workload', workload.type, workload.AZ, workload.state)
+        ) & _FINGERPRINT_MASK
+        if self._journal is not None:
+            self._journal.append(('workload', workload.id, workload.node, workload.state))
+
+    def fingerprint(self):
+        """ Hash of the aggregate configuration: nodes per AZ and state, workloads per type, AZ and state.
+
+        Two states with the same counts have the same fingerprint, whatever their ids and time. It is
+        kept up to date on every change, so reading it is O(1).
+        """
+        return self._fingerprint
+
+    # Journal
+    def start_journal(self):
+        """ Record every change to the nodes and workloads as a delta, see SSTA.snapshot """
+        self._journal = []
+
+    def pop_journal(self):
+        """ Return the deltas recorded since the last call and start a new batch """
+        deltas, self._journal = self._journal, []
+        return deltas
+
+    def stop_journal(self):
+        self._journal = None
+
+    def apply_deltas(self, deltas):
+        """ Replay deltas recorded by the journal of a state that was identical to this one """
+        for delta in deltas:
+            kind = delta[0]
+            if kind == 'node':
+                self._nodes_by_id[delta[1]]._set_state(delta[2])
+            elif kind == 'workload':
+                self._workloads_by_id[delta[1]]._set_allocation(delta[2], delta[3])
+            elif kind == 'add_node':
+                self._add_node(Node.trusted(delta[1], delta[2], delta[3]))
+            elif kind == 'remove_node':
+                self._remove_node(self._nodes_by_id[delta[1]])
+            elif kind == 'add_workload':
+                self._add_workload(Workload.trusted(delta[1], delta[2], delta[3], delta[4], delta[5]))
+            elif kind == 'remove_workload':
+                self._remove_workload(self._workloads_by_id[delta[1]])
+            else:
+                raise Exception("Unknown delta: {}".format(delta))
+
+    def copy(self):
+        """ Copy of this state with fresh Node and Workload objects, much cheaper than copy.deepcopy """
+        state = copy.copy(self)
+        state._journal = None
+        state.rng = copy.deepcopy(self.rng)
+        state._reset_indexes()
+        state._type_rows = dict(self._type_rows)
+        state._AZ_columns = dict(self._AZ_columns)
+        state._workload_counts = np.zeros_like(self._workload_counts)
+        state._scheduled_counts = np.zeros_like(self._scheduled_counts)
+        state._add_nodes([Node.trusted(node.id, node.AZ, node.state) for node in self._nodes_by_id.values()])
+        state._add_workloads([
+            Workload.trusted(workload.id, workload.type, workload.AZ, workload.state, workload.node)
+            for workload in self._workloads_by_id.values()
+        ])
+        return state
+
+    # Binary codec
+    def to_bytes(self):
+        """ Encode the nodes, workloads, counters layout, time, limits and policy of this state, see SSTA.codec.
+
+        Unlike toJSON, the initial configuration and the random stream are not stored.
+        """
+        AZs = {AZ: code for code, AZ in enumerate(self._AZ_columns)}
+        node_states, workload_states = {}, {}
+        nodes, workloads = list(self._nodes_by_id.values()), list(self._workloads_by_id.values())
+
+        node_arrays = {
+            'id': list(self._nodes_by_id),
+            'AZ': _codes([node.AZ for node in nodes], AZs),
+            'state': _codes([node.state for node in nodes], node_states),
+        }
+        workload_arrays = {
+            'id': list(self._workloads_by_id),
+            'type': _codes([workload.type for workload in workloads], dict(self._type_rows)),
+            'AZ': _codes([workload.AZ for workload in workloads], AZs),
+            'state': _codes([workload.state for workload in workloads], workload_states),
+            'node': [codec.NO_NODE if workload.node is None else workload.node for workload in workloads],
+        }
+        header = {
+            'time': self.time, 'iteration': self.iteration, 'MAX_NUMBER_OF_NODES': self.MAX_NUMBER_OF_NODES,
+            'MAX_WORKLOAD_ID': getattr(self, 'MAX_WORKLOAD_ID', None), 'ADD_NODE_TIME': self.ADD_NODE_TIME,
+            'REMOVE_NODE_TIME': self.REMOVE_NODE_TIME, 'EVICT_WORKLOAD_TIME': self.EVICT_WORKLOAD_TIME,
+            'SCHEDULE_WORKLOAD_TIME': self.SCHEDULE_WORKLOAD_TIME,
+        }
+        names = {
+            'AZs': self.AZs, 'counter_AZs': len(self._AZ_columns), 'all_AZs': list(AZs), 'workload_types': list(self._type_rows),
+            'node_states': list(node_states), 'workload_states': list(workload_states), 'policy': self.policy.name,
+        }
+        return codec.encode(header, names, node_arrays, workload_arrays)
+
+    @classmethod
+    def from_bytes(cls, buffer, rng=None):
+        """ Rebuild a state encoded by to_bytes.
+
+        Args:
+            buffer (bytes, memoryview, mmap): The encoded state, e.g. codec.read(path)
+            rng (optional): Generator, RandomStream or seed of the new state. Defaults to None, fresh entropy.
+        """
+        header, names, nodes, workloads = codec.decode(buffer)
+        state = cls(
+            nodes=[], workloads=[], iteration=header['iteration'], start_time=header['time'], AZs=names['AZs'],
+            MAX_NUMBER_OF_NODES=header['MAX_NUMBER_OF_NODES'], rng=rng
+        )
+        if header['MAX_WORKLOAD_ID'] is not None:
+            state.MAX_WORKLOAD_ID = header['MAX_WORKLOAD_ID']
+        state.set_times(header['ADD_NODE_TIME'], header['REMOVE_NODE_TIME'], header['EVICT_WORKLOAD_TIME'], header['SCHEDULE_WORKLOAD_TIME'])
+        state.set_policy(names['policy'])
+
+        # Same counter layout as the encoded state, like copy()
+        state._type_rows = {workload_type: row for row, workload_type in enumerate(names['workload_types'])}
+        state._AZ_columns = {AZ: column for column, AZ in enumerate(names['all_AZs'][:names['counter_AZs']])}
+        state._workload_counts = np.zeros((len(state._type_rows), len(state._AZ_columns)), dtype=np.int64)
+        state._scheduled_counts = np.zeros_like(state._workload_counts)
+
+        AZs = np.array(names['all_AZs'], dtype=object)
+        node_states = np.array(names['node_states'], dtype=object)
+        state._add_nodes(list(map(Node.trusted, nodes['id'].tolist(), AZs[nodes['AZ']].tolist(), node_states[nodes['state']].tolist())))
+
+        types = np.array(names['workload_types'], dtype=object)
+        workload_states = np.array(names['workload_states'], dtype=object)
+        workload_nodes = workloads['node'].astype(object)
+        workload_nodes[workloads['node'] == codec.NO_NODE] = None
+        state._add_workloads(list(map(
+            Workload.trusted, workloads['id'].tolist(), types[workloads['type']].tolist(), AZs[workloads['AZ']].tolist(),
+            workload_states[workloads['state']].tolist(), workload_nodes.tolist()
+        )))
+        return state
+
+    def _index_workload(self, workload, node, state):
+        if node is not None:
+            self._workloads_by_node.setdefault(node, {})[workload.id] = workload
+            self._scheduled_by_type_az.setdefault((workload.type, workload.AZ), {})[workload.id] = workload
+            cell = self._counter_cell(workload.type, workload.AZ)
+            self._scheduled_counts[cell] += 1
+        elif state == 'pending':
+            self._pending_workloads[workload.id] = workload
+
+    def _unindex_workload(self, workload, node, state):
+        if node is not None:
+            self._discard(self._workloads_by_node, node, workload.id)
+            self._discard(self._scheduled_by_type_az, (workload.type, workload.AZ), workload.id)
+            cell = self._counter_cell(workload.type, workload.AZ)
+            self._scheduled_counts[cell] -= 1
+        elif state == 'pending':
+            self._pending_workloads.pop(workload.id, None)
+
+    @staticmethod
+    def _discard(index, key, id):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(id, None)
+            if not bucket:
+                del index[key]
 
 
     # Counters
+    def _count_cell(self, counts, workload_type, target_AZ):
+        row, column = self._type_rows.get(workload_type), self._AZ_columns.get(target_AZ)
+        if row is None or column is None:
+            return 0
+        return int(counts[row, column])
+
+    def _count_row(self, counts, workload_type):
+        row = self._type_rows.get(workload_type)
+        return 0 if row is None else int(counts[row].sum())
+
+    def _count_column(self, counts, target_AZ):
+        column = self._AZ_columns.get(target_AZ)
+        return 0 if column is None else int(counts[:, column].sum())
+
     def count_scheduled_workloads_type_az(self, workload_type, target_AZ):
         if type(target_AZ) != str:
             raise TypeError("target_AZ should be a string")
         if type(workload_type) != str:
             raise TypeError("workload_type should be a string")
-        return len([workload for workload in self.workloads if workload.type == workload_type and workload.AZ == target_AZ and workload.node != None])
+        return self._count_cell(self._scheduled_counts, workload_type, target_AZ)
 
     def count_scheduled_workloads_type(self, workload_type):
         if type(workload_type) != str:
             raise TypeError("workload_type should be a string")
-        return len([workload for workload in self.workloads if workload.type == workload_type and workload.node != None])
+        return self._count_row(self._scheduled_counts, workload_type)
 
     def count_scheduled_workloads_az(self, target_AZ):
         if type(target_AZ) != str:
             raise TypeError("target_AZ should be a string")
-        return len([workload for workload in self.workloads if workload.AZ == target_AZ and workload.node != None])
+        return self._count_column(self._scheduled_counts, target_AZ)
 
     def count_workloads_type_az(self, workload_type, target_AZ):
         if type(target_AZ) != str:
             raise TypeError("target_AZ should be a string")
         if type(workload_type) != str:
             raise TypeError("workload_type should be a string")
-        return len([workload for workload in self.workloads if workload.type == workload_type and workload.AZ == target_AZ])
+        return self._count_cell(self._workload_counts, workload_type, target_AZ)
 
     def count_workloads_type(self, workload_type):
         if type(workload_type) != str:
             raise TypeError("workload_type should be a string")
-        return len([workload for workload in self.workloads if workload.type == workload_type])
+        return self._count_row(self._workload_counts, workload_type)
 
     def count_workloads_az(self, target_AZ):
         if type(target_AZ) != str:
             raise TypeError("target_AZ should be a string")
-        return len([workload for workload in self.workloads if workload.AZ == target_AZ])
+        return self._count_column(self._workload_counts, target_AZ)
+
+    def count_pending_workloads_az(self, target_AZ):
+        return self.count_workloads_az(target_AZ) - self.count_scheduled_workloads_az(target_AZ)
+
+    def count_free_nodes_az(self, target_AZ):
+        return len(self._nodes_by_state_az.get(('free', target_AZ), {}))
 
     def count_nodes(self):
-        return len(self.nodes)
+        return len(self._nodes_by_id)
 
     def count_workloads(self):
-        return len(self.workloads)
+        return len(self._workloads_by_id)
 
     # Creators
     def add_node(self, AZ=None):
         if type(AZ) != str and AZ:
             raise TypeError("AZ should be a str")
         if not AZ:
-            AZ = planning_AZ_heuristic(self.AZs)
+            AZ = self.policy.scale_up_AZ(self)
 
         new_id = self.max_node_id() + 1
-        logging.debug("Adding Node with id: {} - AZ: {} - state: {}".format(new_id, AZ, 'free'))
-        self.nodes += [Node(id=new_id, AZ=AZ, state='free')]
+        logger.debug("Adding Node with id: %s - AZ: %s - state: %s", new_id, AZ, 'free')
+        self._add_node(Node.trusted(new_id, AZ, 'free'))
+        count('added_nodes')
         self.add_time(self.ADD_NODE_TIME)
 
     def add_workload(self, workload_type, AZ=None):
@@ -141,11 +513,11 @@ class State():
         if type(workload_type) != str:
             raise TypeError("workload_type should be a str")
         if not AZ:
-            AZ = planning_AZ_heuristic(self.AZs)
+            AZ = planning_AZ_heuristic(self.AZs, rng=self.rng.substream('planning'))
 
         new_id = self.max_workload_id(increase=True) + 1
-        logging.debug("Adding Workload with id: {} - type: {} - AZ: {} - state: {}".format(new_id, workload_type, AZ, 'pending'))
-        self.workloads += [Workload(id=new_id, workload_type=workload_type, AZ=AZ, state='pending', node=None)]
+        logger.debug("Adding Workload with id: %s - type: %s - AZ: %s - state: %s", new_id, workload_type, AZ, 'pending')
+        self._add_workload(Workload.trusted(new_id, workload_type, AZ, 'pending'))
         self.add_time(self.SCHEDULE_WORKLOAD_TIME)
 
     # Evictors / Removors
@@ -164,16 +536,18 @@ class State():
         """
         if type(node_id) != int:
             raise TypeError("node_id should be a int")
-        workloads = self._get_workloads(['node'], [node_id])
+        workloads = list(self._workloads_by_node.get(node_id, {}).values())
 
         if len(workloads) == 0:
-            logging.debug("No workloads where found for node_id: {}. Node already was free".format(node_id))
+            logger.debug("No workloads where found for node_id: %s. Node already was free", node_id)
         else:
             for workload in workloads:
-                logging.debug("Evicted Workload with id: {} - type: {} - AZ: {}".format(workload.id, workload.type, workload.AZ))
+                logger.debug("Evicted Workload with id: %s - type: %s - AZ: %s", workload.id, workload.type, workload.AZ)
                 workload.evict()
+            count('evictions', len(workloads))
         self.add_time(self.EVICT_WORKLOAD_TIME)
 
+    @profiled('eviction')
     def evict_workload_by_type_and_az(self, workload_type, AZ, number=1):
         """ Evict A workload, called by the workload scheduler when there are too many workloads
 
@@ -192,26 +566,20 @@ class State():
         if len(eviction_candidate_workloads) < number:
             raise Exception("Too many nodes are required to be evicted. I don't have that many nodes")
         else:
-            eviction_workload_ids = [w.id for w in eviction_heuristic(eviction_candidate_workloads, number)]
-
-        new_workloads = []
-        for workload in self.workloads:
-            if workload.id in eviction_workload_ids:
-                # Update the node
-                nodes = self._get_nodes(['id'], [workload.node])
-
-                if len(nodes) > 1:
-                    raise Exception("Too many Nodes where found. Workloads only run on one node")
-                elif len(nodes) == 0:
-                    raise Exception("No nodes where Found. Workloads should be running on a node. Otherwise they cannot be evicted")
-                nodes[0].mark_free()
-                logging.debug("Removed Workload with id: {}, type: {}, AZ: {}, state: {}".format(workload.id, workload.type, workload.AZ, workload.state))
-
-                # Evict the workload (Yes, this is not totally logical, but otherwise you run into issues)
-                workload.evict()
-            else:
-                new_workloads += [workload]
-        self.workloads = new_workloads
+            eviction_workloads = self.policy.eviction_workloads(self, eviction_candidate_workloads, number)
+
+        for workload in eviction_workloads:
+            # Update the node
+            node = self._nodes_by_id.get(workload.node)
+            if node is None:
+                raise Exception("No nodes where Found. Workloads should be running on a node. Otherwise they cannot be evicted")
+            node.mark_free()
+            logger.debug("Removed Workload with id: %s, type: %s, AZ: %s, state: %s", workload.id, workload.type, workload.AZ, workload.state)
+
+            # Evict the workload (Yes, this is not totally logical, but otherwise you run into issues)
+            workload.evict()
+            self._remove_workload(workload)
+        count('evictions', len(eviction_workloads))
         self.add_time(self.EVICT_WORKLOAD_TIME)
 
     def remove_node(self, number=1):
@@ -220,44 +588,128 @@ class State():
         if self.count_nodes() < number:
             raise Exception("Too many nodes are required to be removed: I do not have that many")
 
-        removal_node_ids = [n.id for n in node_removal_heuristic(self.nodes, number)]
-        nodes = []
-        for node in self.nodes:
-            if node.id in removal_node_ids:
-                # Evict the workload
-                self.evict_workload_on_node(node.id)
+        for node in self.policy.removal_nodes(self, number):
+            self._drain_node(node)
+        self.add_time(self.REMOVE_NODE_TIME)
 
-                # Mark the node as free
-                logging.debug("Removed node with id: {}, AZ: {}, state: {}".format(node.id, node.AZ, node.state))
-                node.mark_free()
+    def remove_node_by_id(self, node_id):
+        """ Drain and remove one specific node, its workload (if any) goes back to pending
 
-                # And do not incorporate this node in the new list of nodes
-            else:
-                nodes += [node]
-        self.nodes = nodes
+        Args:
+            node_id (int): Integer-based ID of the node
+
+        Raises:
+            Exception: There is no node with this id
+        """
+        node = self._nodes_by_id.get(node_id)
+        if node is None:
+            raise Exception("No node with id: {}".format(node_id))
+        self._drain_node(node)
         self.add_time(self.REMOVE_NODE_TIME)
 
+    def apply(self, actions):
+        """ Apply a plan of actions in order, with the same time accounting as the individual methods.
+
+        Actions:
+            ('evict', workload_type, AZ, number): evict_workload_by_type_and_az
+            ('allocate',): update_workload_node_allocation, skipped when nothing changed since the
+                previous allocation, as that one already placed every workload it could
+            ('add_node', AZ): add_node, AZ None picks one with the planning heuristic
+            ('remove_node', number): remove_node
+
+        Args:
+            actions (list): Tuples as above
+
+        Raises:
+            Exception: Unknown action
+        """
+        changed = True
+        for action in actions:
+            kind = action[0]
+            if kind == 'evict':
+                self.evict_workload_by_type_and_az(workload_type=action[1], AZ=action[2], number=action[3])
+                changed = True
+            elif kind == 'allocate':
+                if changed and self._pending_workloads:
+                    self.update_workload_node_allocation()
+                changed = False
+            elif kind == 'add_node':
+                self.add_node(AZ=action[1])
+                changed = True
+            elif kind == 'remove_node':
+                self.remove_node(number=action[1])
+                changed = True
+            else:
+                raise Exception("Unknown action: {}".format(action))
+
+    def _drain_node(self, node):
+        # Evict the workload
+        self.evict_workload_on_node(node.id)
+
+        # Mark the node as free
+        logger.debug("Removed node with id: %s, AZ: %s, state: %s", node.id, node.AZ, node.state)
+        node.mark_free()
+
+        # And do not incorporate this node in the new list of nodes
+        self._remove_node(node)
+        count('removed_nodes')
+
 
     # Getters
     def _get_nodes(self, keys, values):
+        """ Select nodes matching all key/value pairs. Lookups by id and by (state, AZ)
+        are served from the indexes, any remaining keys are filtered on the result.
+        """
         if type(keys) != list:
             raise TypeError("key should be a list")
         if type(values) != list:
             raise TypeError("value should be a list")
 
-        nodes = self.nodes
-        for key, value in zip(keys, values):
+        count('scans')
+        query = dict(zip(keys, values))
+        if 'id' in query:
+            node = self._nodes_by_id.get(query.pop('id'))
+            nodes = [node] if node is not None else []
+        elif 'state' in query and 'AZ' in query:
+            nodes = list(self._nodes_by_state_az.get((query.pop('state'), query.pop('AZ')), {}).values())
+        elif 'state' in query:
+            state = query.pop('state')
+            nodes = [node for (node_state, _), bucket in self._nodes_by_state_az.items() if node_state == state for node in bucket.values()]
+        else:
+            count('full_scans')
+            nodes = self.nodes
+
+        for key, value in query.items():
             nodes = list(filter(lambda node: getattr(node, key) == value, nodes))
         return nodes
 
     def _get_workloads(self, keys, values):
+        """ Select workloads matching all key/value pairs. Lookups by id, by node, by
+        (type, AZ) of scheduled workloads and of pending workloads are served from the indexes,
+        any remaining keys are filtered on the result.
+        """
         if type(keys) != list:
             raise TypeError("key should be a list")
         if type(values) != list:
             raise TypeError("value should be a list")
 
-        workloads = self.workloads
-        for key, value in zip(keys, values):
+        count('scans')
+        query = dict(zip(keys, values))
+        if 'id' in query:
+            workload = self._workloads_by_id.get(query.pop('id'))
+            workloads = [workload] if workload is not None else []
+        elif query.get('node') is not None:
+            workloads = list(self._workloads_by_node.get(query.pop('node'), {}).values())
+        elif 'type' in query and 'AZ' in query and query.get('state') == 'busy':
+            workloads = list(self._scheduled_by_type_az.get((query.pop('type'), query.pop('AZ')), {}).values())
+        elif 'node' in query and query.get('state') == 'pending':
+            del query['node'], query['state']
+            workloads = list(self._pending_workloads.values())
+        else:
+            count('full_scans')
+            workloads = self.workloads
+
+        for key, value in query.items():
             workloads = list(filter(lambda workload: getattr(workload, key) == value, workloads))
         return workloads
 
@@ -267,25 +719,39 @@ class State():
     def get_free_nodes(self):
         return self._get_nodes(['state'], ['free'])
 
+    def get_free_nodes_in_az(self, AZ):
+        return list(self._nodes_by_state_az.get(('free', AZ), {}).values())
+
+    def get_workload_types(self):
+        return list(self._type_rows)
+
+    def get_counter_AZs(self):
+        return list(self._AZ_columns)
+
+    def get_scheduled_type_az_matrix(self):
+        """ Scheduled workload counts, rows ordered as get_workload_types() and columns as get_counter_AZs() """
+        return self._scheduled_counts.copy()
+
     def get_scheduled_type_az_allocation(self):
-        return (
-            [{'type': 'A', 'AZ': AZ, 'count': self.count_scheduled_workloads_type_az('A', AZ)} for AZ in self.AZs] +
-            [{'type': 'B', 'AZ': AZ, 'count': self.count_scheduled_workloads_type_az('B', AZ)} for AZ in self.AZs] +
-            [{'type': 'C', 'AZ': AZ, 'count': self.count_scheduled_workloads_type_az('C', AZ)} for AZ in self.AZs]
-        )
+        counts = self._scheduled_counts.tolist()
+        return [
+            {'type': workload_type, 'AZ': AZ, 'count': counts[row][column]}
+            for workload_type, row in self._type_rows.items()
+            for AZ, column in self._AZ_columns.items()
+        ]
 
     def get_total_workloads(self):
-        return len(self.workloads)
+        return len(self._workloads_by_id)
 
     def get_total_nodes(self):
-        return len(self.nodes)
+        return len(self._nodes_by_id)
 
     # Printers
     def __str__(self):
         return self.print_nodes(return_=True) + '\n\n' + self.print_workloads(return_=True)
 
     def toJSON(self):
-        return json.dumps(self, default=lambda o: o.__dict__)
+        return json.dumps(self, default=_json_attributes)
 
     def print_nodes(self, return_=False):
         str_ = '----- Nodes -----\n'
@@ -307,13 +773,15 @@ class State():
 
     # Property Checkers
     def has_free_nodes(self):
-        return len(self.get_free_nodes()) > 0
+        return any(node_state == 'free' for node_state, _ in self._nodes_by_state_az)
 
     def has_non_allocated_workloads(self):
-        return len(self.get_non_allocated_workloads()) > 0
+        return len(self._pending_workloads) > 0
 
     def max_node_id(self):
-        return max([node.id for node in self.nodes])
+        if self._max_node_id is None:
+            self._max_node_id = max(self._nodes_by_id)
+        return self._max_node_id
 
     def max_workload_id(self, increase=False):
         if increase:
@@ -323,6 +791,16 @@ class State():
             return self.MAX_WORKLOAD_ID
 
     # Setters
+    def set_rng(self, rng):
+        """ Drive the heuristics of this state from rng, a Generator, RandomStream or seed """
+        if rng is self.rng or rng is self.rng.generator:
+            return
+        self.rng = as_random_stream(rng)
+
+    def set_policy(self, policy):
+        """ Make the decisions of iteration() with policy, a name of scheduling.POLICIES or a Policy """
+        self.policy = get_policy(policy)
+
     def set_times(self, add_node_time=None, remove_node_time=None, evict_workload_time=None, schedule_workload_time=None):
         if add_node_time:
             self.ADD_NODE_TIME = add_node_time
@@ -362,19 +840,72 @@ class State():
                 setattr(workload, key, value)
         self.workloads = workloads
 
+    @profiled('allocation')
     def update_workload_node_allocation(self):
-        for workload in self.workloads:
-            if not workload.node:
-                free_nodes = self._get_nodes(['state', 'AZ'], ['free', workload.AZ])
-                if len(free_nodes) > 0:
-                    target_node = planning_heuristic(free_nodes)
-
-                    logging.debug("Allocate workload: {} - {} - {}, to node: {} - {}".format(
-                        workload.id, workload.type, workload.AZ,
-                        target_node.id, target_node.AZ
-                    ))
-                    # Update Nodes
-                    target_node.mark_busy()
-
-                    # Update Workloads
-                    workload.allocate_to_node(target_node.id)
+        """ Allocate the pending workloads to free nodes in their AZ.
+
+        Per AZ, the pending workloads are taken in id order and matched to the free nodes in one go by the
+        policy. The random policy has the outcome distribution of picking a random free node for each
+        workload in turn. Costs O(pending workloads + free nodes).
+        """
+        pending_by_az = {}
+        for workload in sorted(self._pending_workloads.values(), key=lambda workload: workload.id):
+            pending_by_az.setdefault(workload.AZ, []).append(workload)
+
+        allocations = 0
+        for AZ, workloads in pending_by_az.items():
+            free_nodes = self.get_free_nodes_in_az(AZ)
+            number = min(len(workloads), len(free_nodes))
+            if number == 0:
+                continue
+            target_nodes = self.policy.placement_nodes(self, free_nodes, number)
+            for workload, target_node in zip(workloads, target_nodes):
+                logger.debug("Allocate workload: %s - %s - %s, to node: %s - %s", workload.id, workload.type, workload.AZ, target_node.id, target_node.AZ)
+                # Update Nodes
+                target_node.mark_busy()
+
+                # Update Workloads
+                workload.allocate_to_node(target_node.id)
+            allocations += number
+        count('allocations', allocations)
+
+
+# Orders in which State.first_nodes hands out nodes. Ids grow as nodes are added, so the smallest id is the oldest node
+NODE_ORDERS = {
+    'oldest': lambda node: node.id,
+    'least-utilized': lambda node: (0 if node.state == 'free' else 1, node.id),
+}
+
+
+# The fingerprint is a sum of one random 64-bit key per entity, keyed on its aggregate category. Keys
+# are derived from the category itself, so fingerprints agree across processes and runs.
+_FINGERPRINT_MASK = 2**64 - 1
+_fingerprint_keys = {}
+
+def _fingerprint_key(*category):
+    key = _fingerprint_keys.get(category)
+    if key is None:
+        digest = hashlib.blake2b(repr(category).encode(), digest_size=8).digest()
+        key = _fingerprint_keys[category] = int.from_bytes(digest, 'little')
+    return key
+
+
+def _codes(values, codes):
+    # Code of every value in codes, values that have none get the next codes, in order of appearance
+    for value in dict.fromkeys(values):
+        if value not in codes:
+            codes[value] = len(codes)
+    return list(map(codes.__getitem__, values))
+
+
+def _json_attributes(o):
+    # Skip the private back-references and indexes, State exposes its entities through properties
+    if hasattr(o, '__slots__'):
+        return {key: getattr(o, key) for key in o.__slots__ if not key.startswith('_')}
+    attributes = {key: value for key, value in vars(o).items() if not key.startswith('_')}
+    if isinstance(o, State):
+        del attributes['rng']
+        del attributes['policy']
+        attributes['nodes'] = o.nodes
+        attributes['workloads'] = o.workloads
+    return attributes
@@ -1,15 +1,10 @@
 """
 """
-import logging
-
-logging.basicConfig(
-    filename='example.log',
-    format='[%(asctime)s] p%(process)s:%(threadName)-4s - Func: %(funcName)-24s - %(filename)s@%(lineno)-2s - %(levelname)-8s - %(message)s',
-    encoding='utf-8', level=logging.DEBUG
-)
 
 
 class Workload():
+    __slots__ = ('id', 'AZ', 'state', 'node', 'type', '_owner')
+
     def __init__(self, id, AZ=None, state=None, workload_type=None, node=None):
         if type(id) != int:
             raise TypeError("id should be int")
@@ -27,16 +22,34 @@ class Workload():
         self.state = state
         self.node = node
         self.type = workload_type
+        self._owner = None
+
+    @classmethod
+    def trusted(cls, id, workload_type, AZ, state, node=None):
+        """ Build a workload from values known to be valid, skipping the checks of __init__ """
+        workload = object.__new__(cls)
+        workload.id = id
+        workload.AZ = AZ
+        workload.state = state
+        workload.node = node
+        workload.type = workload_type
+        workload._owner = None
+        return workload
+
+    def _set_allocation(self, node, state):
+        old_node, old_state = self.node, self.state
+        self.node = node
+        self.state = state
+        if self._owner is not None:
+            self._owner._reindex_workload(self, old_node, old_state)
 
     def allocate_to_node(self, node):
         if type(node) != int:
             raise TypeError("node should be int")
-        self.node = node
-        self.state = 'busy'
+        self._set_allocation(node, 'busy')
 
     def evict(self):
-        self.node = None
-        self.state = 'pending'
+        self._set_allocation(None, 'pending')
 
     def __str__(self):
         return 'Workload: {}\t Type: {}\t AZ: {}\t node: {}\t State: {}'.format(
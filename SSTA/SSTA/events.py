@@ -0,0 +1,141 @@
+"""Discrete-event simulation mode.
+
+Instead of stepping `iteration()` and adding up fixed costs serially, the scheduler and the autoscaler
+start timed operations (evictions, scheduling attempts, node joins and node drains) that complete
+after ADD_NODE_TIME, REMOVE_NODE_TIME, EVICT_WORKLOAD_TIME or SCHEDULE_WORKLOAD_TIME. Operations of
+both controllers overlap, and the clock jumps straight from one completion to the next. After each
+completion both controllers reconcile the state and start whatever work is still missing. The
+simulation is stable once nothing is in flight and the allocation matches the target. The node to
+drain is picked by the policy of the state (see scheduling.Policy.drain_node).
+"""
+import heapq
+import itertools
+import logging
+
+from SSTA.helpers import allocation_diff
+
+logger = logging.getLogger(__name__)
+
+
+class DiscreteEventSimulation():
+    def __init__(self, state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, rng=None):
+        """
+        Args:
+            state (State): State to simulate, it is modified in place and its time follows the event clock
+            TARGET_WORKLOAD_NODE_ALLOCATION (list): Target allocation of workloads per type and AZ
+            MAX_NUMBER_OF_NODES (int): Maximum number of nodes the autoscaler may provision
+            rng (Generator, optional): Drives the random decisions of the heuristics. Defaults to None.
+        """
+        if rng is not None:
+            state.set_rng(rng)
+        self.state = state
+        self.TARGET_WORKLOAD_NODE_ALLOCATION = TARGET_WORKLOAD_NODE_ALLOCATION
+        self.MAX_NUMBER_OF_NODES = MAX_NUMBER_OF_NODES
+        self.now = state.time
+        self.queue = []
+        self.events_processed = 0
+        self._sequence = itertools.count()
+
+        # Operations in flight, so the controllers do not start the same work twice
+        self.evicting = {}
+        self.provisioning = 0
+        self.draining = None
+        self.allocating = False
+
+    def schedule(self, delay, kind, *payload):
+        heapq.heappush(self.queue, (self.now + delay, next(self._sequence), kind, payload))
+
+    # Controllers
+    def reconcile(self):
+        self._reconcile_workloads()
+        self._reconcile_nodes()
+
+    def _reconcile_workloads(self):
+        state = self.state
+        differences = allocation_diff(state.get_scheduled_type_az_allocation(), self.TARGET_WORKLOAD_NODE_ALLOCATION)
+        for difference in differences:
+            key = (difference['type'], difference['AZ'])
+            outstanding = -difference['diff'] - self.evicting.get(key, 0)
+            if difference['diff'] < 0 and outstanding > 0:
+                self.evicting[key] = self.evicting.get(key, 0) + outstanding
+                self.schedule(state.EVICT_WORKLOAD_TIME, 'evict', key[0], key[1], outstanding)
+
+        if not self.allocating and any(difference['diff'] > 0 for difference in differences) and self._can_allocate():
+            self.allocating = True
+            self.schedule(state.SCHEDULE_WORKLOAD_TIME, 'allocate')
+
+    def _reconcile_nodes(self):
+        state = self.state
+        pending = len(state.get_non_allocated_workloads())
+        while pending > self.provisioning and state.count_nodes() + self.provisioning < self.MAX_NUMBER_OF_NODES:
+            self.provisioning += 1
+            self.schedule(state.ADD_NODE_TIME, 'node_join')
+
+        # Scale down one empty node at a time, it is picked when the drain starts
+        if self.draining is None and state.has_free_nodes():
+            self.draining = state.policy.drain_node(state, state.get_free_nodes()).id
+            self.schedule(state.EVICT_WORKLOAD_TIME + state.REMOVE_NODE_TIME, 'drain', self.draining)
+
+    def _can_allocate(self):
+        return any(self.state.get_free_nodes_in_az(workload.AZ) for workload in self.state.get_non_allocated_workloads())
+
+    # Events
+    def step(self):
+        """ Complete the next operation and let the controllers react to it """
+        time, _, kind, payload = heapq.heappop(self.queue)
+        self.now = time
+        state = self.state
+        logger.debug("Time: %s - Event: %s %s", time, kind, payload)
+
+        if kind == 'evict':
+            workload_type, AZ, number = payload
+            self.evicting[(workload_type, AZ)] -= number
+            number = min(number, state.count_scheduled_workloads_type_az(workload_type, AZ))
+            if number > 0:
+                state.evict_workload_by_type_and_az(workload_type=workload_type, AZ=AZ, number=number)
+        elif kind == 'allocate':
+            self.allocating = False
+            state.update_workload_node_allocation()
+        elif kind == 'node_join':
+            self.provisioning -= 1
+            state.add_node()
+        elif kind == 'drain':
+            node_id, = payload
+            self.draining = None
+            # The drain is cancelled when the node got a workload in the meantime
+            node = state._nodes_by_id.get(node_id)
+            if node is not None and node.state == 'free':
+                state.remove_node_by_id(node_id)
+        else:
+            raise Exception("Unknown event: {}".format(kind))
+
+        # The operation took place in parallel with others: the clock, not the sum of costs, is the time
+        state.time = self.now
+        self.events_processed += 1
+        self.reconcile()
+
+    def run(self, until=None, max_events=None):
+        """ Process events until the state is stable, the clock passes `until` or `max_events` were processed.
+
+        Returns:
+            dict: 'stable', 'events', 'nodes' and 'time'. The queue can also drain without reaching the
+                target, e.g. at MAX_NUMBER_OF_NODES without free nodes, which is not stable.
+        """
+        self.reconcile()
+        while self.queue:
+            if until is not None and self.queue[0][0] > until:
+                break
+            if max_events is not None and self.events_processed >= max_events:
+                break
+            self.step()
+        stable = not self.queue and not allocation_diff(self.state.get_scheduled_type_az_allocation(), self.TARGET_WORKLOAD_NODE_ALLOCATION)
+        return {
+            'stable': stable, 'events': self.events_processed,
+            'nodes': self.state.count_nodes(), 'time': self.now
+        }
+
+
+def run_discrete_event(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, rng=None, until=None, max_events=10000):
+    """ Run a discrete-event simulation on a copy of initial_state, see DiscreteEventSimulation.run """
+    simulation = DiscreteEventSimulation(initial_state.copy(), TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, rng)
+    return simulation.run(until=until, max_events=max_events)
@@ -1,20 +1,122 @@
 import functools
 import numpy as np
-import json
 
+from SSTA.profiling import profiled
 
-def random_AZ(AZs):
-    return AZs[np.random.randint(0, high=len(AZs), size=1)[0]]
+
+_ANTITHETIC_MIRROR = 1.0 - 2.0 ** -53
+
+# Purposes of the random decisions, each one gets its own substream
+SUBSTREAMS = ['planning', 'allocation', 'eviction', 'removal']
+# Spawn keys of substreams start with this entry, so they never coincide with the children spawned by SeedSequence.spawn
+_SUBSTREAM_KEY = 2 ** 31
+
+class RandomStream():
+    """ Buffered stream of random numbers on top of a NumPy Generator.
+
+    Uniform doubles are drawn from the generator in blocks and handed out one decision at a time,
+    so a scalar draw costs a buffer read instead of a NumPy call. Implements the subset of the
+    Generator API used by the scheduling heuristics.
+
+    An antithetic stream hands out the mirror image 1 - u of every uniform u of the generator (and
+    reversed permutations), so a simulation driven by it is negatively correlated with the one driven
+    by the plain stream of the same seed.
+
+    Every kind of decision draws from its own substream (see `substream`), so two configurations run
+    from the same seed stay in step even when one of them makes more decisions of some kind.
+    """
+    def __init__(self, generator=None, block_size=1024, antithetic=False):
+        # The substreams are derived from the SeedSequence, kept here as Generators only expose it from NumPy 1.25 on
+        self.seed_sequence = _seed_sequence(generator)
+        self.generator = np.random.default_rng(generator if isinstance(generator, (np.random.Generator, np.random.BitGenerator)) else self.seed_sequence)
+        self.block_size = block_size
+        self.antithetic = antithetic
+        self._substreams = {}
+        self._buffer = np.empty(0)
+        self._position = 0
+
+    def _take(self, number):
+        if self._position + number > len(self._buffer):
+            remaining = self._buffer[self._position:]
+            block = self.generator.random(max(self.block_size, number))
+            if self.antithetic:
+                # The doubles of random() are multiples of 2**-53 in [0, 1), mirroring keeps them on that grid
+                block = _ANTITHETIC_MIRROR - block
+            self._buffer = np.concatenate([remaining, block])
+            self._position = 0
+        values = self._buffer[self._position:self._position + number]
+        self._position += number
+        return values
+
+    def random(self, size=None):
+        if size is None:
+            return float(self._take(1)[0])
+        return self._take(int(np.prod(size))).reshape(size)
+
+    def integers(self, low, high=None, size=None):
+        if high is None:
+            low, high = 0, low
+        values = low + np.floor(self.random(size) * (high - low)).astype(np.int64)
+        return int(values) if size is None else values
+
+    def permutation(self, x):
+        permutation = self.generator.permutation(x)
+        return permutation[::-1] if self.antithetic else permutation
+
+    def substream(self, purpose):
+        """ Stream for the decisions of one purpose, one of SUBSTREAMS, derived from the seed of this stream """
+        stream = self._substreams.get(purpose)
+        if stream is None:
+            seed_sequence = self.seed_sequence
+            seed = np.random.SeedSequence(
+                seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (_SUBSTREAM_KEY, SUBSTREAMS.index(purpose)),
+                pool_size=seed_sequence.pool_size
+            )
+            stream = RandomStream(seed, self.block_size, self.antithetic)
+            self._substreams[purpose] = stream
+        return stream
+
+
+def _seed_sequence(seed):
+    """ SeedSequence behind a seed, SeedSequence, BitGenerator or Generator """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        seed = seed.bit_generator
+    if isinstance(seed, np.random.BitGenerator):
+        # Public as seed_seq from NumPy 1.25 on, as _seed_seq before
+        seed_sequence = getattr(seed, 'seed_seq', None) or getattr(seed, '_seed_seq', None)
+        if not isinstance(seed_sequence, np.random.SeedSequence):
+            raise ValueError("The generator was not seeded from a SeedSequence, substreams cannot be derived from it")
+        return seed_sequence
+    return np.random.SeedSequence(seed)
+
+
+def as_random_stream(rng=None):
+    """ Wrap a Generator, seed or None into a RandomStream, RandomStreams are returned as is """
+    if isinstance(rng, RandomStream):
+        return rng
+    return RandomStream(rng)
+
+_default_stream = None
+
+def default_random_stream():
+    """ Process-wide stream used when no RNG is injected """
+    global _default_stream
+    if _default_stream is None:
+        _default_stream = RandomStream()
+    return _default_stream
+
+
+def random_AZ(AZs, rng=None):
+    rng = rng if rng is not None else default_random_stream()
+    return AZs[rng.integers(0, high=len(AZs))]
 
 def check_lists_equal(list1, list2):
     if len(list1) != len(list2):
         return False
     return functools.reduce(lambda i, j : i and j, map(lambda m, k: m == k, list1, list2), True)
 
-def remove_duplicate_dictionaries(input_list):
-    list_of_strings = set([json.dumps(dictionary) for dictionary in input_list])
-    return [json.loads(item) for item in list_of_strings]
-
 def total_dict_of_lists(workload_allocation):
     tot = 0
     for item in workload_allocation:
@@ -23,30 +125,32 @@ def total_dict_of_lists(workload_allocation):
 
 
 # Methods for assessing differences between the current state and the target state
-def find_allocation(allocations, specific_allocation):
-    allocations = list(filter(lambda allocation: allocation['type'] == specific_allocation['type'], allocations))
-    allocations = list(filter(lambda allocation: allocation['AZ'] == specific_allocation['AZ'], allocations))
-    if len(allocations) > 1:
-        print("ALLOCATIONS")
-        print(allocations)
-        raise Exception("Too Many Exceptions were found! There seem to be duplicates")
-    elif len(allocations) == 0:
-        return {'type': specific_allocation['type'], 'AZ': specific_allocation['AZ'], 'count': 0}
-    else:
-        return allocations[0]
+def allocation_counts(allocations):
+    """ Key a list of allocations by (type, AZ), preserving the order of the list """
+    counts = {}
+    for allocation in allocations:
+        key = (allocation['type'], allocation['AZ'])
+        if key in counts:
+            raise Exception("Too Many Exceptions were found! There seem to be duplicates")
+        counts[key] = allocation['count']
+    return counts
 
+@profiled('allocation_diff')
 def allocation_diff(current_allocation, target_allocation):
-    diffs = []
-    for allocation in target_allocation:
-        alloc = find_allocation(current_allocation, allocation)
-        diffs += [{'type': allocation['type'], 'AZ': allocation['AZ'], 'diff': allocation['count'] - alloc['count']}]
-
-    for allocation in current_allocation:
-        alloc = find_allocation(target_allocation, allocation)
-        diffs += [{'type': allocation['type'], 'AZ': allocation['AZ'], 'diff':  alloc['count'] - allocation['count']}]
+    """ Signed difference (target - current) per (type, AZ), for the pairs that require action.
+    Diffs are ordered as the target allocation, followed by pairs only present in the current allocation.
+    """
+    current_counts = allocation_counts(current_allocation)
+    target_counts = allocation_counts(target_allocation)
 
-    # Now we probably will have counted some differences twice, so let's fix that
-    diffs = remove_duplicate_dictionaries(diffs)
+    diffs = [
+        {'type': workload_type, 'AZ': AZ, 'diff': count - current_counts.get((workload_type, AZ), 0)}
+        for (workload_type, AZ), count in target_counts.items()
+    ]
+    diffs += [
+        {'type': workload_type, 'AZ': AZ, 'diff': -count}
+        for (workload_type, AZ), count in current_counts.items() if (workload_type, AZ) not in target_counts
+    ]
     return check_require_action(diffs)
 
 def check_require_action(diffs):
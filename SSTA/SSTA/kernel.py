@@ -0,0 +1,217 @@
+"""Compiled simulation kernel.
+
+Runs iteration() on the aggregate configuration of a simulation (free nodes per AZ, scheduled and
+pending workloads per type and AZ, see SSTA.batch) as plain loops over integer arrays, compiled with
+Numba when it is installed and run as pure Python otherwise.
+
+In aggregate an iteration takes two random decisions: the AZ of an added node and the node that is
+removed. The kernel reads them from an array of uniforms drawn up front from a NumPy Generator
+seeded per simulation, so both backends produce the same results for the same seed.
+
+Example:
+    results = run_kernel(initial_state, target, MAX_NUMBER_OF_NODES, n_simulations=100000, n_iterations=100, seed=1)
+    check_equivalence(initial_state, target, MAX_NUMBER_OF_NODES)['equivalent']
+"""
+import math
+
+import numpy as np
+
+from SSTA.batch import BatchState, as_time
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BACKEND = 'numba' if numba is not None else 'python'
+
+
+def _jit(function):
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+def _allocate(free, scheduled, pending, priority):
+    # Per AZ, pending workloads are allocated in the order of their ids, which are handed out per (type, AZ) block
+    n_AZs, n_types = priority.shape
+    total = 0
+    for column in range(n_AZs):
+        for j in range(n_types):
+            row = priority[column, j]
+            allocated = min(pending[row, column], free[column])
+            pending[row, column] -= allocated
+            scheduled[row, column] += allocated
+            free[column] -= allocated
+            total += allocated
+    return total
+
+
+def _remove_node(free, scheduled, pending, draw):
+    # The draw-th node, counting the free nodes per AZ and then the busy nodes per (type, AZ).
+    # Returns whether the node was busy, its workload goes back to pending
+    n_types, n_AZs = scheduled.shape
+    for column in range(n_AZs):
+        if draw < free[column]:
+            free[column] -= 1
+            return False
+        draw -= free[column]
+    for row in range(n_types):
+        for column in range(n_AZs):
+            if draw < scheduled[row, column]:
+                scheduled[row, column] -= 1
+                pending[row, column] += 1
+                return True
+            draw -= scheduled[row, column]
+    return False
+
+
+def _simulate(free, scheduled, pending, target, order, priority, MAX_NUMBER_OF_NODES, uniforms, times):
+    """ Run iterations from the configuration (updated in place) until it is stable, returns (steps, time).
+
+    steps is -1 if the configuration is not stable after len(uniforms) iterations. times holds the
+    start time and the ADD_NODE_TIME, REMOVE_NODE_TIME and EVICT_WORKLOAD_TIME of the state.
+    """
+    time, add_node_time, remove_node_time, evict_workload_time = times[0], times[1], times[2], times[3]
+    n_AZs = free.shape[0]
+    # Running totals, so the loop never sums the arrays
+    n_free, n_scheduled, n_pending = free.sum(), scheduled.sum(), pending.sum()
+    differences = np.empty(order.shape[0], dtype=np.int64)
+    for i in range(uniforms.shape[0]):
+        # update_workloads: the differences are taken before any eviction or allocation
+        workloads_done = True
+        for k in range(order.shape[0]):
+            differences[k] = target[order[k, 0], order[k, 1]] - scheduled[order[k, 0], order[k, 1]]
+            if differences[k] != 0:
+                workloads_done = False
+        for k in range(order.shape[0]):
+            if differences[k] < 0:
+                # Evicted workloads are gone, their nodes are free
+                scheduled[order[k, 0], order[k, 1]] += differences[k]
+                free[order[k, 1]] -= differences[k]
+                n_scheduled += differences[k]
+                n_free -= differences[k]
+                time += evict_workload_time
+            elif differences[k] > 0 and n_free > 0:
+                allocated = _allocate(free, scheduled, pending, priority)
+                n_free -= allocated
+                n_scheduled += allocated
+                n_pending -= allocated
+
+        # update_nodes
+        add = n_pending > 0 and n_free + n_scheduled < MAX_NUMBER_OF_NODES
+        if add:
+            free[int(uniforms[i, 0] * n_AZs)] += 1
+            n_free += 1
+            time += add_node_time
+        remove = n_free > 0
+        if remove:
+            if _remove_node(free, scheduled, pending, int(uniforms[i, 1] * (n_free + n_scheduled))):
+                n_scheduled -= 1
+                n_pending += 1
+            else:
+                n_free -= 1
+            time += evict_workload_time + remove_node_time
+
+        if workloads_done and not add and not remove:
+            return i, time
+    return -1, time
+
+
+def _simulate_many(free, scheduled, pending, target, order, priority, MAX_NUMBER_OF_NODES, uniforms, times, steps, end_times, nodes):
+    # One simulation per row of uniforms, all from the same configuration
+    for j in range(uniforms.shape[0]):
+        simulation_free = free.copy()
+        simulation_scheduled = scheduled.copy()
+        simulation_pending = pending.copy()
+        simulation_steps, simulation_time = _simulate(
+            simulation_free, simulation_scheduled, simulation_pending, target, order, priority, MAX_NUMBER_OF_NODES, uniforms[j], times
+        )
+        steps[j] = simulation_steps
+        end_times[j] = simulation_time
+        nodes[j] = simulation_free.sum() + simulation_scheduled.sum()
+
+
+_allocate = _jit(_allocate)
+_remove_node = _jit(_remove_node)
+_simulate = _jit(_simulate)
+_simulate_many = _jit(_simulate_many)
+
+
+def run_kernel(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_simulations, n_iterations, seed=None, chunk_size=4096):
+    """ Run n_simulations simulations from initial_state with the compiled kernel.
+
+    Simulation j is driven by the j-th child of SeedSequence(seed), like in run_simulations.
+
+    Args:
+        initial_state (State): State every simulation starts from
+        TARGET_WORKLOAD_NODE_ALLOCATION (list): Target allocation of workloads per type and AZ
+        MAX_NUMBER_OF_NODES (int): Maximum number of nodes the autoscaler may provision
+        n_simulations (int): Number of simulations
+        n_iterations (int): Maximum number of iterations per simulation
+        seed (int, optional): Master seed. Defaults to None, fresh entropy.
+        chunk_size (int, optional): Simulations whose uniforms are drawn at once. Defaults to 4096.
+
+    Returns:
+        list: One result dict per simulation, with the same keys as the results of run_batch
+    """
+    if initial_state.policy.name != 'random':
+        raise Exception("The kernel runs the random policy, the state has policy: {}".format(initial_state.policy.name))
+    batch = BatchState.from_state(initial_state, 1, TARGET_WORKLOAD_NODE_ALLOCATION)
+    target, order = batch.target_matrix(TARGET_WORKLOAD_NODE_ALLOCATION)
+    order = np.array(order, dtype=np.int64).reshape(-1, 2)
+    priority = np.array(batch.priority, dtype=np.int64)
+    times = np.array([batch.time[0], batch.ADD_NODE_TIME, batch.REMOVE_NODE_TIME, batch.EVICT_WORKLOAD_TIME], dtype=np.float64)
+    seeds = np.random.SeedSequence(seed).spawn(n_simulations)
+
+    results = []
+    for start in range(0, n_simulations, chunk_size):
+        chunk = seeds[start:start + chunk_size]
+        uniforms = np.stack([np.random.default_rng(child).random((n_iterations, 2)) for child in chunk])
+        steps = np.empty(len(chunk), dtype=np.int64)
+        end_times = np.empty(len(chunk), dtype=np.float64)
+        nodes = np.empty(len(chunk), dtype=np.int64)
+        _simulate_many(batch.free[0], batch.scheduled[0], batch.pending[0], target, order, priority, MAX_NUMBER_OF_NODES, uniforms, times, steps, end_times, nodes)
+        results += [
+            {'iteration': start + j, 'Steps': int(steps[j]) if steps[j] >= 0 else None, 'nodes': int(nodes[j]), 'time': as_time(end_times[j])}
+            for j in range(len(chunk))
+        ]
+    return results
+
+
+def _moments(results, metric):
+    values = [result[metric] for result in results if result[metric] is not None]
+    mean = sum(values) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+    return mean, variance / len(values)
+
+
+def check_equivalence(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_simulations=2000, n_iterations=100, seed=0, workers=None, threshold=4.0):
+    """ Compare the statistics of the kernel with those of the reference engine (run_simulations on State).
+
+    The non-convergence rate and the means of the steps (of converged simulations), time and nodes of both
+    engines are compared with a two-sample z-test. Independent seeds are used for both engines.
+
+    Returns:
+        dict: Per metric the kernel value, the reference value and the z-score, and 'equivalent': all |z| < threshold
+    """
+    from SSTA.simulation import iter_simulations
+
+    kernel = run_kernel(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_simulations, n_iterations, seed=seed)
+    reference = list(iter_simulations(
+        initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, n_simulations, workers=workers, seed=seed + 1,
+        MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES, n_iterations=n_iterations
+    ))
+
+    comparison = {'backend': BACKEND}
+    for results in (kernel, reference):
+        for result in results:
+            result['non_convergence'] = 1.0 if result['Steps'] is None else 0.0
+    for metric in ('non_convergence', 'Steps', 'time', 'nodes'):
+        (kernel_mean, kernel_variance), (reference_mean, reference_variance) = _moments(kernel, metric), _moments(reference, metric)
+        spread = math.sqrt(kernel_variance + reference_variance)
+        z = (kernel_mean - reference_mean) / spread if spread > 0 else (0.0 if kernel_mean == reference_mean else float('inf'))
+        comparison[metric] = {'kernel': kernel_mean, 'reference': reference_mean, 'z': z}
+    comparison['equivalent'] = all(abs(comparison[metric]['z']) < threshold for metric in ('non_convergence', 'Steps', 'time', 'nodes'))
+    return comparison
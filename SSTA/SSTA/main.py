@@ -1,66 +1,70 @@
 """Main module."""
 from SSTA.helpers import allocation_diff
+from SSTA.profiling import phase, profiled
 import logging
 
-logging.basicConfig(
-    filename='simulation.log',
-    format='[%(asctime)s] p%(process)s:%(threadName)-4s - Func: %(funcName)-24s - %(filename)s@%(lineno)-2s - %(levelname)-8s - %(message)s',
-    encoding='utf-8', level=logging.DEBUG
-)
+logger = logging.getLogger(__name__)
 
+@profiled('update_workloads')
 def update_workloads(state, TARGET_WORKLOAD_NODE_ALLOCATION, iteration_number):
     # Check whether workloads should be evicted
     differences = allocation_diff(state.get_scheduled_type_az_allocation(), TARGET_WORKLOAD_NODE_ALLOCATION)
 
     # If there are differences, there is work to be done
     if len(differences) > 0:
-        logging.info("Iteration: {} - Differences were detected".format(iteration_number))
-        logging.info("Iteration: {} - Differences: {}".format(iteration_number, differences))
+        logger.info("Iteration: %s - Differences were detected", iteration_number)
+        logger.info("Iteration: %s - Differences: %s", iteration_number, differences)
 
+        plan = []
         for difference in differences:
             # If there are too many workloads
             if difference['diff'] < 0:
-                logging.info('Iteration: {} - Too many deployments of a workloads type: {}, AZ: {}. Evicting.'.format(
-                    iteration_number, difference['type'], difference['AZ'])
-                )
-                state.evict_workload_by_type_and_az(
-                    workload_type=difference['type'], AZ=difference['AZ'], number=abs(difference['diff'])
-                )
+                logger.info('Iteration: %s - Too many deployments of a workloads type: %s, AZ: %s. Evicting.', iteration_number, difference['type'], difference['AZ'])
+                plan += [('evict', difference['type'], difference['AZ'], abs(difference['diff']))]
 
-            # If there are not enough worklaods
+            # If there are not enough worklaods, try to allocate them to free nodes
             else:
-                # If there are free nodes
-                if state.has_free_nodes():
-                    logging.info("Iteration: {} - Trying to allocate workloads!".format(iteration_number))
-                    state.update_workload_node_allocation()
+                logger.info("Iteration: %s - Trying to allocate workloads!", iteration_number)
+                plan += [('allocate',)]
+        state.apply(plan)
         return state, False
 
     else:
         return state, True
 
+@profiled('update_nodes')
 def update_nodes(state, iteration_number, MAX_NUMBER_OF_NODES):
-    done = True
+    plan = []
     if state.has_non_allocated_workloads() and state.count_nodes() < MAX_NUMBER_OF_NODES:
-        logging.info("Iteration: {} - added a node!".format(iteration_number))
-        state.add_node()
-        done = False
+        logger.info("Iteration: %s - added a node!", iteration_number)
+        plan += [('add_node', None)]
 
-    if state.has_free_nodes():
-        state.remove_node()
-        logging.info("Iteration: {} - Removed a node!".format(iteration_number))
-        done = False
+    # A node that was just added is free
+    if plan or state.has_free_nodes():
+        logger.info("Iteration: %s - Removed a node!", iteration_number)
+        plan += [('remove_node', 1)]
 
-    return state, done
+    state.apply(plan)
+    return state, not plan
 
-def iteration(state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, iteration_number):
+def iteration(state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, iteration_number, rng=None, policy=None):
+    # Random decisions of the heuristics are drawn from rng when given, from the state's own stream otherwise
+    if rng is not None:
+        state.set_rng(rng)
+    # Decisions are made by the policy given by name (see scheduling.POLICIES), by the state's own policy otherwise
+    if policy is not None:
+        state.set_policy(policy)
     state, workloads_done = update_workloads(state, TARGET_WORKLOAD_NODE_ALLOCATION, iteration_number)
     state, nodes_done = update_nodes(state, iteration_number, MAX_NUMBER_OF_NODES)
 
-    logging.info("Iteration: {} - Workloads done: {}".format(iteration_number, str(workloads_done)))
-    logging.info("Iteration: {} - Nodes done: {}".format(iteration_number, str(nodes_done)))
+    with phase('logging'):
+        logger.info("Iteration: %s - Workloads done: %s", iteration_number, str(workloads_done))
+        logger.info("Iteration: %s - Nodes done: %s", iteration_number, str(nodes_done))
 
-    logging.info("Iteration: {} - Nodes: {}".format(iteration_number, state.print_nodes(return_=True)))
-    logging.info("Iteration: {} - Workloads: {}".format(iteration_number, state.print_workloads(return_=True)))
+        # Dumping the whole state is O(nodes + workloads), only build it when full tracing is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Iteration: %s - Nodes: %s", iteration_number, state.print_nodes(return_=True))
+            logger.debug("Iteration: %s - Workloads: %s", iteration_number, state.print_workloads(return_=True))
 
     done = workloads_done and nodes_done
     return state, done
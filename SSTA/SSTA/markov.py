@@ -0,0 +1,309 @@
+"""Exact analysis of a simulation as an absorbing Markov chain.
+
+`iteration()` only depends on the aggregate configuration of a State (free nodes per AZ, scheduled
+and pending workloads per type and AZ, see SSTA.batch), and the heuristics in SSTA.scheduling pick
+uniformly among interchangeable entities. The reachable aggregate configurations therefore form a
+finite Markov chain whose absorbing states are the configurations where iteration() reports done.
+This module enumerates that chain from an initial State and solves it for the absorption probability,
+the expected number of steps and the expected time, and the distribution of the Steps, time and nodes
+reported by a Monte Carlo run capped at n_iterations.
+
+Example:
+    chain = MarkovChain.from_state(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES)
+    chain.solve()                      # absorption probability, expected steps and time
+    chain.distribution(n_iterations)   # distribution of Steps, time and nodes
+
+solve() uses the sparse solver of SciPy (the optional 'markov' extra). Without SciPy it falls back to
+a dense solve, which is only done when its matrices fit in DENSE_BYTES.
+"""
+import logging
+
+import numpy as np
+
+from SSTA.batch import BatchState, as_time
+
+logger = logging.getLogger(__name__)
+
+# Memory the dense solve may take when SciPy is missing. It holds two n x n float matrices, I - Q and
+# its LU factorization, so 2 GiB covers chains of about 11500 transient configurations
+DENSE_BYTES = 2 * 1024 ** 3
+
+
+class AggregateModel():
+    """ The effect of one iteration() on an aggregate configuration, with its random outcomes.
+
+    A configuration is a tuple: free nodes per AZ, followed by scheduled and pending workloads per
+    (type, AZ) in row-major order.
+    """
+    def __init__(self, batch, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES):
+        self.AZs = batch.AZs
+        self.WORKLOAD_TYPES = batch.WORKLOAD_TYPES
+        self.priority = batch.priority
+        self.target, self.order = batch.target_matrix(TARGET_WORKLOAD_NODE_ALLOCATION)
+        self.MAX_NUMBER_OF_NODES = MAX_NUMBER_OF_NODES
+        self.ADD_NODE_TIME = batch.ADD_NODE_TIME
+        self.REMOVE_NODE_TIME = batch.REMOVE_NODE_TIME
+        self.EVICT_WORKLOAD_TIME = batch.EVICT_WORKLOAD_TIME
+        self.shape = self.target.shape
+
+    def encode(self, free, scheduled, pending):
+        return tuple(free.tolist()) + tuple(scheduled.ravel().tolist()) + tuple(pending.ravel().tolist())
+
+    def decode(self, configuration):
+        n_AZs, cells = len(self.AZs), self.target.size
+        free = np.array(configuration[:n_AZs], dtype=np.int64)
+        scheduled = np.array(configuration[n_AZs:n_AZs + cells], dtype=np.int64).reshape(self.shape)
+        pending = np.array(configuration[n_AZs + cells:], dtype=np.int64).reshape(self.shape)
+        return free, scheduled, pending
+
+    def count_nodes(self, configuration):
+        free, scheduled, _ = self.decode(configuration)
+        return int(free.sum() + scheduled.sum())
+
+    def _allocate(self, free, scheduled, pending):
+        # Deterministic in aggregate: pending workloads take free nodes of their AZ in id order
+        for column in range(len(self.AZs)):
+            for row in self.priority[column]:
+                allocated = min(pending[row, column], free[column])
+                pending[row, column] -= allocated
+                scheduled[row, column] += allocated
+                free[column] -= allocated
+
+    def outcomes(self, configuration):
+        """ Random outcomes of one iteration() from configuration.
+
+        Returns:
+            tuple: done (bool) and a list of (probability, time spent, next configuration)
+        """
+        free, scheduled, pending = self.decode(configuration)
+        differences = self.target - scheduled
+        workloads_done = not differences.any()
+
+        # update_workloads: the differences are visited in order. The eviction heuristic picks distinct
+        # workloads and allocation is deterministic in aggregate, so this part has a single outcome.
+        time = 0
+        for row, column in self.order:
+            diff = differences[row, column]
+            if diff < 0:
+                free[column] -= diff
+                scheduled[row, column] += diff
+                time += self.EVICT_WORKLOAD_TIME
+            elif diff > 0 and free.sum() > 0:
+                self._allocate(free, scheduled, pending)
+
+        # update_nodes: a node is added in a uniformly drawn AZ, then a uniformly drawn node is removed
+        results = {}
+        nodes_done = True
+        added_branches = [(1.0, time, free)]
+        if pending.sum() > 0 and free.sum() + scheduled.sum() < self.MAX_NUMBER_OF_NODES:
+            nodes_done = False
+            added_branches = []
+            for column in range(len(self.AZs)):
+                free_ = free.copy()
+                free_[column] += 1
+                added_branches += [(1.0 / len(self.AZs), time + self.ADD_NODE_TIME, free_)]
+
+        for probability, time, free in added_branches:
+            if free.sum() == 0:
+                self._add_outcome(results, probability, time, free, scheduled, pending)
+                continue
+            nodes_done = False
+            n_nodes = free.sum() + scheduled.sum()
+            time += self.EVICT_WORKLOAD_TIME + self.REMOVE_NODE_TIME
+            for column in np.flatnonzero(free):
+                free_ = free.copy()
+                free_[column] -= 1
+                self._add_outcome(results, probability * free[column] / n_nodes, time, free_, scheduled, pending)
+            for row, column in zip(*np.nonzero(scheduled)):
+                scheduled_, pending_ = scheduled.copy(), pending.copy()
+                scheduled_[row, column] -= 1
+                pending_[row, column] += 1
+                self._add_outcome(results, probability * scheduled[row, column] / n_nodes, time, free, scheduled_, pending_)
+
+        done = workloads_done and nodes_done
+        return done, [(probability, time, next_configuration) for (next_configuration, time), probability in results.items()]
+
+    def _add_outcome(self, results, probability, time, free, scheduled, pending):
+        key = (self.encode(free, scheduled, pending), time)
+        results[key] = results.get(key, 0.0) + probability
+
+
+class MarkovChain():
+    def __init__(self, model, configurations, absorbing, rows, columns, probabilities, times, initial_time=0):
+        self.model = model
+        self.configurations = configurations
+        self.absorbing = absorbing
+        self.rows = rows
+        self.columns = columns
+        self.probabilities = probabilities
+        self.times = times
+        self.initial_time = initial_time
+
+    @classmethod
+    def from_state(cls, state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES=None, max_states=1000000):
+        """ Enumerate the aggregate configurations reachable from state.
+
+        Args:
+            state (State): Initial state, as passed to the simulations
+            TARGET_WORKLOAD_NODE_ALLOCATION (list): Target allocation of workloads per type and AZ
+            MAX_NUMBER_OF_NODES (int, optional): Defaults to state.MAX_NUMBER_OF_NODES.
+            max_states (int, optional): Give up beyond this many configurations. Defaults to 1000000.
+
+        Raises:
+            Exception: More than max_states configurations are reachable
+            Exception: The state has another policy than random, the chain models the random heuristics
+        """
+        if state.policy.name != 'random':
+            raise Exception("The Markov chain models the random policy, the state has policy: {}".format(state.policy.name))
+        if MAX_NUMBER_OF_NODES is None:
+            MAX_NUMBER_OF_NODES = state.MAX_NUMBER_OF_NODES
+        batch = BatchState.from_state(state, 1, TARGET_WORKLOAD_NODE_ALLOCATION)
+        model = AggregateModel(batch, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES)
+
+        initial = model.encode(batch.free[0], batch.scheduled[0], batch.pending[0])
+        index = {initial: 0}
+        configurations = [initial]
+        absorbing = []
+        rows, columns, probabilities, times = [], [], [], []
+        for source, configuration in enumerate(configurations):
+            done, outcomes = model.outcomes(configuration)
+            absorbing += [done]
+            if done:
+                continue
+            for probability, time, next_configuration in outcomes:
+                target = index.get(next_configuration)
+                if target is None:
+                    if len(configurations) >= max_states:
+                        raise Exception("More than {} configurations are reachable, the chain is too large to solve".format(max_states))
+                    target = index[next_configuration] = len(configurations)
+                    configurations += [next_configuration]
+                rows += [source]
+                columns += [target]
+                probabilities += [probability]
+                times += [time]
+
+        return cls(
+            model, configurations, np.array(absorbing),
+            np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64),
+            np.array(probabilities), np.array(times, dtype=np.float64), state.time
+        )
+
+    def __len__(self):
+        return len(self.configurations)
+
+    def _reaches_absorption(self):
+        reaches = self.absorbing.copy()
+        while True:
+            update = np.zeros(len(self), dtype=bool)
+            update[self.rows[reaches[self.columns]]] = True
+            update |= reaches
+            if (update == reaches).all():
+                return reaches
+            reaches = update
+
+    def solve(self):
+        """ Absorption probability, and expected steps and time until absorption (given absorption),
+        from the initial configuration.
+
+        Returns:
+            dict: 'absorption_probability', 'expected_steps', 'expected_time', 'states' and 'absorbing_states'
+        """
+        reaches = self._reaches_absorption()
+        transient = np.flatnonzero(reaches & ~self.absorbing)
+        position = np.full(len(self), -1, dtype=np.int64)
+        position[transient] = np.arange(len(transient))
+
+        # With a the absorption probabilities: (I - Q) a = R 1, (I - Q) u = a for u = E[steps 1{absorbed}]
+        # and (I - Q) v = sum_j P_ij time_ij a_j for v = E[time 1{absorbed}]
+        absorbed_next = self.absorbing[self.columns]
+        inside = (position[self.rows] >= 0) & (position[self.columns] >= 0)
+        from_transient = position[self.rows] >= 0
+        n = len(transient)
+        R = np.bincount(position[self.rows[from_transient & absorbed_next]], weights=self.probabilities[from_transient & absorbed_next], minlength=n)
+        matrix = (position[self.rows[inside]], position[self.columns[inside]], self.probabilities[inside])
+
+        a = _solve(matrix, n, R)
+        absorption = np.zeros(len(self))
+        absorption[transient] = a
+        absorption[self.absorbing] = 1.0
+        time_weights = self.probabilities * self.times * absorption[self.columns]
+        b = np.bincount(position[self.rows[from_transient]], weights=time_weights[from_transient], minlength=n)
+        u, v = _solve(matrix, n, np.column_stack([a, b])).T
+
+        if self.absorbing[0]:
+            probability, steps, time = 1.0, 0.0, 0.0
+        elif position[0] < 0:
+            probability, steps, time = 0.0, float('inf'), float('inf')
+        else:
+            probability = a[position[0]]
+            steps, time = u[position[0]] / probability, v[position[0]] / probability
+        return {
+            'absorption_probability': float(probability), 'expected_steps': float(steps),
+            'expected_time': float(self.initial_time + time), 'states': len(self),
+            'absorbing_states': int(self.absorbing.sum())
+        }
+
+    def distribution(self, n_iterations=100):
+        """ Distribution of the results of run_simulation(..., n_iterations) from the initial configuration.
+
+        Returns:
+            dict: 'Steps', 'time' and 'nodes', each a dict value -> probability. Steps is None for the
+                simulations that are not done within n_iterations.
+        """
+        steps = {}
+        # Probability mass per (configuration, time spent), only for the simulations still running
+        mass = {(0, 0): 1.0}
+        final = {}
+        outgoing = _outgoing(self)
+        for i in range(n_iterations):
+            next_mass = {}
+            for (configuration, time), probability in mass.items():
+                if self.absorbing[configuration]:
+                    steps[i] = steps.get(i, 0.0) + probability
+                    final[(configuration, time)] = final.get((configuration, time), 0.0) + probability
+                    continue
+                for target, p, dt in outgoing[configuration]:
+                    key = (target, time + dt)
+                    next_mass[key] = next_mass.get(key, 0.0) + probability * p
+            mass = next_mass
+        for key, probability in mass.items():
+            steps[None] = steps.get(None, 0.0) + probability
+            final[key] = final.get(key, 0.0) + probability
+
+        times, nodes = {}, {}
+        for (configuration, time), probability in final.items():
+            time = as_time(time + self.initial_time)
+            times[time] = times.get(time, 0.0) + probability
+            count = self.model.count_nodes(self.configurations[configuration])
+            nodes[count] = nodes.get(count, 0.0) + probability
+        return {'Steps': steps, 'time': dict(sorted(times.items())), 'nodes': dict(sorted(nodes.items()))}
+
+
+def _outgoing(chain):
+    outgoing = [[] for _ in range(len(chain))]
+    for source, target, probability, time in zip(chain.rows.tolist(), chain.columns.tolist(), chain.probabilities.tolist(), chain.times.tolist()):
+        outgoing[source] += [(target, probability, time)]
+    return outgoing
+
+
+def _solve(matrix, n, b):
+    """ Solve (I - Q) x = b for the sparse substochastic Q given as (rows, columns, values) """
+    if n == 0:
+        return np.zeros(np.shape(b))
+    rows, columns, values = matrix
+    try:
+        from scipy.sparse import csr_matrix, identity
+        from scipy.sparse.linalg import spsolve
+    except ImportError:
+        size = 2 * 8 * n ** 2
+        if size > DENSE_BYTES:
+            message = "Solving a chain of {} configurations densely takes {:.1f} GiB, more than DENSE_BYTES, install scipy (pip install SSTA[markov])".format(n, size / 1024 ** 3)
+            logger.error(message)
+            raise Exception(message)
+        # I - Q is built in place, np.linalg.solve factorizes a copy of it
+        A = np.zeros((n, n))
+        np.add.at(A, (rows, columns), -values)
+        A[np.diag_indices(n)] += 1.0
+        return np.linalg.solve(A, b)
+    Q = csr_matrix((values, (rows, columns)), shape=(n, n))
+    return spsolve((identity(n, format='csr') - Q).tocsc(), b)
@@ -0,0 +1,129 @@
+"""Profiling hooks.
+
+The simulation reports the wall time of its phases and counts its operations to the hooks installed
+with `add_hook`. While no hook is installed, a phase or a counter costs a single check of the hook list.
+
+Phases: update_workloads, allocation_diff, eviction, allocation, update_nodes, logging and snapshot.
+Phases nest (update_workloads contains allocation_diff, eviction and allocation), so their times are
+inclusive. Counters: evictions, allocations, added_nodes, removed_nodes, scans (node and workload
+lookups) and full_scans (lookups that had to walk every node or workload).
+
+Example:
+    with Profile() as profile:
+        run_simulation(...)
+    print(profile.report())
+"""
+import functools
+import time
+
+
+_hooks = []
+
+
+class Hook():
+    """ Interface of a profiling hook, override the events of interest """
+    def on_phase(self, name, seconds):
+        pass
+
+    def on_count(self, name, number):
+        pass
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def count(name, number=1):
+    if _hooks:
+        for hook in _hooks:
+            hook.on_count(name, number)
+
+
+class phase():
+    """ Context manager timing a block as the phase `name` """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _hooks else None
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            seconds = time.perf_counter() - self.start
+            for hook in _hooks:
+                hook.on_phase(self.name, seconds)
+
+
+def profiled(name):
+    """ Decorator timing every call of a function as the phase `name` """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                for hook in _hooks:
+                    hook.on_phase(name, seconds)
+        return wrapper
+    return decorator
+
+
+class Profile(Hook):
+    """ Hook aggregating calls and time per phase and totals per counter.
+
+    Profiles of single simulations are combined into one for a campaign with `merge`.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    def on_phase(self, name, seconds):
+        calls, total = self.phases.get(name, (0, 0.0))
+        self.phases[name] = (calls + 1, total + seconds)
+
+    def on_count(self, name, number):
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def merge(self, other):
+        """ Add the phases and counters of another Profile, or of its to_dict() """
+        if isinstance(other, dict):
+            phases = {name: (phase['calls'], phase['seconds']) for name, phase in other['phases'].items()}
+            counters = other['counters']
+        else:
+            phases, counters = other.phases, other.counters
+        for name, (calls, seconds) in phases.items():
+            own_calls, own_seconds = self.phases.get(name, (0, 0.0))
+            self.phases[name] = (own_calls + calls, own_seconds + seconds)
+        for name, number in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + number
+        return self
+
+    def to_dict(self):
+        return {
+            'phases': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.phases.items()},
+            'counters': dict(self.counters)
+        }
+
+    def report(self):
+        lines = ['{:<20} {:>10} {:>12}'.format('phase', 'calls', 'seconds')]
+        for name, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines += ['{:<20} {:>10} {:>12.6f}'.format(name, calls, seconds)]
+        lines += ['{:<20} {:>10}'.format(name, number) for name, number in sorted(self.counters.items())]
+        return '\n'.join(lines)
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_hook(self)
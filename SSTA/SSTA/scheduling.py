@@ -1,35 +1,149 @@
-import numpy as np
 import logging
 
+from SSTA.helpers import default_random_stream
 
-def eviction_heuristic(eviction_candidate_workloads, number):
+logger = logging.getLogger(__name__)
+
+
+def sample_without_replacement(population, number, rng):
+    """ `number` distinct indices drawn uniformly out of range(population), in O(number) (Floyd's algorithm) """
+    if number > population:
+        message = "Cannot pick {} distinct candidates out of {}".format(number, population)
+        logger.error(message)
+        raise Exception(message)
+    selected = set()
+    indices = []
+    for upper in range(population - number, population):
+        index = int(rng.integers(0, high=upper + 1))
+        if index in selected:
+            index = upper
+        selected.add(index)
+        indices += [index]
+    return indices
+
+def eviction_heuristic(eviction_candidate_workloads, number, rng=None):
     if len(eviction_candidate_workloads) == 0:
         message = "The list of candidate workloads is empty"
-        logging.error(message)
+        logger.error(message)
         raise Exception(message)
-    indices = np.random.randint(0, high=len(eviction_candidate_workloads), size=number).tolist()
+    rng = rng if rng is not None else default_random_stream()
+    indices = sample_without_replacement(len(eviction_candidate_workloads), number, rng)
     return [eviction_candidate_workloads[index] for index in indices]
 
-def node_removal_heuristic(removal_candidate_nodes, number):
+def node_removal_heuristic(removal_candidate_nodes, number, rng=None):
     if len(removal_candidate_nodes) == 0:
         message = "The list of candidate removal nodes is empty"
-        logging.error(message)
+        logger.error(message)
         raise Exception(message)
-    indices = np.random.randint(0, high=len(removal_candidate_nodes), size=number).tolist()
+    rng = rng if rng is not None else default_random_stream()
+    indices = sample_without_replacement(len(removal_candidate_nodes), number, rng)
     return [removal_candidate_nodes[index] for index in indices]
 
-def planning_heuristic(candidate_nodes):
+def planning_heuristic(candidate_nodes, rng=None):
     if len(candidate_nodes) == 0:
         message = "The list of candidate planning nodes is empty"
-        logging.error(message)
+        logger.error(message)
         raise Exception(message)
-    index = np.random.randint(0, high=len(candidate_nodes), size=1)[0]
+    rng = rng if rng is not None else default_random_stream()
+    index = rng.integers(0, high=len(candidate_nodes))
     return candidate_nodes[index]
 
-def planning_AZ_heuristic(AZs):
+def planning_matching_heuristic(candidate_nodes, number, rng=None):
+    """ Nodes for `number` workloads at once, the i-th workload gets the i-th node. The nodes are a prefix
+    of a random permutation, the outcome of planning_heuristic drawing a node for each workload in turn.
+    """
+    if len(candidate_nodes) < number:
+        message = "Cannot match {} workloads to {} candidate planning nodes".format(number, len(candidate_nodes))
+        logger.error(message)
+        raise Exception(message)
+    rng = rng if rng is not None else default_random_stream()
+    return [candidate_nodes[index] for index in rng.permutation(len(candidate_nodes))[:number]]
+
+def planning_AZ_heuristic(AZs, rng=None):
     if len(AZs) == 0:
         message = "The list of candidate planning AZs is empty"
-        logging.error(message)
+        logger.error(message)
         raise Exception(message)
-    index = np.random.randint(0, high=len(AZs), size=1)[0]
+    rng = rng if rng is not None else default_random_stream()
+    index = rng.integers(0, high=len(AZs))
     return AZs[index]
+
+
+class Policy():
+    """ Decisions of the autoscaler and the scheduler during iteration().
+
+    Every decision is uniformly random, like the heuristics above. Subclasses override the decisions
+    they change and are registered in POLICIES, so they can be selected by name. Decisions that follow
+    an order of the nodes ask the state for its first nodes in that order (State.first_nodes), which the
+    state serves from a heap in O(log n) per node.
+    """
+    name = 'random'
+
+    def scale_up_AZ(self, state):
+        """ AZ of a node added by the autoscaler """
+        return planning_AZ_heuristic(state.AZs, rng=state.rng.substream('planning'))
+
+    def removal_nodes(self, state, number):
+        """ `number` distinct nodes removed by the autoscaler """
+        return node_removal_heuristic(state.nodes, number, rng=state.rng.substream('removal'))
+
+    def eviction_workloads(self, state, candidates, number):
+        """ `number` distinct workloads out of candidates evicted by the scheduler """
+        return eviction_heuristic(candidates, number, rng=state.rng.substream('eviction'))
+
+    def placement_nodes(self, state, free_nodes, number):
+        """ Free nodes, out of those of one AZ, for the first `number` pending workloads of that AZ """
+        return planning_matching_heuristic(free_nodes, number, rng=state.rng.substream('allocation'))
+
+    def drain_node(self, state, free_nodes):
+        """ Empty node, out of free_nodes, drained by the autoscaler of the discrete-event mode (SSTA.events) """
+        return node_removal_heuristic(free_nodes, 1, rng=state.rng.substream('removal'))[0]
+
+
+class LeastUtilizedPolicy(Policy):
+    """ Scale down the least utilized nodes: free nodes first, the oldest first among equally utilized ones """
+    name = 'least-utilized'
+
+    def removal_nodes(self, state, number):
+        return state.first_nodes('least-utilized', number)
+
+    def drain_node(self, state, free_nodes):
+        # All free nodes are equally utilized
+        return min(free_nodes, key=lambda node: node.id)
+
+
+class OldestNodePolicy(Policy):
+    """ Scale down the oldest nodes first, like the OldestInstance termination policy of an auto scaling group """
+    name = 'oldest-node'
+
+    def removal_nodes(self, state, number):
+        return state.first_nodes('oldest', number)
+
+    def drain_node(self, state, free_nodes):
+        return min(free_nodes, key=lambda node: node.id)
+
+
+class MostDeficitPolicy(Policy):
+    """ Scale up in the AZ with the largest deficit, its pending workloads minus its free nodes. Ties are broken at random """
+    name = 'most-deficit'
+
+    def scale_up_AZ(self, state):
+        deficits = {AZ: state.count_pending_workloads_az(AZ) - state.count_free_nodes_az(AZ) for AZ in state.AZs}
+        largest = max(deficits.values())
+        return planning_AZ_heuristic([AZ for AZ in state.AZs if deficits[AZ] == largest], rng=state.rng.substream('planning'))
+
+
+POLICIES = {policy.name: policy for policy in [Policy, LeastUtilizedPolicy, OldestNodePolicy, MostDeficitPolicy]}
+
+
+def get_policy(policy=None):
+    """ Policy instance for a name of POLICIES, a Policy or None (random) """
+    if policy is None:
+        return Policy()
+    if isinstance(policy, Policy):
+        return policy
+    if policy not in POLICIES:
+        message = "Unknown policy: {}, should be one of {}".format(policy, ', '.join(POLICIES))
+        logger.error(message)
+        raise Exception(message)
+    return POLICIES[policy]()
@@ -0,0 +1,264 @@
+"""Simulation runners.
+
+Every simulation gets its own seed, spawned from a single master SeedSequence, so a campaign is
+reproducible for a given master seed and independent of how the simulations are spread over processes.
+"""
+import numpy as np
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from SSTA import tracing
+from SSTA.helpers import RandomStream
+from SSTA.main import iteration
+from SSTA.profiling import Profile, add_hook, phase, remove_hook
+from SSTA.snapshot import Trajectory
+from SSTA.trajectory import TrajectoryWriter, count_actions
+
+
+def run_simulation(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_iterations, simulation=0, seed=None, output_folder=None, sink=None, profile=False, cycle_limit=None, antithetic=False, policy=None):
+    """ Run a single simulation from a copy of initial_state until it is stable or n_iterations is reached.
+
+    Args:
+        initial_state (State): State, or ArrayState, to start from, it is not modified
+        TARGET_WORKLOAD_NODE_ALLOCATION (list): Target allocation of workloads per type and AZ
+        MAX_NUMBER_OF_NODES (int): Maximum number of nodes the autoscaler may provision
+        n_iterations (int): Maximum number of iterations
+        simulation (int, optional): Index of the simulation, reported in the result. Defaults to 0.
+        seed (SeedSequence, optional): Seed of the Generator driving this simulation. Defaults to None.
+        output_folder (str, optional): Folder to write the trajectory of the simulation to. Defaults to None.
+        sink (TrajectoryWriter, optional): Writer receiving one record per iteration. Defaults to None.
+        profile (bool, optional): Add the 'profile' of the simulation to the result, see SSTA.profiling. Defaults to False.
+        cycle_limit (int, optional): Stop as 'cyclic' once an aggregate configuration (see State.fingerprint),
+            the initial one included, is revisited for the cycle_limit-th time. The heuristics are random, so a revisit
+            does not prove the simulation would never converge: low limits also cut off runs that would. Defaults to
+            None, never stop early.
+        antithetic (bool, optional): Drive the heuristics with the antithetic stream of seed, see RandomStream. Defaults to False.
+        policy (str, optional): Scheduling policy, a name of scheduling.POLICIES. Defaults to None, the policy of initial_state.
+
+    Returns:
+        dict: 'iteration', 'Steps' (None if the simulation did not converge), 'nodes', 'time' and 'verdict':
+            'stable', 'cyclic' or 'unfinished' (n_iterations was reached)
+    """
+    if profile:
+        simulation_profile = Profile()
+        add_hook(simulation_profile)
+        try:
+            result = run_simulation(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_iterations, simulation, seed, output_folder, sink, cycle_limit=cycle_limit, antithetic=antithetic, policy=policy)
+        finally:
+            remove_hook(simulation_profile)
+        result['profile'] = simulation_profile.to_dict()
+        return result
+
+    rng = RandomStream(seed, antithetic=antithetic)
+    state = initial_state.copy()
+    if policy is not None:
+        state.set_policy(policy)
+    trajectory = None
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+        trajectory = Trajectory(state)
+    if trajectory is not None or sink is not None:
+        state.start_journal()
+
+    result = {'iteration': simulation, 'Steps': None, 'verdict': 'unfinished'}
+    visits = {state.fingerprint(): 1} if cycle_limit else {}
+    for i in range(n_iterations):
+        state, done = iteration(
+            state=state,
+            TARGET_WORKLOAD_NODE_ALLOCATION=TARGET_WORKLOAD_NODE_ALLOCATION,
+            MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES,
+            iteration_number=i,
+            rng=rng
+        )
+
+        if trajectory is not None or sink is not None:
+            with phase('snapshot'):
+                deltas = state.pop_journal()
+                if trajectory is not None:
+                    trajectory.commit(state, deltas)
+                if sink is not None:
+                    sink.record(simulation, i, state, done, count_actions(deltas))
+
+        if done:
+            result.update(Steps=i, verdict='stable')
+            break
+
+        if cycle_limit:
+            fingerprint = state.fingerprint()
+            visits[fingerprint] = visits.get(fingerprint, 0) + 1
+            if visits[fingerprint] > cycle_limit:
+                result['verdict'] = 'cyclic'
+                break
+
+    if trajectory is not None:
+        with phase('snapshot'):
+            trajectory.save(output_folder + '/simulation-{}.json'.format(simulation))
+    result.update(nodes=state.count_nodes(), time=state.time)
+    return result
+
+
+# Per-process configuration, set once by the pool initializer instead of pickled with every task
+_worker_config = None
+_worker_sink = None
+
+def _init_worker(tracing_configuration, *config):
+    global _worker_config
+    _worker_config = config
+    if tracing_configuration is not None:
+        # Replace the handlers inherited from the parent with handles of this process
+        tracing.configure(**tracing_configuration)
+
+def _run_chunk(simulations, seeds):
+    initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_iterations, output_folder, record_trajectory, profile, cycle_limit, antithetic, policy = _worker_config
+    sink = None
+    if record_trajectory:
+        # Records are buffered in memory and shipped back to the process owning the trajectory file
+        sink = TrajectoryWriter(None, initial_state.get_counter_AZs(), initial_state.get_workload_types())
+    results = [
+        run_simulation(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES, n_iterations, simulation, seed, output_folder, sink, profile, cycle_limit, antithetic, policy)
+        for simulation, seed in zip(simulations, seeds)
+    ]
+    # Workers are not shut down cleanly, so their events are written before the results are returned
+    tracing.flush()
+    return results, sink.rows() if sink is not None else None
+
+
+def spawn_seeds(seed, first, n_sims):
+    """ Children first .. first + n_sims - 1 of SeedSequence(seed), as SeedSequence(seed).spawn would hand them out """
+    root = np.random.SeedSequence(seed)
+    return [
+        np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (j,), pool_size=root.pool_size)
+        for j in range(first, first + n_sims)
+    ]
+
+
+def _simulation_config(initial_state, target, MAX_NUMBER_OF_NODES=None, n_iterations=100, output_folder=None, trajectory_path=None, profile=False, cycle_limit=None, antithetic=False, policy=None):
+    # Settings shared by all simulations, handed to the workers once by the pool initializer
+    if MAX_NUMBER_OF_NODES is None:
+        MAX_NUMBER_OF_NODES = initial_state.MAX_NUMBER_OF_NODES
+    return (initial_state, target, MAX_NUMBER_OF_NODES, n_iterations, output_folder, trajectory_path is not None, profile, cycle_limit, antithetic, policy)
+
+
+def _start_pool(workers, config):
+    # Forked workers must not inherit, and write again, the events buffered so far
+    tracing.flush()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tracing.configuration(),) + config)
+    executor.workers = workers
+    executor.config = config
+    return executor
+
+
+def simulation_pool(initial_state, target, workers, **options):
+    """ Start worker processes for iter_simulations, so consecutive calls with the same settings, e.g.
+    the batches of streaming.run_until_precise, share one pool instead of starting one each.
+
+    Args:
+        initial_state (State): State every simulation starts from
+        target (list): Target allocation of workloads per type and AZ
+        workers (int): Number of worker processes
+        **options: MAX_NUMBER_OF_NODES, n_iterations, output_folder, trajectory_path, profile, cycle_limit,
+            antithetic and policy, as they will be passed to iter_simulations
+
+    Returns:
+        ProcessPoolExecutor: Pass it as the executor of iter_simulations, shut it down when done
+    """
+    return _start_pool(workers, _simulation_config(initial_state, target, **options))
+
+
+def iter_simulations(initial_state, target, n_sims, workers=None, seed=None, MAX_NUMBER_OF_NODES=None, n_iterations=100, chunksize=None, output_folder=None, trajectory_path=None, trajectory_mode='w', profile=False, cycle_limit=None, first=0, antithetic=False, policy=None, executor=None):
+    """ Run n_sims simulations, yielding the result dicts as they complete (not necessarily in order).
+
+    See run_simulations for the arguments. The simulations are numbered, and seeded, from `first` on,
+    so a campaign can be extended batch by batch with the same results as a single run. An executor
+    started by simulation_pool with the same settings runs the simulations instead of a new pool.
+    """
+    config = _simulation_config(initial_state, target, MAX_NUMBER_OF_NODES, n_iterations, output_folder, trajectory_path, profile, cycle_limit, antithetic, policy)
+    if executor is not None:
+        if executor.config != config:
+            raise ValueError("The executor was started by simulation_pool with other settings")
+        workers = executor.workers
+    seeds = spawn_seeds(seed, first, n_sims)
+    if not chunksize:
+        chunksize = max(1, n_sims // ((workers or 1) * 8))
+    chunks = [
+        (list(range(first + start, first + min(start + chunksize, n_sims))), seeds[start:start + chunksize])
+        for start in range(0, n_sims, chunksize)
+    ]
+
+    writer = None
+    if trajectory_path is not None:
+        writer = TrajectoryWriter(trajectory_path, initial_state.get_counter_AZs(), initial_state.get_workload_types(), mode=trajectory_mode)
+
+    if executor is None and (not workers or workers == 1):
+        _init_worker(None, *config)
+        completed = (_run_chunk(*chunk) for chunk in chunks)
+        for results, rows in completed:
+            if writer is not None:
+                writer.extend(rows)
+            for result in results:
+                yield result
+        return
+
+    pool = executor if executor is not None else _start_pool(workers, config)
+    try:
+        futures = {pool.submit(_run_chunk, *chunk): index for index, chunk in enumerate(chunks)}
+        # Chunks finish in any order, their records are written in chunk order so the file does not depend on the workers
+        finished_rows = {}
+        next_chunk = 0
+        for future in as_completed(futures):
+            results, rows = future.result()
+            if writer is not None:
+                finished_rows[futures[future]] = rows
+                while next_chunk in finished_rows:
+                    writer.extend(finished_rows.pop(next_chunk))
+                    next_chunk += 1
+            for result in results:
+                yield result
+    finally:
+        if executor is None:
+            pool.shutdown()
+
+
+def run_simulations(initial_state, target, n_sims, workers=None, seed=None, MAX_NUMBER_OF_NODES=None, n_iterations=100, chunksize=None, output_folder=None, trajectory_path=None, trajectory_mode='w', profile=False, cycle_limit=None, antithetic=False, policy=None):
+    """ Run n_sims simulations, optionally spread over a pool of worker processes.
+
+    Simulation j is always driven by the j-th child of SeedSequence(seed), so for a given master seed
+    the results are identical whatever the number of workers.
+
+    Args:
+        initial_state (State): State every simulation starts from
+        target (list): Target allocation of workloads per type and AZ
+        n_sims (int): Number of simulations
+        workers (int, optional): Number of worker processes, None or 1 runs in this process. Defaults to None.
+        seed (int, optional): Master seed. Defaults to None, fresh entropy.
+        MAX_NUMBER_OF_NODES (int, optional): Defaults to initial_state.MAX_NUMBER_OF_NODES.
+        n_iterations (int, optional): Maximum number of iterations per simulation. Defaults to 100.
+        chunksize (int, optional): Simulations per task sent to a worker. Defaults to n_sims / (8 * workers).
+        output_folder (str, optional): Folder to write one trajectory file per simulation to. Defaults to None.
+        trajectory_path (str, optional): .npy file collecting one record per iteration of every simulation, in simulation order. Defaults to None.
+        trajectory_mode (str, optional): 'w' overwrites trajectory_path, 'a' appends to it. Defaults to 'w'.
+        profile (bool, optional): Profile every simulation and put the campaign totals in df.attrs['profile']. Defaults to False.
+        cycle_limit (int, optional): Stop a simulation as 'cyclic' once it revisits a configuration that often. Defaults to None.
+        antithetic (bool, optional): Use the antithetic streams of the seeds, see RandomStream. Defaults to False.
+        policy (str, optional): Scheduling policy, a name of scheduling.POLICIES. Defaults to None, the policy of initial_state.
+
+    Returns:
+        pandas.DataFrame: One row per simulation, ordered by simulation index
+    """
+    import pandas as pd
+
+    results = sorted(
+        iter_simulations(
+            initial_state, target, n_sims, workers, seed, MAX_NUMBER_OF_NODES, n_iterations, chunksize,
+            output_folder, trajectory_path, trajectory_mode, profile, cycle_limit, first=0, antithetic=antithetic, policy=policy
+        ),
+        key=lambda result: result['iteration']
+    )
+    df = pd.DataFrame(results, columns=['iteration', 'Steps', 'nodes', 'time', 'verdict'])
+    if profile:
+        campaign = Profile()
+        for result in results:
+            campaign.merge(result['profile'])
+        df.attrs['profile'] = campaign.to_dict()
+    return df
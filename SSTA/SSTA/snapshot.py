@@ -0,0 +1,104 @@
+"""Copy-on-write state checkpoints.
+
+A Trajectory keeps one base State plus, per iteration, the deltas the State journaled during that
+iteration (added/removed nodes and workloads, evictions, allocations). Any iteration can be
+reconstructed on demand by replaying the deltas on a copy of the nearest checkpoint, and a new
+simulation can be forked from any iteration without deep-copying the whole history.
+"""
+import json
+
+from SSTA.components import Node, State, Workload
+
+
+class Trajectory():
+    def __init__(self, base_state, checkpoint_interval=None):
+        """
+        Args:
+            base_state (State): State at iteration 0, it is copied
+            checkpoint_interval (int, optional): Keep a full copy every this many iterations, which bounds
+                the replay cost of state_at. Defaults to None, only the base state is kept.
+        """
+        self.base = base_state.copy()
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = {}
+        self.deltas = []
+        self.times = []
+
+    def record(self, state):
+        """ Start journaling the changes made to state, which should be equal to the base state """
+        state.start_journal()
+
+    def commit(self, state, deltas=None):
+        """ Close the current iteration: store the deltas journaled on state since the last commit,
+        or the given deltas when the caller already popped them from the journal.
+        """
+        self.deltas.append(state.pop_journal() if deltas is None else deltas)
+        self.times.append(state.time)
+        if self.checkpoint_interval and len(self.deltas) % self.checkpoint_interval == 0:
+            self.checkpoints[len(self.deltas)] = state.copy()
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def state_at(self, iteration):
+        """ Reconstruct the state after `iteration` committed iterations (0 is the base state) """
+        if iteration < 0 or iteration > len(self.deltas):
+            raise IndexError("iteration {} is not in this trajectory of {} iterations".format(iteration, len(self.deltas)))
+        start = max([checkpoint for checkpoint in self.checkpoints if checkpoint <= iteration], default=0)
+        state = self.checkpoints[start].copy() if start else self.base.copy()
+        for deltas in self.deltas[start:iteration]:
+            state.apply_deltas(deltas)
+        if iteration:
+            state.time = self.times[iteration - 1]
+        return state
+
+    def fork(self, iteration, rng=None):
+        """ Start an independent simulation from the state after `iteration` iterations """
+        state = self.state_at(iteration)
+        if rng is not None:
+            state.set_rng(rng)
+        return state
+
+    # Persistence
+    def to_dict(self):
+        base = self.base
+        return {
+            'base': {
+                'time': base.time,
+                'AZs': base.AZs,
+                'MAX_NUMBER_OF_NODES': base.MAX_NUMBER_OF_NODES,
+                'MAX_WORKLOAD_ID': getattr(base, 'MAX_WORKLOAD_ID', None),
+                'nodes': [[node.id, node.AZ, node.state] for node in base.nodes],
+                'workloads': [[workload.id, workload.type, workload.AZ, workload.state, workload.node] for workload in base.workloads],
+            },
+            'times': self.times,
+            'deltas': self.deltas,
+        }
+
+    def save(self, path):
+        """ Write the whole trajectory to a single JSON file """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            record = json.load(f)
+
+        base = record['base']
+        nodes = [Node(id=id, AZ=AZ, state=state) for id, AZ, state in base['nodes']]
+        workloads = []
+        for id, workload_type, AZ, state, node in base['workloads']:
+            workload = Workload(id=id, workload_type=workload_type, AZ=AZ, state=state)
+            workload.node = node
+            workloads += [workload]
+        state = State(
+            nodes=nodes, workloads=workloads, start_time=base['time'], AZs=base['AZs'],
+            MAX_NUMBER_OF_NODES=base['MAX_NUMBER_OF_NODES']
+        )
+        state.MAX_WORKLOAD_ID = base['MAX_WORKLOAD_ID']
+
+        trajectory = cls(state)
+        trajectory.times = record['times']
+        trajectory.deltas = [[tuple(delta) for delta in deltas] for deltas in record['deltas']]
+        return trajectory
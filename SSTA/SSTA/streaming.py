@@ -0,0 +1,179 @@
+"""Streaming statistics for Monte Carlo campaigns.
+
+Results are folded into running aggregates as they arrive, so memory stays constant however many
+simulations are run: Welford running mean and variance, fixed-width histograms (for quantiles) of
+steps, time and final node count, and the non-convergence rate. `run_until_precise` keeps launching
+batches of simulations until the confidence interval of a metric is narrower than a tolerance.
+"""
+import math
+
+from SSTA.simulation import iter_simulations, simulation_pool
+
+
+# Two-sided normal quantiles for the usual confidence levels
+Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600, 0.98: 2.3263, 0.99: 2.5758, 0.999: 3.2905}
+
+
+class RunningStats():
+    """ Running count, mean and variance (Welford's algorithm) """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """ Combine with the statistics of another stream (Chan et al.) """
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else float('nan')
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def half_width(self, confidence=0.95):
+        """ Half width of the normal confidence interval of the mean """
+        if self.count < 2:
+            return float('inf')
+        return Z_SCORES[confidence] * self.std / math.sqrt(self.count)
+
+    def to_dict(self, confidence=0.95):
+        return {'count': self.count, 'mean': self.mean if self.count else None, 'std': self.std if self.count > 1 else None,
+                'half_width': self.half_width(confidence)}
+
+
+class Histogram():
+    """ Counts per fixed-width bin, memory is bounded by the range of the values, not their number """
+    def __init__(self, bin_width=1):
+        self.bin_width = bin_width
+        self.counts = {}
+        self.count = 0
+
+    def add(self, value):
+        b = int(value // self.bin_width)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.count += 1
+
+    def quantile(self, q):
+        """ Lower edge of the bin holding the q-quantile """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen > rank:
+                return b * self.bin_width
+        return max(self.counts) * self.bin_width
+
+    def to_dict(self):
+        return {b * self.bin_width: count for b, count in sorted(self.counts.items())}
+
+
+class CampaignStatistics():
+    """ Online aggregate of the result dicts of run_simulation.
+
+    Steps are aggregated over the simulations that converged. The non-convergence rate is the mean of
+    a 0/1 indicator, so it gets a confidence interval like the other metrics.
+    """
+    METRICS = ['Steps', 'time', 'nodes', 'non_convergence']
+
+    def __init__(self, time_bin_width=60):
+        self.stats = {metric: RunningStats() for metric in self.METRICS}
+        self.histograms = {'Steps': Histogram(), 'time': Histogram(time_bin_width), 'nodes': Histogram()}
+
+    def add(self, result):
+        if result['Steps'] is not None:
+            self.stats['Steps'].add(result['Steps'])
+            self.histograms['Steps'].add(result['Steps'])
+        for metric in ('time', 'nodes'):
+            self.stats[metric].add(result[metric])
+            self.histograms[metric].add(result[metric])
+        self.stats['non_convergence'].add(1.0 if result['Steps'] is None else 0.0)
+
+    @property
+    def count(self):
+        return self.stats['non_convergence'].count
+
+    def summary(self, confidence=0.95, quantiles=(0.05, 0.5, 0.95)):
+        summary = {'simulations': self.count}
+        for metric, stats in self.stats.items():
+            summary[metric] = stats.to_dict(confidence)
+            if metric in self.histograms:
+                summary[metric]['quantiles'] = {q: self.histograms[metric].quantile(q) for q in quantiles}
+        return summary
+
+
+def run_until_precise(initial_state, target, metric='Steps', tolerance=1.0, confidence=0.95, batch_size=100,
+                      min_sims=100, max_sims=100000, workers=None, seed=None, statistics=None, on_batch=None, **simulation_options):
+    """ Run batches of simulations until the confidence interval of the mean of metric is narrower than tolerance.
+
+    Simulation j is seeded as in run_simulations, so the first n simulations are the same as those of
+    run_simulations(..., n_sims=n, seed=seed). All batches run on one pool of worker processes.
+
+    Args:
+        initial_state (State): State every simulation starts from
+        target (list): Target allocation of workloads per type and AZ
+        metric (str, optional): 'Steps', 'time', 'nodes' or 'non_convergence'. Defaults to 'Steps'.
+        tolerance (float, optional): Required half width of the confidence interval. Defaults to 1.0.
+        confidence (float, optional): Confidence level, a key of Z_SCORES. Defaults to 0.95.
+        batch_size (int, optional): Simulations launched between two checks. Defaults to 100.
+        min_sims (int, optional): Never stop before this many simulations. Defaults to 100.
+        max_sims (int, optional): Stop after this many simulations, even if not precise enough. Defaults to 100000.
+        workers (int, optional): Worker processes. Defaults to None.
+        seed (int, optional): Master seed. Defaults to None.
+        statistics (CampaignStatistics, optional): Aggregate to continue from. Defaults to a new one.
+        on_batch (callable, optional): Called with the result dicts of every batch, ordered by simulation
+            index, e.g. to write them out. Defaults to None.
+        **simulation_options: n_iterations, MAX_NUMBER_OF_NODES, cycle_limit, ... see run_simulations. With a
+            trajectory_path, trajectory_mode applies to the first batch and the other batches append to the file
+
+    Returns:
+        CampaignStatistics: The aggregate, its summary() has the estimates
+    """
+    if metric not in CampaignStatistics.METRICS:
+        raise ValueError("metric should be one of {}".format(', '.join(CampaignStatistics.METRICS)))
+    if confidence not in Z_SCORES:
+        raise ValueError("confidence should be one of {}".format(', '.join(map(str, Z_SCORES))))
+    statistics = statistics if statistics is not None else CampaignStatistics()
+    trajectory_mode = simulation_options.pop('trajectory_mode', 'w')
+    executor = None
+    if workers and workers > 1:
+        pool_options = {name: value for name, value in simulation_options.items() if name != 'chunksize'}
+        executor = simulation_pool(initial_state, target, workers, **pool_options)
+
+    try:
+        while statistics.count < max_sims:
+            precise = statistics.stats[metric].half_width(confidence) <= tolerance
+            if statistics.count >= min_sims and precise:
+                break
+            n_sims = min(batch_size, max_sims - statistics.count)
+            results = sorted(
+                iter_simulations(initial_state, target, n_sims, seed=seed, first=statistics.count, executor=executor,
+                                 trajectory_mode=trajectory_mode, **simulation_options),
+                key=lambda result: result['iteration']
+            )
+            trajectory_mode = 'a'
+            for result in results:
+                statistics.add(result)
+            if on_batch is not None:
+                on_batch(results)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return statistics
@@ -0,0 +1,186 @@
+"""Parameter sweeps with an on-disk result cache.
+
+A scenario is a dict with the settings of stability.py:
+
+    {
+        'AZs': [...], 'INITIAL_NODE_ALLCATION_PER_AZ': [...], 'INITIAL_WORKLOAD_TYPE_PER_AZ': [...],
+        'TARGET_WORKLOAD_NODE_ALLOCATION': [...], 'MAX_NUMBER_OF_NODES': 15,
+        'times': {'add_node_time': 600, ...},       # optional, passed to State.set_times
+        'n_sims': 10, 'n_iterations': 100, 'cycle_limit': None,
+        'policy': 'random'                          # optional, a name of scheduling.POLICIES
+    }
+
+The results of a scenario are stored under the hash of (scenario, seed, code version), where the code
+version is a hash of the SSTA sources. Re-running or extending a sweep only computes the scenarios
+that are not in the cache yet, and an interrupted sweep resumes where it stopped, as every scenario is
+written to the cache as soon as it completes.
+"""
+import copy
+import hashlib
+import itertools
+import json
+import os
+
+from SSTA.components import State
+from SSTA.simulation import iter_simulations
+
+
+DEFAULTS = {'times': {}, 'n_sims': 10, 'n_iterations': 100, 'cycle_limit': None, 'policy': 'random'}
+
+_code_version = None
+
+
+def code_version():
+    """ Hash of the sources of the SSTA package, cached results of other code versions are not reused """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        root = os.path.dirname(os.path.abspath(__file__))
+        for folder, folders, files in os.walk(root):
+            folders[:] = sorted(f for f in folders if f != '__pycache__')
+            for name in sorted(f for f in files if f.endswith('.py')):
+                path = os.path.join(folder, name)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def grid(base, **axes):
+    """ Scenarios for every combination of the values of axes, on top of the base scenario.
+
+    Example:
+        grid(base, MAX_NUMBER_OF_NODES=[12, 15, 18], times=[{}, {'add_node_time': 300}])
+    """
+    names = list(axes)
+    scenarios = []
+    for values in itertools.product(*(axes[name] for name in names)):
+        scenario = copy.deepcopy(base)
+        scenario.update(zip(names, copy.deepcopy(values)))
+        scenarios += [scenario]
+    return scenarios
+
+
+def scenario_key(scenario, seed):
+    """ Content address of the results of a scenario """
+    scenario = dict(DEFAULTS, **scenario)
+    record = json.dumps({'scenario': scenario, 'seed': seed, 'code': code_version()}, sort_keys=True, default=str)
+    return hashlib.sha256(record.encode()).hexdigest()
+
+
+class ResultCache():
+    def __init__(self, folder='.ssta-cache'):
+        self.folder = folder
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key + '.json')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        with open(self.path(key)) as f:
+            return json.load(f)
+
+    def store(self, key, record):
+        # Write to a temporary file first, so an interrupted sweep never leaves a partial entry
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(record, f)
+        os.replace(temporary, path)
+
+
+def initial_state(scenario, seed=None):
+    """ State a scenario starts from """
+    scenario = dict(DEFAULTS, **scenario)
+    state = State(
+        AZs=scenario['AZs'],
+        INITIAL_NODE_ALLCATION_PER_AZ=scenario['INITIAL_NODE_ALLCATION_PER_AZ'],
+        INITIAL_WORKLOAD_TYPE_PER_AZ=scenario['INITIAL_WORKLOAD_TYPE_PER_AZ'],
+        MAX_NUMBER_OF_NODES=scenario['MAX_NUMBER_OF_NODES'],
+        rng=seed
+    )
+    state.set_times(**scenario['times'])
+    state.set_policy(scenario['policy'])
+    return state
+
+
+def run_scenario(scenario, seed=None, workers=None):
+    """ Run the simulations of one scenario, returns one result dict per simulation """
+    scenario = dict(DEFAULTS, **scenario)
+    results = iter_simulations(
+        initial_state=initial_state(scenario, seed),
+        target=scenario['TARGET_WORKLOAD_NODE_ALLOCATION'],
+        n_sims=scenario['n_sims'],
+        workers=workers,
+        seed=seed,
+        n_iterations=scenario['n_iterations'],
+        cycle_limit=scenario['cycle_limit']
+    )
+    return sorted(results, key=lambda result: result['iteration'])
+
+
+def summarize(results):
+    steps = [result['Steps'] for result in results if result['Steps'] is not None]
+    return {
+        'simulations': len(results),
+        'converged': len(steps) / len(results) if results else None,
+        'mean_steps': sum(steps) / len(steps) if steps else None,
+        'mean_time': sum(result['time'] for result in results) / len(results) if results else None,
+        'mean_nodes': sum(result['nodes'] for result in results) / len(results) if results else None,
+    }
+
+
+def iter_sweep(scenarios, seed=0, cache='.ssta-cache', workers=None, recompute=False):
+    """ Run every scenario that is not cached yet, yielding the row of each scenario as in run_sweep """
+    if not isinstance(cache, ResultCache):
+        cache = ResultCache(cache)
+
+    for scenario in scenarios:
+        key = scenario_key(scenario, seed)
+        cached = key in cache and not recompute
+        if cached:
+            record = cache.load(key)
+        else:
+            results = run_scenario(scenario, seed, workers)
+            record = {'scenario': scenario, 'seed': seed, 'code': code_version(), 'summary': summarize(results), 'results': results}
+            cache.store(key, record)
+        yield dict(key=key, cached=cached, **record['summary'], **_varying(scenario, scenarios))
+
+
+def run_sweep(scenarios, seed=0, cache='.ssta-cache', workers=None, recompute=False):
+    """ Run every scenario that is not cached yet and return a summary per scenario.
+
+    Args:
+        scenarios (list): Scenario dicts, see the module docstring and grid()
+        seed (int, optional): Master seed, shared by all scenarios. Defaults to 0.
+        cache (str or ResultCache, optional): Cache folder. Defaults to '.ssta-cache'.
+        workers (int, optional): Worker processes per scenario. Defaults to None.
+        recompute (bool, optional): Ignore cached results. Defaults to False.
+
+    Returns:
+        pandas.DataFrame: One row per scenario: its key, whether it came from the cache, the summary
+            of its results and the settings that vary between the scenarios
+    """
+    import pandas as pd
+
+    return pd.DataFrame(list(iter_sweep(scenarios, seed, cache, workers, recompute)))
+
+
+def load_results(key, cache='.ssta-cache'):
+    """ Per-simulation results of a cached scenario """
+    if not isinstance(cache, ResultCache):
+        cache = ResultCache(cache)
+    return cache.load(key)['results']
+
+
+def _varying(scenario, scenarios):
+    # The settings that differ between scenarios identify the rows of a sweep
+    return {
+        name: json.dumps(value, sort_keys=True) if isinstance(value, (dict, list)) else value
+        for name, value in scenario.items()
+        if any(other.get(name) != value for other in scenarios)
+    }
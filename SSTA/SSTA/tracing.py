@@ -0,0 +1,107 @@
+"""Tracing configuration.
+
+The SSTA modules log through the standard `logging` module, with %-style arguments so a message is
+only formatted when a handler will emit it. Nothing is configured on import: call `configure` to pick
+a mode and where records go.
+
+Modes:
+    off: nothing is logged below ERROR
+    summary: one INFO line per decision of the autoscaler and scheduler in iteration()
+    full: also DEBUG lines per node/workload change and a dump of the whole state after every iteration
+
+Worker processes of SSTA.simulation repeat the configuration of the parent (see `configuration`), with
+their own handles on the same files, and flush their buffered events after every chunk of simulations.
+"""
+import json
+import logging
+
+
+MODES = {'off': logging.ERROR, 'summary': logging.INFO, 'full': logging.DEBUG}
+LOG_FORMAT = '[%(asctime)s] p%(process)s:%(threadName)-4s - Func: %(funcName)-24s - %(filename)s@%(lineno)-2s - %(levelname)-8s - %(message)s'
+
+logger = logging.getLogger('SSTA')
+
+# Arguments of the last call to configure, for worker processes
+_configuration = None
+
+
+class JSONLinesHandler(logging.Handler):
+    """ Buffered structured event sink: one JSON object per record, written in bulk.
+
+    The message template and its arguments are stored as they are, so the text of a message is
+    never built during the simulation.
+    """
+    def __init__(self, filename, capacity=4096):
+        super().__init__()
+        self.filename = filename
+        self.capacity = capacity
+        self.buffer = []
+        self.stream = open(filename, 'a', encoding='utf-8')
+
+    def emit(self, record):
+        self.buffer.append({
+            'time': record.created, 'process': record.process, 'level': record.levelname,
+            'logger': record.name, 'function': record.funcName, 'message': record.msg,
+            'args': list(record.args) if isinstance(record.args, tuple) else record.args,
+        })
+        if len(self.buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                self.stream.write(''.join(json.dumps(event, default=str) + '\n' for event in self.buffer))
+                self.stream.flush()
+                self.buffer = []
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+        super().close()
+
+
+def configure(mode='summary', filename=None, events=None, capacity=4096):
+    """ Configure tracing for all SSTA modules, replacing a previous configuration.
+
+    Args:
+        mode (str, optional): 'off', 'summary' or 'full'. Defaults to 'summary'.
+        filename (str, optional): Text log file, in the format of the original simulation.log. Defaults to None.
+        events (str, optional): JSON Lines file receiving structured, buffered events. Defaults to None.
+        capacity (int, optional): Number of events buffered before they are written. Defaults to 4096.
+    """
+    global _configuration
+    if mode not in MODES:
+        raise ValueError("mode should be one of {}".format(', '.join(MODES)))
+    _configuration = {'mode': mode, 'filename': filename, 'events': events, 'capacity': capacity}
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    logger.setLevel(MODES[mode])
+    if filename:
+        handler = logging.FileHandler(filename, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    if events:
+        logger.addHandler(JSONLinesHandler(events, capacity=capacity))
+    logger.propagate = not logger.handlers
+
+
+def configuration():
+    """ Arguments of the last call to configure, None if tracing was never configured """
+    return dict(_configuration) if _configuration is not None else None
+
+
+def flush():
+    """ Write the buffered events of the handlers installed by configure """
+    for handler in logger.handlers:
+        handler.flush()
+
+
+def shutdown():
+    """ Flush and close the handlers installed by configure """
+    configure('off')
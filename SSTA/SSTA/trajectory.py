@@ -0,0 +1,158 @@
+"""Bulk trajectory output.
+
+A TrajectoryWriter buffers one record per simulated iteration (time, node counts per AZ, workload
+counts per type and AZ, actions taken) in a NumPy structured array and flushes it in bulk to a single
+.npy file per batch. Records are appended in place, so the file can be extended by later flushes or
+later runs, and it is read back with a single memory-mapped np.load.
+"""
+import numpy as np
+import os
+
+
+ACTIONS = ['added_nodes', 'removed_nodes', 'evictions', 'allocations']
+
+
+def trajectory_dtype(n_AZs, n_types):
+    return np.dtype(
+        [('simulation', np.int64), ('iteration', np.int64), ('time', np.float64), ('done', np.bool_),
+         ('free_nodes', np.int64, (n_AZs,)), ('busy_nodes', np.int64, (n_AZs,)),
+         ('workloads', np.int64, (n_types, n_AZs)), ('scheduled_workloads', np.int64, (n_types, n_AZs))] +
+        [(action, np.int64) for action in ACTIONS]
+    )
+
+
+def count_actions(deltas):
+    """ Count the actions in the deltas journaled by a State during one iteration """
+    actions = dict.fromkeys(ACTIONS, 0)
+    # An evicted workload that is removed as well is journaled twice, count it once, on its removal
+    removed = {delta[1] for delta in deltas if delta[0] == 'remove_workload'}
+    for delta in deltas:
+        if delta[0] == 'add_node':
+            actions['added_nodes'] += 1
+        elif delta[0] == 'remove_node':
+            actions['removed_nodes'] += 1
+        elif delta[0] == 'remove_workload':
+            actions['evictions'] += 1
+        elif delta[0] == 'workload':
+            if delta[2] is not None:
+                actions['allocations'] += 1
+            elif delta[1] not in removed:
+                actions['evictions'] += 1
+    return actions
+
+
+class TrajectoryWriter():
+    def __init__(self, path, AZs, workload_types, mode='w', buffer_size=65536):
+        """
+        Args:
+            path (str): .npy file to write to, None keeps all records in memory (see rows())
+            AZs (list): AZs, in column order
+            workload_types (list): Workload types, in row order
+            mode (str, optional): 'w' truncates an existing file, 'a' appends to it. Defaults to 'w'.
+            buffer_size (int, optional): Number of records buffered between flushes. Defaults to 65536.
+        """
+        if mode not in ('w', 'a'):
+            raise ValueError("mode should be 'w' or 'a'")
+        self.path = path
+        self.AZs = list(AZs)
+        self.workload_types = list(workload_types)
+        self.dtype = trajectory_dtype(len(self.AZs), len(self.workload_types))
+        self._buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self._size = 0
+        self._flushed = []
+        if path and mode == 'w' and os.path.exists(path):
+            os.remove(path)
+
+    def record(self, simulation, iteration, state, done=False, actions=None):
+        """ Buffer the aggregate configuration of state after an iteration """
+        if self._size == len(self._buffer):
+            self.flush()
+        row = self._buffer[self._size]
+        row['simulation'] = simulation
+        row['iteration'] = iteration
+        row['time'] = state.time
+        row['done'] = done
+        for column, AZ in enumerate(self.AZs):
+            row['free_nodes'][column] = len(state.get_free_nodes_in_az(AZ))
+            row['busy_nodes'][column] = state.count_scheduled_workloads_az(AZ)
+            for type_row, workload_type in enumerate(self.workload_types):
+                row['workloads'][type_row, column] = state.count_workloads_type_az(workload_type, AZ)
+                row['scheduled_workloads'][type_row, column] = state.count_scheduled_workloads_type_az(workload_type, AZ)
+        for action, count in (actions or {}).items():
+            row[action] = count
+        self._size += 1
+
+    def extend(self, rows):
+        """ Buffer records produced by another writer, e.g. an in-memory writer of a worker process """
+        self.flush()
+        if self.path:
+            _append_rows(self.path, rows.astype(self.dtype, copy=False))
+        else:
+            self._flushed += [rows]
+
+    def flush(self):
+        if self._size == 0:
+            return
+        rows = self._buffer[:self._size].copy()
+        self._size = 0
+        if self.path:
+            _append_rows(self.path, rows)
+        else:
+            self._flushed += [rows]
+
+    def rows(self):
+        """ All records of an in-memory writer """
+        self.flush()
+        return np.concatenate(self._flushed) if self._flushed else np.zeros(0, dtype=self.dtype)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_trajectory(path):
+    """ Memory-map the records of a trajectory file """
+    return np.load(path, mmap_mode='r')
+
+
+def _header(dtype, length):
+    return "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(np.lib.format.dtype_to_descr(dtype), length)
+
+
+def _append_rows(path, rows):
+    if not os.path.exists(path):
+        # Pad the header so later appends can rewrite the row count in place
+        header = _header(rows.dtype, 0)
+        header_length = 64 * ((12 + len(header) + 32) // 64 + 1) - 12
+        with open(path, 'wb') as f:
+            f.write(np.lib.format.magic(2, 0))
+            f.write(np.uint32(header_length).tobytes())
+            f.write(header.ljust(header_length - 1).encode('latin1') + b'\n')
+
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            prefix = 10
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            prefix = 12
+        if dtype != rows.dtype:
+            raise Exception("The records do not match the layout of {}".format(path))
+        header_length = f.tell() - prefix
+
+        header = _header(dtype, shape[0] + len(rows))
+        if len(header) + 1 > header_length:
+            # The row count outgrew the header padding: rewrite the whole file
+            existing = np.load(path)
+            np.save(path, np.concatenate([existing, rows]))
+            return
+        f.seek(prefix)
+        f.write(header.ljust(header_length - 1).encode('latin1') + b'\n')
+        f.seek(0, os.SEEK_END)
+        f.write(rows.tobytes())
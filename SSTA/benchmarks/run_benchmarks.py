@@ -0,0 +1,223 @@
+"""Benchmark suite for SSTA.
+
+Times the hot operations of a simulation over a grid of cluster sizes (nodes, workloads, AZs and
+workload types), writes the timings as JSON and optionally compares them against a stored baseline.
+For every benchmark the scaling exponents in the number of nodes and in the number of workloads are
+estimated from log-log fits, so an accidental O(n^2) scan shows up as an exponent close to 2.
+
+The node axis keeps WORKLOADS_PER_NODE workloads per node, the workload axis varies the number of
+workloads at the middle node count. The convergence benchmarks run until the state is stable, at
+most CONVERGENCE_ITERATIONS iterations per node and workload, and report the steps they took (None
+when the cap was hit).
+
+Usage:
+    python benchmarks/run_benchmarks.py --output benchmarks.json
+    python benchmarks/run_benchmarks.py --output new.json --baseline benchmarks.json --tolerance 1.5
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SSTA.components import State  # noqa: E402
+from SSTA.helpers import allocation_diff  # noqa: E402
+from SSTA.kernel import run_kernel  # noqa: E402
+from SSTA.main import iteration  # noqa: E402
+from SSTA.simulation import run_simulation  # noqa: E402
+
+
+NODES = [100, 1000, 5000]
+WORKLOADS = [100, 400, 1600]
+AZS = [1, 3, 9]
+TYPES = [1, 3, 9]
+WORKLOADS_PER_NODE = 0.8
+CONVERGENCE_ITERATIONS = 4
+
+
+def build_case(n_nodes, n_workloads, n_AZs, n_types, seed=0):
+    """ Build an allocated state and a target with one less workload per type and AZ """
+    AZs = ['AZ-{}'.format(i + 1) for i in range(n_AZs)]
+    workload_types = ['T{}'.format(i + 1) for i in range(n_types)]
+    per_cell = max(1, n_workloads // (n_AZs * n_types))
+    initial = [{'type': t, 'AZ': AZ, 'count': per_cell} for t in workload_types for AZ in AZs]
+    target = [{'type': t, 'AZ': AZ, 'count': per_cell - 1} for t in workload_types for AZ in AZs]
+    node_allocation = [n_nodes // n_AZs] * n_AZs
+    state = State(
+        AZs=AZs, INITIAL_NODE_ALLCATION_PER_AZ=node_allocation, INITIAL_WORKLOAD_TYPE_PER_AZ=initial,
+        MAX_NUMBER_OF_NODES=2 * max(n_nodes, n_workloads), rng=seed
+    )
+    return state, target
+
+
+def convergence_cap(state):
+    # Every iteration removes at most one free node, or adds one for a pending workload
+    return CONVERGENCE_ITERATIONS * (state.count_nodes() + state.count_workloads())
+
+
+def _with_pending(state):
+    # Send about a tenth of the workloads back to pending, with the free nodes to take them
+    state.remove_node(number=max(1, state.count_workloads() // 10))
+    for AZ in state.AZs:
+        state.add_node(AZ=AZ)
+    return state
+
+
+def _evict(state):
+    cell = state.get_scheduled_type_az_allocation()[0]
+    state.evict_workload_by_type_and_az(cell['type'], cell['AZ'], number=max(1, cell['count'] // 10))
+
+
+# name: (setup(state, target) -> argument, timed(argument, target))
+BENCHMARKS = {
+    'allocation_diff': (
+        lambda state, target: state.get_scheduled_type_az_allocation(),
+        lambda allocation, target: allocation_diff(allocation, target)
+    ),
+    'iteration': (
+        lambda state, target: state.copy(),
+        lambda state, target: iteration(state, target, state.MAX_NUMBER_OF_NODES, 0)
+    ),
+    'update_workload_node_allocation': (
+        lambda state, target: _with_pending(state.copy()),
+        lambda state, target: state.update_workload_node_allocation()
+    ),
+    'evict_workload_by_type_and_az': (
+        lambda state, target: state.copy(),
+        lambda state, target: _evict(state)
+    ),
+    'remove_node': (
+        lambda state, target: state.copy(),
+        lambda state, target: state.remove_node(number=max(1, state.count_nodes() // 100))
+    ),
+    'convergence': (
+        lambda state, target: state,
+        lambda state, target: run_simulation(state, target, state.MAX_NUMBER_OF_NODES, convergence_cap(state), seed=0)
+    ),
+    'kernel_convergence': (
+        lambda state, target: state,
+        lambda state, target: run_kernel(state, target, state.MAX_NUMBER_OF_NODES, 1, convergence_cap(state), seed=0)
+    ),
+}
+
+
+def time_benchmark(name, state, target, repeats):
+    """ Best of `repeats` timings, each on a fresh argument so no run sees the effects of another.
+    Returns the timing and the value returned by the last run.
+    """
+    setup, timed = BENCHMARKS[name]
+    timings = []
+    for _ in range(repeats):
+        argument = setup(state, target)
+        start = time.perf_counter()
+        value = timed(argument, target)
+        timings += [time.perf_counter() - start]
+    return min(timings), value
+
+
+def grid(nodes, workloads, AZs, types):
+    """ (nodes, workloads, AZs, types) cases: node scaling at WORKLOADS_PER_NODE, 3 AZs and 3 types,
+    plus workload, AZ and type scaling at the middle node count
+    """
+    cases = [(n, int(n * WORKLOADS_PER_NODE), 3, 3) for n in nodes]
+    middle = nodes[len(nodes) // 2]
+    middle_workloads = int(middle * WORKLOADS_PER_NODE)
+    cases += [(middle, w, 3, 3) for w in workloads if w != middle_workloads]
+    cases += [(middle, middle_workloads, a, 3) for a in AZs if a != 3]
+    cases += [(middle, middle_workloads, 3, t) for t in types if t != 3]
+    return cases
+
+
+def _exponent(points):
+    x, y = np.log([p[0] for p in points]), np.log([max(p[1], 1e-9) for p in points])
+    return round(float(np.polyfit(x, y, 1)[0]), 3)
+
+
+def scaling_exponents(results, nodes):
+    """ Slopes of log(seconds) against log(nodes) and against log(workloads) per benchmark, at 3 AZs and 3 types """
+    middle = nodes[len(nodes) // 2]
+    exponents = {'nodes': {}, 'workloads': {}}
+    for name in BENCHMARKS:
+        cases = [r for r in results if r['benchmark'] == name and r['AZs'] == 3 and r['types'] == 3]
+        node_points = [(r['nodes'], r['seconds']) for r in cases if r['workloads'] == int(r['nodes'] * WORKLOADS_PER_NODE)]
+        workload_points = [(r['workloads'], r['seconds']) for r in cases if r['nodes'] == middle]
+        if len(node_points) > 1:
+            exponents['nodes'][name] = _exponent(node_points)
+        if len(workload_points) > 1:
+            exponents['workloads'][name] = _exponent(workload_points)
+    return exponents
+
+
+def run(nodes=NODES, workloads=WORKLOADS, AZs=AZS, types=TYPES, repeats=3, benchmarks=None):
+    results = []
+    for n_nodes, n_workloads, n_AZs, n_types in grid(nodes, workloads, AZs, types):
+        state, target = build_case(n_nodes, n_workloads, n_AZs, n_types)
+        for name in benchmarks or BENCHMARKS:
+            seconds, value = time_benchmark(name, state, target, repeats)
+            result = {
+                'benchmark': name, 'nodes': n_nodes, 'workloads': n_workloads,
+                'AZs': n_AZs, 'types': n_types, 'seconds': seconds
+            }
+            line = '{:<32} nodes={:<6} workloads={:<6} AZs={:<2} types={:<2} {:>10.6f}s'.format(name, n_nodes, n_workloads, n_AZs, n_types, seconds)
+            if name.endswith('convergence'):
+                # run_simulation returns one result, run_kernel a list of one
+                result['steps'] = (value[0] if isinstance(value, list) else value)['Steps']
+                line += '  steps={}'.format(result['steps'])
+            results += [result]
+            print(line)
+    return {
+        'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results,
+        'scaling': scaling_exponents(results, nodes)
+    }
+
+
+def compare(report, baseline, tolerance=1.5):
+    """ Benchmarks that got more than `tolerance` times slower than in the baseline """
+    def key(result):
+        return (result['benchmark'], result['nodes'], result['workloads'], result['AZs'], result['types'])
+
+    reference = {key(result): result['seconds'] for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = reference.get(key(result))
+        if before and result['seconds'] > tolerance * before:
+            regressions += [dict(result, baseline=before, ratio=result['seconds'] / before)]
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the SSTA hot paths over a grid of cluster sizes")
+    parser.add_argument('--output', default='benchmarks.json', help="JSON file to write the results to")
+    parser.add_argument('--baseline', help="JSON file written by an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="Slowdown ratio reported as a regression")
+    parser.add_argument('--nodes', type=int, nargs='+', default=NODES)
+    parser.add_argument('--workloads', type=int, nargs='+', default=WORKLOADS, help="Workload counts at the middle node count")
+    parser.add_argument('--azs', type=int, nargs='+', default=AZS)
+    parser.add_argument('--types', type=int, nargs='+', default=TYPES)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--benchmark', action='append', choices=sorted(BENCHMARKS), help="Only run these benchmarks")
+    args = parser.parse_args(argv)
+
+    report = run(args.nodes, args.workloads, args.azs, args.types, args.repeats, args.benchmark)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Scaling exponents in the number of nodes: {}'.format(report['scaling']['nodes']))
+    print('Scaling exponents in the number of workloads: {}'.format(report['scaling']['workloads']))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for r in regressions:
+            print('REGRESSION {benchmark} nodes={nodes} workloads={workloads} AZs={AZs} types={types}: {seconds:.6f}s vs {baseline:.6f}s ({ratio:.2f}x)'.format(**r))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,19 +13,27 @@ with open('requirements.txt') as requirements_file:
 setup(
     author="Tom Kennes",
     author_email='tomkennes@skyworkz.nl',
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
+    entry_points={
+        'console_scripts': [
+            'ssta=SSTA.cli:main',
+        ],
+    },
     description="Simulations for assessing self-stability of a system with AWS Auto-Scaler and  Kubernetes Scheduler",
     install_requires=requirements,
+    extras_require={
+        'jit': ['numba'],
+        'markov': ['scipy'],
+    },
     license="MIT license",
     include_package_data=True,
     keywords='SSTA',
@@ -0,0 +1,32 @@
+import pytest
+
+from SSTA.components import State
+
+
+AZs = ['AZ-1', 'AZ-2', 'AZ-3']
+TARGET_WORKLOAD_NODE_ALLOCATION = [
+    {'type': workload_type, 'AZ': AZ, 'count': count}
+    for workload_type, counts in [('A', [3, 3, 3]), ('B', [1, 1, 0]), ('C', [1, 1, 0])]
+    for AZ, count in zip(AZs, counts)
+]
+
+
+@pytest.fixture
+def initial_state():
+    """ The scenario of stability.py """
+    return State(
+        AZs=AZs,
+        INITIAL_NODE_ALLCATION_PER_AZ=[5, 5, 5],
+        INITIAL_WORKLOAD_TYPE_PER_AZ=[
+            {'type': workload_type, 'AZ': AZ, 'count': count}
+            for workload_type, count in [('A', 3), ('B', 1), ('C', 1)]
+            for AZ in AZs
+        ],
+        MAX_NUMBER_OF_NODES=15,
+        rng=0
+    )
+
+
+@pytest.fixture
+def target():
+    return TARGET_WORKLOAD_NODE_ALLOCATION
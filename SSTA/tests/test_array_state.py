@@ -0,0 +1,32 @@
+import numpy as np
+
+from SSTA.components import ArrayState
+from SSTA.main import iteration
+from SSTA.simulation import run_simulations
+from SSTA.trajectory import load_trajectory
+
+
+def _configuration(state):
+    nodes = sorted((node.id, node.AZ, node.state) for node in state.nodes)
+    workloads = sorted((w.id, w.type, w.AZ, w.state, w.node) for w in state.workloads)
+    return nodes, workloads
+
+
+def test_fingerprint_and_journal_match_state(initial_state, target):
+    array = ArrayState.from_state(initial_state)
+    array.set_rng(1)
+    replayed = initial_state.copy()
+    array.start_journal()
+    for i in range(30):
+        array, done = iteration(array, target, 15, i)
+        replayed.apply_deltas(array.pop_journal())
+        assert _configuration(replayed) == _configuration(array)
+        assert array.fingerprint() == array.to_state().fingerprint() == replayed.fingerprint()
+
+
+def test_runs_like_state(tmp_path, initial_state, target):
+    options = dict(n_sims=30, seed=2, n_iterations=60, cycle_limit=3)
+    reference = run_simulations(initial_state, target, trajectory_path=str(tmp_path / 'state.npy'), **options)
+    arrays = run_simulations(ArrayState.from_state(initial_state), target, trajectory_path=str(tmp_path / 'array.npy'), **options)
+    assert reference.equals(arrays)
+    assert np.array_equal(load_trajectory(str(tmp_path / 'state.npy')), load_trajectory(str(tmp_path / 'array.npy')))
@@ -0,0 +1,20 @@
+import numpy as np
+
+from SSTA.batch import run_batch
+from SSTA.components import State
+from SSTA.simulation import run_simulation
+
+
+def test_fractional_durations_match_state():
+    # One workload too many on the single node: evict it, then remove the freed node
+    state = State(
+        AZs=['AZ-1'], INITIAL_NODE_ALLCATION_PER_AZ=[1], INITIAL_WORKLOAD_TYPE_PER_AZ=[{'type': 'A', 'AZ': 'AZ-1', 'count': 1}],
+        MAX_NUMBER_OF_NODES=2, rng=0
+    )
+    state.set_times(evict_workload_time=30.5, remove_node_time=120.25)
+    target = [{'type': 'A', 'AZ': 'AZ-1', 'count': 0}]
+
+    expected = run_simulation(state, target, 2, 10, seed=0)
+    assert expected['time'] == 2 * 30.5 + 120.25
+    for result in run_batch(state, target, 2, 3, 10, rng=np.random.default_rng(0)):
+        assert (result['Steps'], result['nodes'], result['time']) == (expected['Steps'], expected['nodes'], expected['time'])
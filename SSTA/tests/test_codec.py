@@ -0,0 +1,42 @@
+import gc
+import weakref
+
+from SSTA import codec
+from SSTA.components import State
+from SSTA.main import iteration
+
+
+def test_fractional_times_round_trip(initial_state, target):
+    initial_state.set_times(add_node_time=300.5, schedule_workload_time=0.25)
+    for i in range(5):
+        iteration(initial_state, target, 15, i)
+
+    state = State.from_bytes(initial_state.to_bytes())
+    assert state.time == initial_state.time
+    assert (state.ADD_NODE_TIME, state.SCHEDULE_WORKLOAD_TIME) == (300.5, 0.25)
+
+
+def test_decoded_arrays_outlive_the_map(tmp_path, initial_state, target):
+    for i in range(5):
+        iteration(initial_state, target, 15, i)
+    path = str(tmp_path / 'state.ssta')
+    codec.write(path, initial_state.to_bytes())
+
+    with codec.read(path) as buffer:
+        state = State.from_bytes(buffer)
+        header, names, nodes, workloads = codec.decode(buffer)
+    assert state.fingerprint() == initial_state.fingerprint()
+    assert header['n_nodes'] == len(initial_state.nodes)
+    assert nodes['id'].tolist() == [node.id for node in initial_state.nodes]
+    assert workloads['id'].tolist() == [workload.id for workload in initial_state.workloads]
+    assert not buffer.closed
+
+    weak_buffer = weakref.ref(buffer)
+    del buffer, nodes, workloads
+    gc.collect()
+    assert weak_buffer() is None
+
+    # Without views the map is closed with its block
+    with codec.read(path) as buffer:
+        State.from_bytes(buffer)
+    assert buffer.closed
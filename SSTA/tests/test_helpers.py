@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+
+from SSTA.helpers import allocation_diff
+
+
+def find_allocation(allocations, specific_allocation):
+    """ Reference lookup of the original allocation_diff """
+    allocations = [
+        allocation for allocation in allocations
+        if allocation['type'] == specific_allocation['type'] and allocation['AZ'] == specific_allocation['AZ']
+    ]
+    if len(allocations) > 1:
+        raise Exception("Too Many Exceptions were found! There seem to be duplicates")
+    elif len(allocations) == 0:
+        return {'type': specific_allocation['type'], 'AZ': specific_allocation['AZ'], 'count': 0}
+    return allocations[0]
+
+
+def reference_allocation_diff(current_allocation, target_allocation):
+    """ The original pairwise allocation_diff """
+    diffs = []
+    for allocation in target_allocation:
+        alloc = find_allocation(current_allocation, allocation)
+        diffs += [{'type': allocation['type'], 'AZ': allocation['AZ'], 'diff': allocation['count'] - alloc['count']}]
+    for allocation in current_allocation:
+        alloc = find_allocation(target_allocation, allocation)
+        diffs += [{'type': allocation['type'], 'AZ': allocation['AZ'], 'diff': alloc['count'] - allocation['count']}]
+    diffs = [json.loads(item) for item in set(json.dumps(diff) for diff in diffs)]
+    return [diff for diff in diffs if diff['diff'] != 0]
+
+
+def _random_allocation(rng):
+    cells = [(t, AZ) for t in 'ABC' for AZ in ['AZ-1', 'AZ-2', 'AZ-3']]
+    chosen = rng.choice(len(cells), size=rng.integers(0, len(cells) + 1), replace=False)
+    return [{'type': cells[i][0], 'AZ': cells[i][1], 'count': int(rng.integers(0, 4))} for i in chosen]
+
+
+def _key(diff):
+    return (diff['type'], diff['AZ'])
+
+
+def test_allocation_diff_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        current, target = _random_allocation(rng), _random_allocation(rng)
+        assert sorted(allocation_diff(current, target), key=_key) == sorted(reference_allocation_diff(current, target), key=_key)
+
+
+def test_allocation_diff_follows_target_order():
+    current = [{'type': 'C', 'AZ': 'AZ-1', 'count': 1}, {'type': 'A', 'AZ': 'AZ-1', 'count': 1}]
+    target = [{'type': 'B', 'AZ': 'AZ-1', 'count': 2}, {'type': 'A', 'AZ': 'AZ-1', 'count': 3}]
+    assert [_key(diff) for diff in allocation_diff(current, target)] == [('B', 'AZ-1'), ('A', 'AZ-1'), ('C', 'AZ-1')]
+
+
+def test_allocation_diff_rejects_duplicates():
+    duplicated = [{'type': 'A', 'AZ': 'AZ-1', 'count': 1}] * 2
+    with pytest.raises(Exception):
+        allocation_diff(duplicated, [])
@@ -0,0 +1,22 @@
+from SSTA.components import State
+from SSTA.kernel import check_equivalence, run_kernel
+
+
+def test_kernel_matches_reference_engine(initial_state, target):
+    comparison = check_equivalence(initial_state, target, 15, n_simulations=400, n_iterations=50, seed=0, workers=1)
+    assert comparison['equivalent'], comparison
+
+
+def test_kernel_keeps_fractional_durations(initial_state, target):
+    initial_state.set_times(add_node_time=300.5, evict_workload_time=0.25)
+    comparison = check_equivalence(initial_state, target, 15, n_simulations=400, n_iterations=50, seed=0, workers=1)
+    assert comparison['equivalent'], comparison
+
+    # One workload too many on the single node: evict it, then remove the freed node
+    state = State(
+        AZs=['AZ-1'], INITIAL_NODE_ALLCATION_PER_AZ=[1], INITIAL_WORKLOAD_TYPE_PER_AZ=[{'type': 'A', 'AZ': 'AZ-1', 'count': 1}],
+        MAX_NUMBER_OF_NODES=2, rng=0
+    )
+    state.set_times(evict_workload_time=30.5, remove_node_time=120.25)
+    results = run_kernel(state, [{'type': 'A', 'AZ': 'AZ-1', 'count': 0}], 2, 3, 10, seed=0)
+    assert [result['time'] for result in results] == [2 * 30.5 + 120.25] * 3
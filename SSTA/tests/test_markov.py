@@ -0,0 +1,37 @@
+import pytest
+
+from SSTA import markov
+from SSTA.components import State
+from SSTA.markov import MarkovChain
+
+
+def _single_node_state():
+    # One workload too many on the single node: evict it, then remove the freed node
+    state = State(
+        AZs=['AZ-1'], INITIAL_NODE_ALLCATION_PER_AZ=[1], INITIAL_WORKLOAD_TYPE_PER_AZ=[{'type': 'A', 'AZ': 'AZ-1', 'count': 1}],
+        MAX_NUMBER_OF_NODES=2, rng=0
+    )
+    return state, [{'type': 'A', 'AZ': 'AZ-1', 'count': 0}]
+
+
+def test_fractional_durations():
+    state, target = _single_node_state()
+    state.set_times(evict_workload_time=30.5, remove_node_time=120.25)
+    chain = MarkovChain.from_state(state, target)
+    solution = chain.solve()
+    assert solution['absorption_probability'] == 1.0
+    assert solution['expected_steps'] == 1.0
+    assert solution['expected_time'] == 2 * 30.5 + 120.25
+    assert chain.distribution(10)['time'] == {2 * 30.5 + 120.25: 1.0}
+
+
+def test_dense_solve_is_limited_by_memory(monkeypatch, initial_state, target):
+    try:
+        import scipy  # noqa: F401
+        pytest.skip("The dense solve only runs without scipy")
+    except ImportError:
+        pass
+    state, small_target = _single_node_state()
+    monkeypatch.setattr(markov, 'DENSE_BYTES', 0)
+    with pytest.raises(Exception, match='scipy'):
+        MarkovChain.from_state(state, small_target).solve()
@@ -0,0 +1,98 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from SSTA.components import State
+from SSTA.helpers import RandomStream
+from SSTA.scheduling import POLICIES, OldestNodePolicy, Policy, get_policy, sample_without_replacement
+
+
+def test_sample_without_replacement_is_uniform():
+    population, number, draws = 6, 3, 20000
+    rng = RandomStream(np.random.default_rng(0))
+    subsets = {subset: 0 for subset in itertools.combinations(range(population), number)}
+    for _ in range(draws):
+        indices = sample_without_replacement(population, number, rng)
+        assert len(set(indices)) == number
+        subsets[tuple(sorted(indices))] += 1
+
+    # Chi-square over the 20 subsets, 43.8 is the 0.999 quantile with 19 degrees of freedom
+    expected = draws / len(subsets)
+    chi_square = sum((count - expected) ** 2 / expected for count in subsets.values())
+    assert chi_square < 43.8
+
+
+def test_sample_without_replacement_edges():
+    rng = np.random.default_rng(0)
+    assert sorted(sample_without_replacement(4, 4, rng)) == [0, 1, 2, 3]
+    assert sample_without_replacement(4, 0, rng) == []
+    with pytest.raises(Exception):
+        sample_without_replacement(2, 3, rng)
+
+
+def _two_AZ_state(policy):
+    # AZ-1: nodes 1 and 2 busy, node 3 free. AZ-2: nodes 4 and 5 busy, one workload pending
+    state = State(
+        AZs=['AZ-1', 'AZ-2'], INITIAL_NODE_ALLCATION_PER_AZ=[3, 2],
+        INITIAL_WORKLOAD_TYPE_PER_AZ=[{'type': 'A', 'AZ': 'AZ-1', 'count': 2}, {'type': 'A', 'AZ': 'AZ-2', 'count': 3}],
+        MAX_NUMBER_OF_NODES=10, rng=0
+    )
+    state.set_policy(policy)
+    return state
+
+
+def _ids(nodes):
+    return [node.id for node in nodes]
+
+
+def test_get_policy():
+    assert type(get_policy()) is Policy
+    assert all(type(get_policy(name)) is POLICIES[name] for name in POLICIES)
+    policy = OldestNodePolicy()
+    assert get_policy(policy) is policy
+    with pytest.raises(Exception):
+        get_policy('largest-first')
+
+
+def test_random_policy_covers_every_choice():
+    state = _two_AZ_state('random')
+    removed, drained, AZs = set(), set(), set()
+    for _ in range(200):
+        nodes = state.policy.removal_nodes(state, 2)
+        assert len(set(_ids(nodes))) == 2
+        removed.update(_ids(nodes))
+        drained.add(state.policy.drain_node(state, state.nodes[:3]).id)
+        AZs.add(state.policy.scale_up_AZ(state))
+    assert removed == {1, 2, 3, 4, 5}
+    assert drained == {1, 2, 3}
+    assert AZs == {'AZ-1', 'AZ-2'}
+
+
+def test_least_utilized_policy():
+    state = _two_AZ_state('least-utilized')
+    state.add_node('AZ-2')
+    assert _ids(state.policy.removal_nodes(state, 4)) == [3, 6, 1, 2]
+    state.evict_workload_by_type_and_az('A', 'AZ-1')
+    freed = 1 if state.nodes[0].state == 'free' else 2
+    assert _ids(state.policy.removal_nodes(state, 4)) == sorted([freed, 3, 6]) + [3 - freed]
+    assert state.policy.drain_node(state, state.get_free_nodes()).id == freed
+
+
+def test_oldest_node_policy():
+    state = _two_AZ_state('oldest-node')
+    assert _ids(state.policy.removal_nodes(state, 3)) == [1, 2, 3]
+    state.remove_node_by_id(1)
+    assert _ids(state.policy.removal_nodes(state, 3)) == [2, 3, 4]
+    state.add_node('AZ-1')
+    assert state.policy.drain_node(state, state.get_free_nodes()).id == 3
+
+
+def test_most_deficit_policy():
+    state = _two_AZ_state('most-deficit')
+    # Deficits: AZ-1 has 0 pending and 1 free node, AZ-2 has 1 pending and no free node
+    assert {state.policy.scale_up_AZ(state) for _ in range(50)} == {'AZ-2'}
+    state.add_node('AZ-2')
+    state.add_workload('A', 'AZ-1')
+    # Both deficits are now 0, ties are broken at random
+    assert {state.policy.scale_up_AZ(state) for _ in range(50)} == {'AZ-1', 'AZ-2'}
@@ -0,0 +1,45 @@
+from SSTA.components import State
+from SSTA.simulation import run_simulation
+from SSTA.snapshot import Trajectory
+
+
+def _first_revisit(trajectory):
+    # Number of iterations after which the configuration of an earlier iteration, or the initial one, comes back
+    seen = set()
+    for i in range(len(trajectory) + 1):
+        fingerprint = trajectory.state_at(i).fingerprint()
+        if fingerprint in seen:
+            return i
+        seen.add(fingerprint)
+    return None
+
+
+def _check_cycle_limit(folder, initial_state, target, MAX_NUMBER_OF_NODES, seeds):
+    """ Run every seed with cycle_limit=1 and without, returns the number of runs that came back to their start """
+    returns_to_start = 0
+    for seed in seeds:
+        full = run_simulation(initial_state, target, MAX_NUMBER_OF_NODES, 40, simulation=seed, seed=seed, output_folder=folder)
+        trajectory = Trajectory.load(folder + '/simulation-{}.json'.format(seed))
+        revisit = _first_revisit(trajectory)
+        stopped = run_simulation(initial_state, target, MAX_NUMBER_OF_NODES, 40, seed=seed, cycle_limit=1)
+        if revisit is None or (full['Steps'] is not None and full['Steps'] < revisit):
+            assert stopped['verdict'] == full['verdict']
+            continue
+        assert stopped['verdict'] == 'cyclic'
+        assert stopped['time'] == trajectory.times[revisit - 1]
+        returns_to_start += trajectory.state_at(revisit).fingerprint() == initial_state.fingerprint()
+    return returns_to_start
+
+
+def test_cycle_limit_stops_at_the_first_revisit(tmp_path, initial_state, target):
+    _check_cycle_limit(str(tmp_path), initial_state, target, 15, range(10))
+
+
+def test_cycle_limit_counts_the_initial_configuration(tmp_path):
+    # The workload waits for a node in AZ-2; a node added in AZ-1 and then removed brings the start back
+    state = State(
+        AZs=['AZ-1', 'AZ-2'], INITIAL_NODE_ALLCATION_PER_AZ=[1, 0],
+        INITIAL_WORKLOAD_TYPE_PER_AZ=[{'type': 'A', 'AZ': 'AZ-2', 'count': 1}], MAX_NUMBER_OF_NODES=2, rng=0
+    )
+    target = [{'type': 'A', 'AZ': 'AZ-2', 'count': 1}]
+    assert _check_cycle_limit(str(tmp_path), state, target, 2, range(10)) > 0
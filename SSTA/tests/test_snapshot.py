@@ -0,0 +1,58 @@
+import pytest
+
+from SSTA.main import iteration
+from SSTA.snapshot import Trajectory
+
+
+def _configuration(state):
+    nodes = sorted((node.id, node.AZ, node.state) for node in state.nodes)
+    workloads = sorted((w.id, w.type, w.AZ, w.state, w.node) for w in state.workloads)
+    return nodes, workloads, state.time, state.fingerprint()
+
+
+def _record(initial_state, target, n_iterations, checkpoint_interval=None):
+    state = initial_state.copy()
+    state.set_rng(3)
+    trajectory = Trajectory(state, checkpoint_interval=checkpoint_interval)
+    trajectory.record(state)
+    states = [_configuration(state)]
+    for i in range(n_iterations):
+        state, done = iteration(state, target, 15, i)
+        trajectory.commit(state)
+        states += [_configuration(state)]
+    return trajectory, states
+
+
+@pytest.mark.parametrize('checkpoint_interval', [None, 4])
+def test_state_at_replays_every_iteration(initial_state, target, checkpoint_interval):
+    trajectory, states = _record(initial_state, target, 15, checkpoint_interval)
+    assert len(trajectory) == 15
+    for i, expected in enumerate(states):
+        assert _configuration(trajectory.state_at(i)) == expected
+    with pytest.raises(IndexError):
+        trajectory.state_at(16)
+
+
+def test_saved_trajectory_replays_the_same(tmp_path, initial_state, target):
+    trajectory, states = _record(initial_state, target, 15)
+    trajectory.save(str(tmp_path / 'trajectory.json'))
+    loaded = Trajectory.load(str(tmp_path / 'trajectory.json'))
+    for i, expected in enumerate(states):
+        assert _configuration(loaded.state_at(i)) == expected
+
+
+def test_fork_continues_like_the_original(initial_state, target):
+    trajectory, states = _record(initial_state, target, 15)
+    original = initial_state.copy()
+    original.set_rng(3)
+    for i in range(6):
+        original, done = iteration(original, target, 15, i)
+
+    fork = trajectory.fork(6, rng=11)
+    original.set_rng(11)
+    for i in range(6, 20):
+        fork, done = iteration(fork, target, 15, i)
+        original, done = iteration(original, target, 15, i)
+        assert _configuration(fork) == _configuration(original)
+    # Forks are independent of the trajectory they came from
+    assert _configuration(trajectory.state_at(6)) == states[6]
@@ -0,0 +1,110 @@
+from SSTA.main import iteration
+
+
+def assert_indexes_consistent(state):
+    """ Compare every index of state with the same lookups done by scanning its nodes and workloads """
+    nodes, workloads = state.nodes, state.workloads
+    assert sorted(state._nodes_by_id) == sorted(node.id for node in nodes)
+    assert sorted(state._workloads_by_id) == sorted(workload.id for workload in workloads)
+    for node in nodes:
+        assert state._get_nodes(['id'], [node.id]) == [node]
+        expected = sorted(workload.id for workload in workloads if workload.node == node.id)
+        assert sorted(workload.id for workload in state._get_workloads(['node'], [node.id])) == expected
+    for node_state in ('free', 'busy'):
+        for AZ in state.AZs:
+            expected = sorted(node.id for node in nodes if node.state == node_state and node.AZ == AZ)
+            assert sorted(node.id for node in state._get_nodes(['state', 'AZ'], [node_state, AZ])) == expected
+    for workload_type in state.get_workload_types():
+        for AZ in state.AZs:
+            expected = sorted(w.id for w in workloads if w.type == workload_type and w.AZ == AZ and w.state == 'busy')
+            found = state._get_workloads(['type', 'AZ', 'state'], [workload_type, AZ, 'busy'])
+            assert sorted(workload.id for workload in found) == expected
+    expected = sorted(workload.id for workload in workloads if workload.node is None and workload.state == 'pending')
+    assert sorted(workload.id for workload in state.get_non_allocated_workloads()) == expected
+    assert state.max_node_id() == max((node.id for node in nodes), default=0)
+
+
+def test_indexes_follow_every_operation(initial_state, target):
+    state = initial_state
+    assert_indexes_consistent(state)
+
+    state.add_node(AZ='AZ-2')
+    assert_indexes_consistent(state)
+    state.add_workload('B', AZ='AZ-2')
+    assert_indexes_consistent(state)
+    state.update_workload_node_allocation()
+    assert_indexes_consistent(state)
+    state.evict_workload_by_type_and_az('A', 'AZ-1', number=2)
+    assert_indexes_consistent(state)
+    busy = state._get_nodes(['state', 'AZ'], ['busy', 'AZ-3'])[0]
+    state.evict_workload_on_node(busy.id)
+    assert_indexes_consistent(state)
+    state.remove_node_by_id(busy.id)
+    assert_indexes_consistent(state)
+    state.remove_node(number=3)
+    assert_indexes_consistent(state)
+    state.update_workload_node_allocation()
+    assert_indexes_consistent(state)
+
+    for i in range(20):
+        state, done = iteration(state, target, 15, i)
+        assert_indexes_consistent(state)
+
+
+def test_copy_has_independent_indexes(initial_state):
+    copy = initial_state.copy()
+    copy.remove_node(number=2)
+    copy.add_workload('A', AZ='AZ-1')
+    assert_indexes_consistent(copy)
+    assert_indexes_consistent(initial_state)
+    assert initial_state.count_nodes() == 15
+
+
+def assert_counters_consistent(state):
+    """ Compare the (type, AZ) counters of state with counts over its workloads """
+    workloads = state.workloads
+    for workload_type in set(state.get_workload_types()) | {workload.type for workload in workloads}:
+        for AZ in state.AZs:
+            cell = [w for w in workloads if w.type == workload_type and w.AZ == AZ]
+            assert state.count_workloads_type_az(workload_type, AZ) == len(cell)
+            assert state.count_scheduled_workloads_type_az(workload_type, AZ) == sum(w.node is not None for w in cell)
+        assert state.count_workloads_type(workload_type) == sum(w.type == workload_type for w in workloads)
+        assert state.count_scheduled_workloads_type(workload_type) == sum(w.type == workload_type and w.node is not None for w in workloads)
+    for AZ in state.AZs:
+        assert state.count_workloads_az(AZ) == sum(w.AZ == AZ for w in workloads)
+        assert state.count_scheduled_workloads_az(AZ) == sum(w.AZ == AZ and w.node is not None for w in workloads)
+        assert state.count_free_nodes_az(AZ) == sum(node.AZ == AZ and node.state == 'free' for node in state.nodes)
+    allocation = {(cell['type'], cell['AZ']): cell['count'] for cell in state.get_scheduled_type_az_allocation()}
+    assert sum(allocation.values()) == sum(w.node is not None for w in workloads)
+
+
+def test_counters_follow_every_operation(initial_state, target):
+    state = initial_state
+    assert_counters_consistent(state)
+
+    state.add_node(AZ='AZ-1')
+    state.add_workload('A', AZ='AZ-1')
+    assert_counters_consistent(state)
+    state.update_workload_node_allocation()
+    assert_counters_consistent(state)
+    state.evict_workload_by_type_and_az('C', 'AZ-2')
+    assert_counters_consistent(state)
+    state.remove_node(number=4)
+    assert_counters_consistent(state)
+
+    for i in range(20):
+        state, done = iteration(state, target, 15, i)
+        assert_counters_consistent(state)
+
+
+def test_counters_grow_for_new_cells(initial_state):
+    state = initial_state
+    state.add_workload('D', AZ='AZ-3')
+    state.add_node(AZ='AZ-3')
+    state.remove_node(number=1)
+    state.add_node(AZ='AZ-3')
+    state.update_workload_node_allocation()
+    assert 'D' in state.get_workload_types()
+    assert_counters_consistent(state)
+    assert state.count_workloads_type_az('D', 'AZ-3') == 1
+    assert state.count_workloads_type_az('D', 'AZ-1') == 0
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from SSTA.simulation import run_simulations
+from SSTA.streaming import CampaignStatistics, RunningStats, run_until_precise
+from SSTA.trajectory import load_trajectory
+
+
+def test_running_stats_match_numpy():
+    values = np.random.default_rng(0).normal(1e6, 3.0, size=1000)
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.variance == pytest.approx(values.var(ddof=1), rel=1e-9)
+
+    halves = [RunningStats(), RunningStats()]
+    for value in values[:300]:
+        halves[0].add(value)
+    for value in values[300:]:
+        halves[1].add(value)
+    merged = halves[0].merge(halves[1])
+    assert merged.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert merged.variance == pytest.approx(values.var(ddof=1), rel=1e-9)
+
+
+def test_campaign_statistics_match_numpy(initial_state, target):
+    df = run_simulations(initial_state, target, 50, seed=3, n_iterations=30)
+    statistics = CampaignStatistics()
+    for result in df.to_dict('records'):
+        statistics.add({name: None if value != value else value for name, value in result.items()})
+    summary = statistics.summary()
+
+    steps = df['Steps'].dropna().to_numpy(dtype=float)
+    assert summary['simulations'] == 50
+    assert summary['Steps']['mean'] == pytest.approx(steps.mean())
+    assert summary['Steps']['std'] == pytest.approx(steps.std(ddof=1))
+    assert summary['time']['mean'] == pytest.approx(df['time'].mean())
+    assert summary['nodes']['std'] == pytest.approx(df['nodes'].std(ddof=1))
+    assert summary['non_convergence']['mean'] == pytest.approx(1 - len(steps) / 50)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_trajectory_has_every_batch(tmp_path, initial_state, target, workers):
+    path = str(tmp_path / 'campaign.npy')
+    statistics = run_until_precise(
+        initial_state, target, tolerance=0, batch_size=10, min_sims=30, max_sims=30, workers=workers, seed=4,
+        n_iterations=30, trajectory_path=path
+    )
+    assert statistics.count == 30
+
+    reference = str(tmp_path / 'reference.npy')
+    run_simulations(initial_state, target, 30, seed=4, n_iterations=30, trajectory_path=reference)
+    assert np.array_equal(load_trajectory(path), load_trajectory(reference))
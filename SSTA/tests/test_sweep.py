@@ -0,0 +1,45 @@
+from SSTA import sweep
+from SSTA.sweep import grid, iter_sweep, load_results, scenario_key
+
+
+BASE = {
+    'AZs': ['AZ-1', 'AZ-2'], 'INITIAL_NODE_ALLCATION_PER_AZ': [3, 3],
+    'INITIAL_WORKLOAD_TYPE_PER_AZ': [{'type': 'A', 'AZ': 'AZ-1', 'count': 2}, {'type': 'A', 'AZ': 'AZ-2', 'count': 2}],
+    'TARGET_WORKLOAD_NODE_ALLOCATION': [{'type': 'A', 'AZ': 'AZ-1', 'count': 3}, {'type': 'A', 'AZ': 'AZ-2', 'count': 1}],
+    'MAX_NUMBER_OF_NODES': 8, 'n_sims': 3, 'n_iterations': 20
+}
+
+
+def _run(scenarios, cache, **options):
+    return list(iter_sweep(scenarios, seed=0, cache=str(cache), workers=1, **options))
+
+
+def test_cached_scenarios_are_not_recomputed(tmp_path):
+    scenarios = grid(BASE, MAX_NUMBER_OF_NODES=[8, 10])
+    first = _run(scenarios, tmp_path)
+    assert [row['cached'] for row in first] == [False, False]
+
+    second = _run(scenarios, tmp_path)
+    assert [row['cached'] for row in second] == [True, True]
+    assert second == [dict(row, cached=True) for row in first]
+    assert len(load_results(first[0]['key'], cache=str(tmp_path))) == BASE['n_sims']
+
+    # Extending the sweep only runs the new scenario
+    extended = _run(grid(BASE, MAX_NUMBER_OF_NODES=[8, 10, 12]), tmp_path)
+    assert [row['cached'] for row in extended] == [True, True, False]
+
+    assert [row['cached'] for row in _run(scenarios, tmp_path, recompute=True)] == [False, False]
+
+
+def test_defaults_share_the_key():
+    assert scenario_key(BASE, 0) == scenario_key(dict(BASE, policy='random', cycle_limit=None), 0)
+
+
+def test_key_changes_invalidate_the_cache(tmp_path, monkeypatch):
+    _run([BASE], tmp_path)
+    assert _run([dict(BASE, times={'add_node_time': 300})], tmp_path)[0]['cached'] is False
+    assert list(iter_sweep([BASE], seed=1, cache=str(tmp_path), workers=1))[0]['cached'] is False
+
+    # Results of another version of the sources are not reused
+    monkeypatch.setattr(sweep, '_code_version', 'other-version')
+    assert _run([BASE], tmp_path)[0]['cached'] is False
@@ -0,0 +1,21 @@
+import json
+
+from SSTA import tracing
+from SSTA.simulation import run_simulations
+
+
+def _events(path, initial_state, target, workers):
+    tracing.configure('summary', events=str(path))
+    try:
+        run_simulations(initial_state, target, 20, workers=workers, seed=1, n_iterations=50)
+    finally:
+        tracing.shutdown()
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_events_of_worker_processes_are_written(tmp_path, initial_state, target):
+    sequential = _events(tmp_path / 'sequential.jsonl', initial_state, target, workers=1)
+    parallel = _events(tmp_path / 'parallel.jsonl', initial_state, target, workers=2)
+    assert len(sequential) > 0
+    assert len(parallel) == len(sequential)
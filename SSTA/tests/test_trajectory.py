@@ -0,0 +1,26 @@
+import numpy as np
+
+from SSTA.simulation import run_simulations
+from SSTA.trajectory import load_trajectory
+
+
+def test_trajectory_file_does_not_depend_on_workers(tmp_path, initial_state, target):
+    paths = {}
+    for workers in (1, 4):
+        paths[workers] = str(tmp_path / 'trajectory-{}.npy'.format(workers))
+        run_simulations(initial_state, target, 40, workers=workers, seed=5, n_iterations=50, chunksize=3, trajectory_path=paths[workers])
+    sequential, parallel = load_trajectory(paths[1]), load_trajectory(paths[4])
+    assert len(sequential) > 0
+    assert np.array_equal(sequential, parallel)
+    order = np.lexsort((sequential['iteration'], sequential['simulation']))
+    assert np.array_equal(order, np.arange(len(sequential)))
+
+
+def test_fractional_times_are_recorded(tmp_path, initial_state, target):
+    initial_state.set_times(add_node_time=300.5, evict_workload_time=0.25)
+    path = str(tmp_path / 'trajectory.npy')
+    df = run_simulations(initial_state, target, 5, seed=1, n_iterations=50, trajectory_path=path)
+    trajectory = load_trajectory(path)
+    last = np.r_[trajectory['simulation'][1:] != trajectory['simulation'][:-1], True]
+    assert trajectory['time'][last].tolist() == df['time'].tolist()
+    assert any(time != int(time) for time in df['time'])
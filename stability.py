@@ -1,32 +1,12 @@
-import copy
-import errno
 import json
-import matplotlib.pyplot as plt
 import os
-import pandas as pd
-import seaborn as sns
-import shutil
 
-from tqdm import tqdm
-
-from SSTA.components import State
-from SSTA import iteration
-
-def rm_dir_p(dir):
-    try:
-        shutil.rmtree(dir)
-    except FileNotFoundError:
-        print("Folder does not exist")
-
-def mkdir_p(path):
-    try:
-        os.makedirs(path)
-    except OSError as exc:  # Python ≥ 2.5
-        if exc.errno == errno.EEXIST and os.path.isdir(path):
-            pass
-        # possibly handle other errno cases here, otherwise finally:
-        else:
-            raise
+from SSTA import tracing
+from SSTA.components import ArrayState, State
+from SSTA.markov import MarkovChain
+from SSTA.simulation import run_simulations
+from SSTA.streaming import run_until_precise
+from SSTA.trajectory import load_trajectory
 
 # Initialization
 AZs = ['AZ-1', 'AZ-2', 'AZ-3']
@@ -59,52 +39,73 @@ TARGET_WORKLOAD_NODE_ALLOCATION = [
 
 N_monte_carlo = 100
 N_simulations = 10
+WORKERS = os.cpu_count()
+SEED = 42
+TRACING = 'off'
+# Stop a simulation as 'cyclic' once it revisits a configuration this often, None runs all N_monte_carlo iterations
+CYCLE_LIMIT = None
+# Solve the aggregate Markov chain exactly instead of sampling N_simulations runs
+EXACT = False
+# Run simulations until the 95% confidence interval of the mean steps is narrower than TOLERANCE, None runs N_simulations
+TOLERANCE = None
+# Scheduling policy, a name of SSTA.scheduling.POLICIES
+POLICY = 'random'
+# Simulate on the struct-of-arrays layout (ArrayState), random policy only
+ARRAY_STATE = False
 
 if __name__ == '__main__':
     main_folder = './simulations'
-    results = []
+    os.makedirs(main_folder, exist_ok=True)
+    tracing.configure(TRACING, events=main_folder + '/events.jsonl' if TRACING != 'off' else None)
     initial_state = State(
         AZs=AZs,
         INITIAL_NODE_ALLCATION_PER_AZ=INITIAL_NODE_ALLCATION_PER_AZ,
         INITIAL_WORKLOAD_TYPE_PER_AZ=INITIAL_WORKLOAD_TYPE_PER_AZ,
-        MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES
+        MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES,
+        rng=SEED
     )
+    initial_state.set_policy(POLICY)
+
+    if EXACT:
+        chain = MarkovChain.from_state(initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, MAX_NUMBER_OF_NODES)
+        with open(main_folder + '/markov.json', 'w') as f:
+            json.dump({'solution': chain.solve(), 'distribution': chain.distribution(N_monte_carlo)}, f, indent=2)
+        raise SystemExit
+
+    if ARRAY_STATE:
+        initial_state = ArrayState.from_state(initial_state)
+
+    if TOLERANCE is not None:
+        statistics = run_until_precise(
+            initial_state, TARGET_WORKLOAD_NODE_ALLOCATION, metric='Steps', tolerance=TOLERANCE, workers=WORKERS, seed=SEED,
+            MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES, n_iterations=N_monte_carlo, cycle_limit=CYCLE_LIMIT
+        )
+        with open(main_folder + '/statistics.json', 'w') as f:
+            json.dump(statistics.summary(), f, indent=2)
+        raise SystemExit
+
+    df = run_simulations(
+        initial_state=initial_state,
+        target=TARGET_WORKLOAD_NODE_ALLOCATION,
+        n_sims=N_simulations,
+        workers=WORKERS,
+        seed=SEED,
+        MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES,
+        n_iterations=N_monte_carlo,
+        trajectory_path=main_folder + '/trajectory.npy',
+        cycle_limit=CYCLE_LIMIT
+    )
+    df.to_csv('results.csv')
 
+    trajectory = load_trajectory(main_folder + '/trajectory.npy')
+    steps = trajectory['iteration'][trajectory['done']]
 
-    rm_dir_p(main_folder)
-
-
-    for j in tqdm(range(N_simulations)):
-        finish = False
-        mkdir_p(main_folder + '/simulation-{}'.format(j))
-        for i in range(N_monte_carlo):
-            if i == 0:
-                state = copy.deepcopy(initial_state)
-
-            state, done = iteration(
-                state=state,
-                TARGET_WORKLOAD_NODE_ALLOCATION=TARGET_WORKLOAD_NODE_ALLOCATION,
-                MAX_NUMBER_OF_NODES=MAX_NUMBER_OF_NODES,
-                iteration_number=i
-            )
-
-            with open('./simulations/simulation-{}/iteration-{}.json'.format(j, i), 'w') as f:
-                json.dump(initial_state.toJSON(), f)
-
-            if done:
-                results += [{'iteration': j, 'Steps': i, 'nodes': state.count_nodes(), 'time': state.time}]
-                finish = True
-                break
-
-        if not finish:
-            results += [{'iteration': j, 'Steps': None, 'nodes': state.count_nodes(), 'time': state.time}]
-
-    df = pd.DataFrame(results)
-    df.to_csv('results.csv')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     sns.set(color_codes=True)
     sns.set(style="white", palette="muted")
-    sns.distplot(df['Steps'], bins=N_monte_carlo, hist_kws={'range': (0, min(N_monte_carlo, max(df['Steps'])*1.1))})
+    sns.distplot(steps, bins=N_monte_carlo, hist_kws={'range': (0, min(N_monte_carlo, max(steps)*1.1))})
 
     plt.xlim(0, 10)
     plt.savefig("./hisogram_required_steps.png")